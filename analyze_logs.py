@@ -1,27 +1,28 @@
 # Mini tool di debug (eseguibile localmente) per parsare log SSE salvati su file
-import json, sys
+# (es. `curl -N .../identify_stream?token=... > sse_dump.txt`)
+import sys
+
+from utils.sse import parse_sse
 
 def main(path):
     with open(path, "r", encoding="utf-8") as f:
         buf = f.read()
-    chunks = [c.strip() for c in buf.split("\n\n") if c.strip()]
-    for c in chunks:
-        lines = c.splitlines()
-        event = ""
-        data = ""
-        for ln in lines:
-            if ln.startswith("event: "):
-                event = ln[len("event: "):].strip()
-            elif ln.startswith("data: "):
-                data = ln[len("data: "):].strip()
-        try:
-            obj = json.loads(data)
-        except Exception:
-            obj = data
-        print(f"[{event}] {obj}")
+    last_id = None
+    for item in parse_sse(buf):
+        if item["event"] is None:
+            if item["retry"] is not None:
+                print(f"[retry] {item['retry']} ms")
+            continue
+        if item["id"] is not None:
+            last_id = item["id"]
+        prefix = f"#{item['id']} " if item["id"] is not None else ""
+        print(f"{prefix}[{item['event']}] {item['data']}")
+    if last_id is not None:
+        # per riprendere lo stream: header Last-Event-ID (o ?last_event_id=)
+        print(f"Last-Event-ID: {last_id}")
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python tests/analyze_logs.py sse_dump.txt")
+        print("Usage: python analyze_logs.py sse_dump.txt")
         sys.exit(1)
-    main(sys.argv[1])
\ No newline at end of file
+    main(sys.argv[1])
@@ -1,8 +1,52 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+# ⏱️ Primo import: con STARTUP_PROFILE_IMPORTS=1 cronometra tutti gli import successivi
+from utils.startup import STARTUP
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers.main_router import router as main_router
+with STARTUP.step("routers.main_router", kind="import"):
+    from routers.main_router import router as main_router, UPLOAD_MAX_BYTES, UPLOAD_MULTIPART_OVERHEAD
+from pipelines.registry import PIPELINES
+from utils.http_client import get_http_client
+from utils.executor import CPU_EXECUTOR
+from utils.upload_store import cleanup_loop
+from utils.result_cache import prune_loop
+from utils.lyrics_index import get_lyrics_index
+from utils.upload_limit import UploadLimitMiddleware
 
-app = FastAPI(title="SingSync Backend")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 🔌 Pool HTTP condiviso (Genius, ACRCloud, OpenAI)
+    http = get_http_client()
+    with STARTUP.step("http_client"):
+        await http.start()
+    # ⚙️ Pool CPU: in mode "process" ogni worker precarica i propri modelli
+    with STARTUP.step("cpu_executor"):
+        CPU_EXECUTOR.start()
+    # 🧩 Solo le pipeline abilitate vengono importate; init() prepara client/modelli
+    #    (i modelli CREPE/OpenL3 si caricano in background: l'app è subito raggiungibile)
+    await PIPELINES.init_enabled()
+    # 📚 Indice lyrics locale aperto (mmap) una volta per processo
+    with STARTUP.step("lyrics_index"):
+        get_lyrics_index()
+    # 🧹 Eviction periodica degli upload (TTL + budget byte)
+    cleanup_task = asyncio.create_task(cleanup_loop())
+    # 🗑️ Risultati scaduti eliminati dal backend SQLite della cache (non a ogni scrittura)
+    prune_task = asyncio.create_task(prune_loop())
+    STARTUP.mark_ready()
+    print(f"✅ Avvio completato in {STARTUP.ready_ms} ms")
+    try:
+        yield
+    finally:
+        cleanup_task.cancel()
+        prune_task.cancel()
+        CPU_EXECUTOR.shutdown()
+        await http.close()
+
+
+app = FastAPI(title="SingSync Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,11 +56,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 📏 Limite del body degli upload applicato prima del parsing multipart (413 immediato)
+app.add_middleware(
+    UploadLimitMiddleware,
+    max_bytes=UPLOAD_MAX_BYTES + UPLOAD_MULTIPART_OVERHEAD if UPLOAD_MAX_BYTES else 0,
+    paths=("/upload_audio",),
+)
+
 app.include_router(main_router)
 
 @app.get("/health")
 async def health():
-    import os
     env = {
         "ENABLE_ACRCLOUD": os.getenv("ENABLE_ACRCLOUD"),
         "ENABLE_WHISPER_GENIUS": os.getenv("ENABLE_WHISPER_GENIUS"),
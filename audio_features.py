@@ -1,6 +1,171 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
 import numpy as np
 import librosa
 
+from utils.metrics import span
+
+SR = 16000
+N_FFT = 1024
+HOP = 256   # condiviso con il fingerprint (utils/fingerprint.py)
+
+FEATURE_CACHE_MAX_ITEMS = int(os.getenv("FEATURE_CACHE_MAX_ITEMS", "32"))
+# Budget in byte della LRU (waveform + |STFT| + chroma per bundle: ~60 MB per 5 minuti di audio)
+FEATURE_CACHE_MAX_BYTES = int(os.getenv("FEATURE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+@dataclass
+class FeatureBundle:
+    """
+    Feature calcolate con una sola decodifica e una sola STFT/CQT.
+    `y` (float32, 16k mono, normalizzato) è condiviso senza copie con CREPE/OpenL3,
+    `S` (|STFT|) con il fingerprint landmark.
+    """
+    y: np.ndarray
+    sr: int
+    S: np.ndarray
+    rms_frames: np.ndarray
+    chroma: np.ndarray
+    tempo_bpm: float
+
+    @property
+    def duration_sec(self) -> float:
+        return float(len(self.y) / self.sr)
+
+    @property
+    def nbytes(self) -> int:
+        return self.y.nbytes + self.S.nbytes + self.rms_frames.nbytes + self.chroma.nbytes
+
+    @property
+    def rms(self) -> float:
+        return float(self.rms_frames.mean()) if self.rms_frames.size else 0.0
+
+    @property
+    def chroma_mean(self) -> list:
+        return self.chroma.mean(axis=1).tolist() if self.chroma.size else [0.0] * 12
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "sr": self.sr,
+            "duration_sec": self.duration_sec,
+            "rms": self.rms,
+            "tempo_bpm": self.tempo_bpm,
+            "chroma_mean": self.chroma_mean,
+        }
+
+
+def normalize(y: np.ndarray) -> np.ndarray:
+    """Normalizzazione di picco, in float32."""
+    return librosa.util.normalize(y).astype(np.float32, copy=False)
+
+
+def load_audio(file_path: str) -> Tuple[np.ndarray, int]:
+    """
+    Unica decodifica: 16k mono float32 normalizzato. Riusa il PCM già decodificato
+    per la richiesta (utils/audio.get_pcm, stesso processo); altrimenti librosa.load.
+    """
+    from utils.audio import peek_pcm, pcm_to_float32
+
+    pcm = peek_pcm(file_path)
+    if pcm is not None:
+        return normalize(pcm_to_float32(pcm)), SR
+    with span("audio_load"):
+        y, sr = librosa.load(file_path, sr=SR, mono=True)
+    return normalize(y), sr
+
+
+def features_from_pcm(pcm: np.ndarray, sr: int = SR) -> FeatureBundle:
+    """FeatureBundle da PCM int16 già decodificato in memoria (es. utils/audio.decode_pcm_16k_mono)."""
+    from utils.audio import pcm_to_float32
+    return compute_features(normalize(pcm_to_float32(pcm)), sr)
+
+
+def energy_profile(y: np.ndarray, sr: int = SR) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Profilo leggero per frame (stessa STFT del bundle, senza CQT/beat):
+    RMS e quota di energia nella banda vocale 300–3400 Hz.
+    """
+    if y.size < N_FFT:
+        y = np.pad(y, (0, N_FFT - y.size))
+    S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP))
+    rms_frames = librosa.feature.rms(S=S, frame_length=N_FFT, hop_length=HOP)[0]
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=N_FFT)
+    power = S ** 2
+    band = (freqs >= 300) & (freqs <= 3400)
+    vocal_ratio = power[band].sum(axis=0) / (power.sum(axis=0) + 1e-10)
+    return rms_frames, vocal_ratio
+
+
+def compute_features(y: np.ndarray, sr: int = SR) -> FeatureBundle:
+    """
+    Calcola tutte le feature riusando gli stessi buffer:
+    - |STFT| → RMS e mel (→ onset envelope → tempo)
+    - CQT → chroma
+    """
+    if y.size < N_FFT:
+        y = np.pad(y, (0, N_FFT - y.size))
+
+    with span("features"):
+        S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP))
+        rms_frames = librosa.feature.rms(S=S, frame_length=N_FFT, hop_length=HOP)[0]
+
+        mel = librosa.feature.melspectrogram(S=S ** 2, sr=sr, n_fft=N_FFT, hop_length=HOP)
+        onset_env = librosa.onset.onset_strength(S=librosa.power_to_db(mel), sr=sr, hop_length=HOP)
+        tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=HOP)
+
+        C = np.abs(librosa.cqt(y, sr=sr, hop_length=HOP))
+        chroma = librosa.feature.chroma_cqt(C=C, sr=sr, hop_length=HOP)
+
+    return FeatureBundle(
+        y=y,
+        sr=sr,
+        S=S,
+        rms_frames=rms_frames,
+        chroma=chroma,
+        tempo_bpm=float(np.atleast_1d(tempo)[0]),
+    )
+
+
+_BUNDLES: "OrderedDict[tuple, FeatureBundle]" = OrderedDict()
+_BUNDLES_LOCK = threading.Lock()
+_BUNDLES_BYTES = 0
+
+
+def get_features(file_path: str) -> FeatureBundle:
+    """
+    FeatureBundle di un file, in cache LRU per (path, mtime, size), limitata a
+    FEATURE_CACHE_MAX_ITEMS bundle e FEATURE_CACHE_MAX_BYTES (un bundle più
+    grande del budget non viene tenuto in cache).
+    """
+    global _BUNDLES_BYTES
+    st = os.stat(file_path)
+    key = (file_path, st.st_mtime_ns, st.st_size)
+    with _BUNDLES_LOCK:
+        if key in _BUNDLES:
+            _BUNDLES.move_to_end(key)
+            return _BUNDLES[key]
+
+    bundle = compute_features(*load_audio(file_path))
+
+    size = bundle.nbytes
+    if size > FEATURE_CACHE_MAX_BYTES:
+        return bundle
+    with _BUNDLES_LOCK:
+        old = _BUNDLES.pop(key, None)
+        if old is not None:
+            _BUNDLES_BYTES -= old.nbytes
+        _BUNDLES[key] = bundle
+        _BUNDLES_BYTES += size
+        while len(_BUNDLES) > FEATURE_CACHE_MAX_ITEMS or _BUNDLES_BYTES > FEATURE_CACHE_MAX_BYTES:
+            _, evicted = _BUNDLES.popitem(last=False)
+            _BUNDLES_BYTES -= evicted.nbytes
+    return bundle
+
+
 def extract_features(file_path: str):
     """
     Estrazione feature leggere CPU-only:
@@ -9,18 +174,4 @@ def extract_features(file_path: str):
     - Chroma CQT
     - Beat tempo
     """
-    y, sr = librosa.load(file_path, sr=16000, mono=True)
-    y = librosa.util.normalize(y)
-
-    rms = librosa.feature.rms(y=y).mean().item()
-    tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-    chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-    chroma_mean = chroma.mean(axis=1).tolist()
-
-    return {
-        "sr": sr,
-        "duration_sec": float(len(y) / sr),
-        "rms": float(rms),
-        "tempo_bpm": float(tempo),
-        "chroma_mean": chroma_mean,
-    }
\ No newline at end of file
+    return get_features(file_path).to_dict()
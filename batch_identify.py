@@ -0,0 +1,33 @@
+# Identificazione offline di molti file (cartella o manifest) senza passare dall'API:
+# una riga JSONL per file nell'output; rilanciando sullo stesso output si riprende
+# (--retry-failed: ritenta anche i file con una riga non riuscita).
+import sys
+import json
+import asyncio
+from utils.batch import BatchJob
+from utils.executor import CPU_EXECUTOR
+from utils.http_client import get_http_client
+
+async def main(source, output, retry_failed=False):
+    http = get_http_client()
+    await http.start()
+    CPU_EXECUTOR.start()
+    job = BatchJob(source, output, retry_failed=retry_failed)
+    runner = asyncio.create_task(job.run())
+    try:
+        while not runner.done():
+            await asyncio.wait({runner}, timeout=10)
+            s = job.snapshot()
+            print(f"⏳ {s['done'] + s['failed'] + s['skipped']}/{s['total']} ({s['failed']} errori, {s['files_per_sec']} file/s)")
+    finally:
+        CPU_EXECUTOR.shutdown()
+        await http.close()
+    print(json.dumps(job.snapshot(), ensure_ascii=False))
+    return 0 if job.status == "done" else 1
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if a != "--retry-failed"]
+    if len(args) < 2:
+        print("Usage: python batch_identify.py [--retry-failed] <cartella|manifest.jsonl> <output.jsonl>")
+        sys.exit(1)
+    sys.exit(asyncio.run(main(args[0], args[1], "--retry-failed" in sys.argv)))
@@ -0,0 +1,152 @@
+# Server HTTP locali che imitano ACRCloud, OpenAI (trascrizione) e Genius
+# per i benchmark offline: latenza e tasso di errore configurabili per upstream.
+import asyncio
+import random
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from aiohttp import web
+
+# Catalogo fittizio condiviso dai tre upstream (stessi brani → la fusione concorda)
+CATALOG = [
+    ("Bohemian Rhapsody", "Queen", "is this the real life is this just fantasy caught in a landslide no escape from reality"),
+    ("Imagine", "John Lennon", "imagine there's no heaven it's easy if you try no hell below us above us only sky"),
+    ("Volare", "Domenico Modugno", "penso che un sogno così non ritorni mai più mi dipingevo le mani e la faccia di blu"),
+    ("Hey Jude", "The Beatles", "hey jude don't make it bad take a sad song and make it better"),
+    ("Yesterday", "The Beatles", "yesterday all my troubles seemed so far away now it looks as though they're here to stay"),
+]
+
+
+@dataclass
+class UpstreamProfile:
+    """Comportamento di un upstream simulato."""
+    latency_ms: float = 300.0
+    jitter_ms: float = 100.0
+    failure_rate: float = 0.0   # quota di risposte HTTP 503
+    miss_rate: float = 0.0      # quota di risposte "nessun risultato"
+
+    @classmethod
+    def parse(cls, spec: str) -> "UpstreamProfile":
+        """Da stringa CLI "latency_ms[:jitter_ms[:failure_rate[:miss_rate]]]", es. "800:200:0.05"."""
+        parts = [float(p) for p in spec.split(":") if p]
+        return cls(*parts)
+
+
+class MockUpstreams:
+    """
+    Un unico server aiohttp con le rotte dei tre upstream:
+      - POST /v1/identify                 (ACRCloud, ACRCLOUD_HOST)
+      - POST /v1/audio/transcriptions     (OpenAI, OPENAI_BASE_URL=.../v1)
+      - GET  /search                      (Genius, GENIUS_API_URL)
+    """
+
+    def __init__(self, profiles: Optional[Dict[str, UpstreamProfile]] = None, seed: int = 0):
+        self.profiles = {
+            "acrcloud": UpstreamProfile(),
+            "openai": UpstreamProfile(latency_ms=1200, jitter_ms=300),
+            "genius": UpstreamProfile(latency_ms=150, jitter_ms=50),
+            **(profiles or {}),
+        }
+        self.rng = random.Random(seed)
+        self.calls = {name: 0 for name in self.profiles}
+        self.failures = {name: 0 for name in self.profiles}
+        self._runner: Optional[web.AppRunner] = None
+        self.port = 0
+
+    async def _behave(self, name: str) -> Optional[web.Response]:
+        """Applica latenza e guasti simulati; ritorna la risposta d'errore se il tentativo fallisce."""
+        p = self.profiles[name]
+        self.calls[name] += 1
+        await asyncio.sleep(max(0.0, p.latency_ms + self.rng.uniform(-p.jitter_ms, p.jitter_ms)) / 1000)
+        if self.rng.random() < p.failure_rate:
+            self.failures[name] += 1
+            return web.json_response({"error": "simulated_failure"}, status=503)
+        return None
+
+    def _song(self):
+        return self.rng.choice(CATALOG)
+
+    async def acr_identify(self, request: web.Request) -> web.Response:
+        await request.read()
+        failed = await self._behave("acrcloud")
+        if failed is not None:
+            return failed
+        if self.rng.random() < self.profiles["acrcloud"].miss_rate:
+            return web.json_response({"status": {"code": 1001, "msg": "No result"}})
+        title, artist, _ = self._song()
+        return web.json_response({
+            "status": {"code": 0, "msg": "Success"},
+            "metadata": {"music": [{
+                "title": title,
+                "artists": [{"name": artist}],
+                "album": {"name": f"{title} (Single)"},
+                "release_date": "1975-10-31",
+                "score": self.rng.randint(70, 100),
+            }]},
+        })
+
+    async def openai_transcribe(self, request: web.Request) -> web.Response:
+        await request.read()
+        failed = await self._behave("openai")
+        if failed is not None:
+            return failed
+        if self.rng.random() < self.profiles["openai"].miss_rate:
+            return web.json_response({"text": ""})
+        _, _, lyrics = self._song()
+        words = lyrics.split()
+        start = self.rng.randint(0, max(0, len(words) - 8))
+        return web.json_response({"text": " ".join(words[start:start + 10])})
+
+    async def genius_search(self, request: web.Request) -> web.Response:
+        failed = await self._behave("genius")
+        if failed is not None:
+            return failed
+        q = set(request.query.get("q", "").lower().split())
+        ranked = sorted(
+            CATALOG,
+            key=lambda s: len(q & set(f"{s[0]} {s[1]} {s[2]}".lower().split())),
+            reverse=True,
+        )
+        hits = [
+            {"result": {
+                "title": title,
+                "full_title": f"{title} by {artist}",
+                "primary_artist": {"name": artist},
+                "url": f"https://genius.com/{artist.replace(' ', '-')}-{title.replace(' ', '-')}-lyrics",
+            }}
+            for title, artist, _ in ranked[:5]
+        ]
+        return web.json_response({"meta": {"status": 200}, "response": {"hits": hits}})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/identify", self.acr_identify)
+        app.router.add_post("/v1/audio/transcriptions", self.openai_transcribe)
+        app.router.add_get("/search", self.genius_search)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return f"http://{host}:{self.port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def env(self, host: str = "127.0.0.1") -> Dict[str, str]:
+        """Variabili d'ambiente che puntano il backend verso i mock."""
+        return {
+            "ACRCLOUD_HOST": f"{host}:{self.port}",
+            "ACRCLOUD_SCHEME": "http",
+            "ACRCLOUD_ACCESS_KEY": "bench",
+            "ACRCLOUD_ACCESS_SECRET": "bench",
+            "OPENAI_API_KEY": "sk-bench",
+            "OPENAI_BASE_URL": f"http://{host}:{self.port}/v1",
+            "GENIUS_API_TOKEN": "bench",
+            "GENIUS_API_URL": f"http://{host}:{self.port}/search",
+        }
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {name: {"calls": self.calls[name], "failures": self.failures[name]} for name in self.profiles}
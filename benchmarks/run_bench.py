@@ -0,0 +1,350 @@
+# Benchmark offline riproducibile del backend:
+#   - avvia i mock di ACRCloud / OpenAI / Genius (benchmarks/mock_upstreams.py)
+#   - avvia l'app FastAPI con uvicorn puntata sui mock
+#   - genera clip sintetiche (benchmarks/synth_audio.py) e le carica
+#   - carico concorrente su /identify_all, /identify_stream, /identify_text
+#     → req/s, p50/p95/p99 e ripartizione per fase (span di trace=true)
+#   - micro-benchmark di extract_features, ensure_wav_16k_mono, gate, run_custom
+#   - salva/confronta baseline JSON (exit code 1 se regressione)
+#
+# Esempi:
+#   python -m benchmarks.run_bench --requests 40 --concurrency 8 --save benchmarks/baselines/local.json
+#   python -m benchmarks.run_bench --baseline benchmarks/baselines/local.json --tolerance 0.25
+#   python -m benchmarks.run_bench --skip-load --micro-repeat 10
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.mock_upstreams import MockUpstreams, UpstreamProfile, CATALOG
+from benchmarks.synth_audio import generate_corpus
+
+ENDPOINTS = ("identify_all", "identify_stream", "identify_text")
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = (len(s) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def summarize(latencies_ms: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(latencies_ms, 0.50), 1),
+        "p95_ms": round(percentile(latencies_ms, 0.95), 1),
+        "p99_ms": round(percentile(latencies_ms, 0.99), 1),
+        "max_ms": round(max(latencies_ms), 1) if latencies_ms else 0.0,
+    }
+
+
+# =====================================================
+# 🔹 Server sotto test
+# =====================================================
+def _free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def start_backend(env: Dict[str, str], port: int, timeout: float = 60) -> subprocess.Popen:
+    """uvicorn in un processo separato (la config è letta da env all'import dei moduli)."""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **env},
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn terminato (exit {proc.returncode})")
+            try:
+                if (await client.get(f"http://127.0.0.1:{port}/health")).status_code == 200:
+                    return proc
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("backend non raggiungibile entro il timeout")
+
+
+# =====================================================
+# 🔹 Carico
+# =====================================================
+def _stage_ms(trace: Optional[Dict[str, Any]], stages: Dict[str, List[float]]):
+    for sp in (trace or {}).get("spans", []):
+        stages.setdefault(sp["stage"], []).append(sp["duration_ms"])
+
+
+async def _one_all(client, base, token, stages) -> bool:
+    r = await client.get(f"{base}/identify_all", params={"token": token, "trace": "true"})
+    if r.status_code != 200:
+        return False
+    _stage_ms(r.json().get("trace"), stages)
+    return True
+
+
+async def _one_stream(client, base, token, stages, first_event_ms: List[float]) -> bool:
+    t0 = time.perf_counter()
+    event, first = "", True
+    async with client.stream("GET", f"{base}/identify_stream", params={"token": token, "trace": "true"}) as r:
+        if r.status_code != 200:
+            return False
+        async for line in r.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:].strip()
+            elif line.startswith("data: "):
+                if event == "message" and first:
+                    # tempo al primo risultato: la latenza percepita dal client
+                    first_event_ms.append((time.perf_counter() - t0) * 1000)
+                    first = False
+                if event == "done":
+                    _stage_ms(json.loads(line[6:]).get("trace"), stages)
+                    return True
+    return False
+
+
+async def _one_text(client, base, rng: random.Random, stages) -> bool:
+    _, _, lyrics = rng.choice(CATALOG)
+    words = lyrics.split()
+    start = rng.randint(0, max(0, len(words) - 6))
+    r = await client.get(f"{base}/identify_text", params={"query": " ".join(words[start:start + 6])})
+    return r.status_code == 200
+
+
+async def run_load(base: str, tokens: List[str], endpoint: str, requests: int, concurrency: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    first_event_ms: List[float] = []
+    errors = 0
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        async def one(i: int):
+            nonlocal errors
+            async with sem:
+                token = tokens[i % len(tokens)]
+                t0 = time.perf_counter()
+                try:
+                    if endpoint == "identify_all":
+                        ok = await _one_all(client, base, token, stages)
+                    elif endpoint == "identify_stream":
+                        ok = await _one_stream(client, base, token, stages, first_event_ms)
+                    else:
+                        ok = await _one_text(client, base, rng, stages)
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append((time.perf_counter() - t0) * 1000)
+                if not ok:
+                    errors += 1
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - t_start
+
+    out = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "rps": round(requests / wall, 2) if wall else 0.0,
+        **summarize(latencies),
+        "stages": {s: summarize(v) for s, v in sorted(stages.items())},
+    }
+    if first_event_ms:
+        out["first_event"] = summarize(first_event_ms)
+    return out
+
+
+async def upload_corpus(base: str, paths: List[str]) -> List[str]:
+    tokens = []
+    async with httpx.AsyncClient(timeout=120) as client:
+        for path in paths:
+            with open(path, "rb") as f:
+                r = await client.post(f"{base}/upload_audio", files={"file": (os.path.basename(path), f)})
+            r.raise_for_status()
+            tokens.append(r.json()["token"])
+    return tokens
+
+
+async def bench_load(args, paths: List[str]) -> Dict[str, Any]:
+    mocks = MockUpstreams(
+        {
+            "acrcloud": UpstreamProfile.parse(args.acr),
+            "openai": UpstreamProfile.parse(args.openai),
+            "genius": UpstreamProfile.parse(args.genius),
+        },
+        seed=args.seed,
+    )
+    await mocks.start()
+    port = _free_port()
+    env = {
+        **mocks.env(),
+        "UPLOAD_DIR": tempfile.mkdtemp(prefix="singsync_bench_up_"),
+        # misura le pipeline, non le cache
+        "RESULT_CACHE_ENABLED": "0",
+        "GENIUS_CACHE_TTL_SEC": "0",
+        "LYRICS_LEARN": "0",
+        "LYRICS_INDEX_PATH": "",
+    }
+    proc = await start_backend(env, port)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        tokens = await upload_corpus(base, paths)
+        results = {}
+        for endpoint in args.endpoints.split(","):
+            print(f"⏱️  {endpoint}: {args.requests} richieste, concorrenza {args.concurrency}")
+            results[endpoint] = await run_load(base, tokens, endpoint, args.requests, args.concurrency, args.seed)
+        results["upstreams"] = mocks.snapshot()
+        return results
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        await mocks.stop()
+
+
+# =====================================================
+# 🔹 Micro-benchmark (in processo)
+# =====================================================
+def _timeit(fn, repeat: int) -> Dict[str, float]:
+    fn()  # warm-up (import lazy, modelli)
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return summarize(samples)
+
+
+def bench_micro(paths: List[str], repeat: int) -> Dict[str, Any]:
+    import audio_features
+    from fastapi import UploadFile
+    from utils.audio import ensure_wav_16k_mono
+
+    wav = next(p for p in paths if p.endswith(".wav"))
+    compressed = next((p for p in paths if not p.endswith(".wav")), wav)
+    out: Dict[str, Any] = {}
+
+    def features():
+        audio_features._BUNDLES.clear()   # niente cache LRU: si misura il calcolo
+        audio_features.extract_features(wav)
+    out["extract_features"] = _timeit(features, repeat)
+
+    def decode():
+        with open(compressed, "rb") as f:
+            path = asyncio.run(ensure_wav_16k_mono(UploadFile(file=f, filename=os.path.basename(compressed))))
+        os.remove(path)
+    out["ensure_wav_16k_mono"] = _timeit(decode, repeat)
+
+    from utils.gate import classify_pcm
+    from benchmarks.synth_audio import synth_pcm
+    pcm = synth_pcm(20.0)
+    out["gate_classify"] = _timeit(lambda: classify_pcm(pcm), repeat)
+
+    from pipelines.pipeline_custom import run_custom
+    os.environ["ENABLE_CUSTOM"] = "1"
+
+    def custom():
+        audio_features._BUNDLES.clear()
+        res = run_custom(wav)
+        if not res.get("ok") and "deps_missing" in str(res.get("error")):
+            raise RuntimeError(res["error"])
+    try:
+        out["run_custom"] = _timeit(custom, repeat)
+    except RuntimeError as e:
+        out["run_custom"] = {"skipped": str(e)}
+    return out
+
+
+# =====================================================
+# 🔹 Baseline
+# =====================================================
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressioni: p95 oltre baseline·(1+tol) oppure req/s sotto baseline·(1−tol)."""
+    problems = []
+    for section in ("load", "micro"):
+        for name, base in (baseline.get(section) or {}).items():
+            cur = (current.get(section) or {}).get(name)
+            if not isinstance(base, dict) or not isinstance(cur, dict):
+                continue
+            if "p95_ms" in base and "p95_ms" in cur and cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+                problems.append(f"{section}.{name}: p95 {cur['p95_ms']} ms > baseline {base['p95_ms']} ms")
+            if "rps" in base and "rps" in cur and cur["rps"] < base["rps"] * (1 - tolerance):
+                problems.append(f"{section}.{name}: {cur['rps']} req/s < baseline {base['rps']} req/s")
+    return problems
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark offline SingSync con upstream simulati")
+    ap.add_argument("--requests", type=int, default=40)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    ap.add_argument("--durations", default="5,15,30", help="durate clip (s), separate da virgola")
+    ap.add_argument("--formats", default="wav,mp3,m4a")
+    ap.add_argument("--acr", default="300:100:0.0:0.1", help="latency_ms:jitter_ms:failure_rate:miss_rate")
+    ap.add_argument("--openai", default="1200:300:0.0:0.0")
+    ap.add_argument("--genius", default="150:50:0.0:0.0")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--micro-repeat", type=int, default=5)
+    ap.add_argument("--skip-load", action="store_true")
+    ap.add_argument("--skip-micro", action="store_true")
+    ap.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "singsync_bench_corpus"))
+    ap.add_argument("--save", help="scrive i risultati come baseline JSON")
+    ap.add_argument("--baseline", help="confronta con una baseline JSON")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    args = ap.parse_args(argv)
+
+    paths = generate_corpus(
+        args.corpus_dir,
+        durations=[float(d) for d in args.durations.split(",")],
+        formats=args.formats.split(","),
+        seed=args.seed,
+    )
+    result: Dict[str, Any] = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+            "timestamp": int(time.time()),
+        }
+    }
+    if not args.skip_load:
+        result["load"] = asyncio.run(bench_load(args, paths))
+    if not args.skip_micro:
+        result["micro"] = bench_micro(paths, args.micro_repeat)
+
+    print(json.dumps({k: v for k, v in result.items() if k != "meta"}, indent=2, ensure_ascii=False))
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"💾 Baseline salvata in {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            problems = compare(result, json.load(f), args.tolerance)
+        for p in problems:
+            print(f"❌ {p}")
+        if problems:
+            return 1
+        print("✅ Nessuna regressione rispetto alla baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# Clip audio sintetiche e riproducibili per i benchmark (nessun file esterno):
+# accordi con inviluppo ritmico + "voce" modulata + rumore, in WAV o ricodificate con ffmpeg.
+import os
+import subprocess
+import wave
+from typing import List, Sequence
+
+import numpy as np
+
+from utils.audio import FFMPEG_BIN, PCM_SR
+
+# Codec ffmpeg per i formati supportati (WAV scritto direttamente)
+_CODECS = {
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "128k"],
+    "m4a": ["-c:a", "aac", "-b:a", "128k"],
+    "ogg": ["-c:a", "libopus", "-b:a", "64k"],
+}
+
+
+def synth_pcm(duration_sec: float, seed: int = 0, sr: int = PCM_SR) -> np.ndarray:
+    """PCM int16 mono: triade + melodia a 120 BPM + rumore rosa leggero."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_sec * sr), dtype=np.float32) / sr
+    root = 110.0 * 2 ** (rng.integers(0, 12) / 12)
+    chord = sum(np.sin(2 * np.pi * root * r * t) for r in (1.0, 1.26, 1.5)) / 3
+    beat = 0.6 + 0.4 * (np.sin(2 * np.pi * 2.0 * t) > 0)   # 120 BPM
+    notes = root * 2 * 2 ** (rng.integers(0, 8, size=int(duration_sec * 2) + 1) / 12)
+    melody_f = np.repeat(notes, sr // 2)[: t.size]
+    melody = np.sin(2 * np.pi * np.cumsum(melody_f) / sr) * (0.5 + 0.5 * np.sin(2 * np.pi * 5 * t))
+    noise = np.cumsum(rng.standard_normal(t.size)).astype(np.float32)
+    noise = (noise - noise.mean()) / (np.abs(noise).max() + 1e-9)
+    y = 0.45 * chord * beat + 0.35 * melody + 0.05 * noise
+    y = y / (np.abs(y).max() + 1e-9) * 0.9
+    return (y * 32767).astype(np.int16)
+
+
+def write_clip(path: str, duration_sec: float, seed: int = 0) -> str:
+    """Scrive una clip nel formato dato dall'estensione (wav, mp3, m4a, ogg)."""
+    pcm = synth_pcm(duration_sec, seed)
+    ext = os.path.splitext(path)[1].lstrip(".").lower()
+    if ext == "wav":
+        with wave.open(path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(PCM_SR)
+            w.writeframes(pcm.tobytes())
+        return path
+    cmd = [
+        FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "s16le", "-ar", str(PCM_SR), "-ac", "1", "-i", "pipe:0",
+        *_CODECS[ext], path,
+    ]
+    subprocess.run(cmd, input=pcm.tobytes(), check=True)
+    return path
+
+
+def generate_corpus(
+    out_dir: str,
+    durations: Sequence[float] = (5, 15, 30, 60),
+    formats: Sequence[str] = ("wav", "mp3", "m4a"),
+    seed: int = 0,
+) -> List[str]:
+    """Una clip per combinazione durata × formato (nomi e contenuti deterministici)."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i, d in enumerate(durations):
+        for fmt in formats:
+            path = os.path.join(out_dir, f"synth_{int(d)}s_{seed + i}.{fmt}")
+            if not os.path.exists(path):
+                write_clip(path, d, seed + i)
+            paths.append(path)
+    return paths
@@ -0,0 +1,62 @@
+# Ingestion incrementale nello store embedding "sounds like" (OpenL3 + chroma, int8/float16 in mmap)
+# da una cartella di brani ("Artista - Titolo.ext"); i file già presenti sono saltati.
+# Lo store va poi puntato con EMBEDDING_STORE_DIR.
+import os
+import argparse
+import numpy as np
+from utils.embedding_store import EmbeddingStore, EMBEDDING_DTYPE
+from utils.fingerprint import AUDIO_EXTS, _track_meta
+from utils.batch import BATCH_MODEL_SIZE
+from pipelines.pipeline_custom import embedding_vectors
+
+def main():
+    ap = argparse.ArgumentParser(description="Aggiorna lo store embedding")
+    ap.add_argument("store_dir")
+    ap.add_argument("audio_dir", nargs="?", help="cartella di brani da aggiungere")
+    ap.add_argument("--dtype", default=EMBEDDING_DTYPE, choices=("int8", "float16"))
+    ap.add_argument("--delete", nargs="*", default=[], help="key (path relativo) da rimuovere")
+    ap.add_argument("--train-ivf", type=int, default=0, metavar="N_LISTS", help="(ri)addestra l'indice IVF")
+    args = ap.parse_args()
+
+    store = None
+    if os.path.exists(os.path.join(args.store_dir, "store.json")):
+        store = EmbeddingStore(args.store_dir, writable=True)
+
+    if args.audio_dir:
+        files = sorted(
+            os.path.join(root, f)
+            for root, _, names in os.walk(args.audio_dir)
+            for f in names
+            if os.path.splitext(f)[1].lower() in AUDIO_EXTS
+        )
+        keys = [os.path.relpath(p, args.audio_dir) for p in files]
+        todo = [(p, k) for p, k in zip(files, keys) if store is None or not store.has_key(k)]
+        for lo in range(0, len(todo), BATCH_MODEL_SIZE):
+            group = todo[lo:lo + BATCH_MODEL_SIZE]
+            vecs = embedding_vectors([p for p, _ in group])
+            items, rows = [], []
+            for (path, key), vec in zip(group, vecs):
+                if vec is None:
+                    print(f"⚠️  {path}: audio illeggibile")
+                    continue
+                meta = _track_meta(path)
+                items.append({"key": key, "title": meta["title"], "artist": meta["artist"], "url": ""})
+                rows.append(vec)
+            if not items:
+                continue
+            if store is None:
+                store = EmbeddingStore(args.store_dir, dim=len(rows[0]), dtype=args.dtype, writable=True)
+            store.add(items, np.stack(rows))
+            print(f"✅ {lo + len(group)}/{len(todo)}")
+
+    if store is None:
+        print("Store inesistente: indicare una cartella di brani")
+        return
+    if args.delete:
+        print(f"🗑️  Rimossi {store.delete(args.delete)} brani")
+    if args.train_ivf:
+        print(f"🧭 IVF addestrato con {store.train_ivf(args.train_ivf)} liste")
+    print(f"📦 Store {args.store_dir}: {store.snapshot()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+# Ingestion offline: costruisce l'indice fingerprint locale da una cartella di brani
+# (nomi file "Artista - Titolo.ext"). L'indice va poi puntato con FINGERPRINT_INDEX_DIR.
+import sys
+from utils.fingerprint import build_index
+
+def main(audio_dir, out_dir):
+    n = build_index(audio_dir, out_dir)
+    print(f"📦 Indice salvato in {out_dir} ({n} brani)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python build_fingerprint_index.py <cartella_brani> <cartella_indice>")
+        sys.exit(1)
+    main(sys.argv[1], sys.argv[2])
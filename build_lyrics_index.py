@@ -0,0 +1,15 @@
+# Build offline dell'indice lyrics locale (SQLite FTS5) da un manifest JSONL:
+# {"title": ..., "artist": ..., "url": ..., "lyrics": ...} per riga.
+# L'indice va poi puntato con LYRICS_INDEX_PATH.
+import sys
+from utils.lyrics_index import build_from_manifest
+
+def main(manifest, db_path):
+    n = build_from_manifest(manifest, db_path)
+    print(f"📦 Indice lyrics salvato in {db_path} ({n} brani)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python build_lyrics_index.py <manifest.jsonl> <lyrics.sqlite>")
+        sys.exit(1)
+    main(sys.argv[1], sys.argv[2])
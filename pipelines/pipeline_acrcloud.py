@@ -2,15 +2,37 @@ import os
 import hmac
 import base64
 import hashlib
+import asyncio
 import time
-import requests
+from contextlib import contextmanager
+from typing import Any, Dict
+
+import aiohttp
 from pipelines.pipeline_genius_text import run_genius_text
+from utils.http_client import get_http_client
+from utils.clip import trimmed_clip, ACR_CLIP_SEC
+
+# Tipo di carico per lo scheduler (utils/executor.py): I/O remoto
+EXECUTION = "io"
+
+
+def _sign(access_key: str, access_secret: str, timestamp: str) -> str:
+    string_to_sign = f"POST\n/v1/identify\n{access_key}\naudio\n1\n{timestamp}"
+    return base64.b64encode(
+        hmac.new(
+            access_secret.encode("utf-8"),
+            string_to_sign.encode("utf-8"),
+            digestmod=hashlib.sha1,
+        ).digest()
+    ).decode("utf-8")
 
-def run_acrcloud(file_path: str):
-    """Riconosce brano con ACRCloud e arricchisce con link Genius."""
+
+async def run_acrcloud(file_path: str) -> Dict[str, Any]:
+    """Riconosce brano con ACRCloud e arricchisce con link Genius (tutto sul loop principale)."""
     start = time.time()
     try:
         host = os.getenv("ACRCLOUD_HOST")
+        scheme = os.getenv("ACRCLOUD_SCHEME", "https")
         access_key = os.getenv("ACRCLOUD_ACCESS_KEY")
         access_secret = os.getenv("ACRCLOUD_ACCESS_SECRET")
 
@@ -22,56 +44,72 @@ def run_acrcloud(file_path: str):
                 "elapsed_sec": 0,
             }
 
-        timestamp = str(int(time.time()))
-        string_to_sign = f"POST\n/v1/identify\n{access_key}\naudio\n1\n{timestamp}"
-        sign = base64.b64encode(
-            hmac.new(
-                access_secret.encode("utf-8"),
-                string_to_sign.encode("utf-8"),
-                digestmod=hashlib.sha1,
-            ).digest()
-        ).decode("utf-8")
-
-        with open(file_path, "rb") as f:
-            sample_bytes = f.read()
-
-        data = {
-            "access_key": access_key,
-            "sample_bytes": len(sample_bytes),
-            "timestamp": timestamp,
-            "signature": sign,
-            "data_type": "audio",
-            "signature_version": "1",
-        }
+        # ✂️ Solo la finestra più energetica (ACR_CLIP_SEC), ricodificata compatta
+        async with trimmed_clip(file_path, ACR_CLIP_SEC) as clip_path:
+            timestamp = str(int(time.time()))
+            data = {
+                "access_key": access_key,
+                "sample_bytes": os.path.getsize(clip_path),
+                "timestamp": timestamp,
+                "signature": _sign(access_key, access_secret, timestamp),
+                "data_type": "audio",
+                "signature_version": "1",
+            }
 
-        files = {"sample": sample_bytes}
-        r = requests.post(f"https://{host}/v1/identify", files=files, data=data, timeout=15)
+            @contextmanager
+            def build_form():
+                # sample in streaming dal disco; file aperto e chiuso a ogni tentativo
+                with open(clip_path, "rb") as sample:
+                    form = aiohttp.FormData()
+                    for k, v in data.items():
+                        form.add_field(k, str(v))
+                    form.add_field("sample", sample, filename=os.path.basename(clip_path), content_type="application/octet-stream")
+                    yield form
 
+            r = await get_http_client().post(f"{scheme}://{host}/v1/identify", data=build_form, timeout=15)
         res = r.json()
-        elapsed = round(time.time() - start, 2)
 
         if "status" not in res or res["status"]["code"] != 0:
             return {
                 "source": "acrcloud",
                 "ok": False,
                 "error": res.get("status", {}).get("msg", "Nessun brano riconosciuto"),
-                "elapsed_sec": elapsed,
+                "elapsed_sec": round(time.time() - start, 2),
             }
 
-        music_info = res["metadata"]["music"][0]
+        music = res["metadata"]["music"]
+        music_info = music[0]
         title = music_info.get("title")
         artist = music_info.get("artists", [{}])[0].get("name")
 
-        # 🔗 Cerca anche su Genius usando la pipeline testuale
-        genius_match = await_genius_result(title, artist)
+        # 🔗 Genius in parallelo al parsing del resto dei metadati
+        genius_task = asyncio.create_task(_genius_link(title, artist))
+
+        # score ACRCloud 0-100 → confidenza 0-1
+        confidence = round(float(music_info.get("score", 100)) / 100.0, 2)
+        album = (music_info.get("album") or {}).get("name")
+        alternatives = [
+            {
+                "title": m.get("title"),
+                "artist": (m.get("artists") or [{}])[0].get("name"),
+                "confidence": round(float(m.get("score", 0)) / 100.0, 2),
+            }
+            for m in music[1:5]
+        ]
+
+        genius_match = await genius_task
 
         return {
             "source": "acrcloud",
             "ok": True,
             "title": title,
             "artist": artist,
+            "album": album,
+            "release_date": music_info.get("release_date"),
             "url": genius_match,
-            "elapsed_sec": elapsed,
+            "confidence": confidence,
+            "alternatives": alternatives,
+            "elapsed_sec": round(time.time() - start, 2),
         }
 
     except Exception as e:
@@ -83,18 +121,12 @@ def run_acrcloud(file_path: str):
         }
 
 
-def await_genius_result(title: str, artist: str) -> str:
+async def _genius_link(title: str, artist: str) -> str:
     """Chiama la ricerca Genius per ottenere il link lyrics."""
     try:
-        query = f"{artist} {title}"
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(run_genius_text(query))
-        loop.close()
-
+        result = await run_genius_text(f"{artist} {title}", top_k=1)
         if result and "results" in result and len(result["results"]) > 0:
             return result["results"][0].get("url", "")
         return ""
     except Exception:
-        return ""
\ No newline at end of file
+        return ""
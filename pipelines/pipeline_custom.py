@@ -1,95 +1,251 @@
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List
+
+from utils.metrics import span
+
+# Tipo di carico per lo scheduler (utils/executor.py): CPU (librosa/CREPE/OpenL3)
+EXECUTION = "cpu"
 
 def _custom_disabled() -> bool:
     return os.getenv("ENABLE_CUSTOM", "0") != "1"
 
+def init():
+    """
+    Hook del registry (lifespan): modelli CREPE/OpenL3 caricati in background
+    (l'app è subito raggiungibile). In mode "process" ogni worker precarica i propri.
+    """
+    from utils.executor import CPU_EXECUTOR
+    from utils.models import MODELS, MODEL_WARMUP
+
+    if MODEL_WARMUP and CPU_EXECUTOR.mode != "process":
+        MODELS.start_background()
+
+def _missing_deps() -> List[str]:
+    """Dipendenze TF opzionali non installate (crepe, tensorflow, openl3)."""
+    missing = []
+    for mod in ("crepe", "tensorflow", "openl3"):
+        try:
+            __import__(mod)
+        except Exception:
+            missing.append(mod)
+    return missing
+
+def _fingerprint_matches(S) -> List[Dict[str, Any]]:
+    """Brani del catalogo locale riconosciuti dall'indice fingerprint (lista vuota se assente)."""
+    try:
+        from utils.fingerprint import get_fingerprint_index
+        index = get_fingerprint_index()
+        if index is None:
+            return []
+        with span("fingerprint"):
+            found = index.query_stft(S, top_k=5)
+        return [
+            {**m, "url": "", "preview": "", "image": "", "match": "fingerprint"}
+            for m in found
+        ]
+    except Exception:
+        return []
+
 def run_custom(audio_path: str) -> Dict[str, Any]:
     """
     Pipeline custom:
       - Lazy import deps pesanti (tensorflow, crepe, openl3)
+      - Matching locale sull'indice fingerprint (FINGERPRINT_INDEX_DIR), se presente
       - Estrae pitch + cromagramma + tempo + embedding
-      - Ritorna una "card" informativa (senza matching DB in questa fase)
+      - Ritorna i brani riconosciuti (ordinati per confidenza) + la "card" informativa
     """
     if _custom_disabled():
         return {"source": "custom", "ok": False, "disabled": True}
 
     # Lazy import
-    missing = []
     try:
-        import numpy as np
-        import librosa
+        from audio_features import get_features
     except Exception:
         return {"source": "custom", "ok": False, "error": "deps_missing: numpy/librosa"}
 
-    try:
-        import crepe  # noqa
-    except Exception:
-        missing.append("crepe")
+    missing = _missing_deps()
 
-    try:
-        import tensorflow as tf  # noqa
-    except Exception:
-        missing.append("tensorflow")
+    # Carica audio + feature condivise (una decodifica, una STFT/CQT)
+    bundle = get_features(audio_path)
+    y, sr = bundle.y, bundle.sr
 
-    try:
-        import openl3
-    except Exception:
-        missing.append("openl3")
+    # 🔎 Matching locale (solo numpy/librosa/scipy, niente TF) sulla STFT già calcolata
+    matches = _fingerprint_matches(bundle.S)
 
     if missing:
+        if matches:
+            return {"source": "custom", "ok": True, "results": matches, "features_error": f"deps_missing: {','.join(missing)}"}
         return {"source": "custom", "ok": False, "error": f"deps_missing: {','.join(missing)}"}
 
-    # Se le deps ci sono, procedi
+    # Se le deps ci sono, procedi (modelli residenti, caricati una sola volta)
     import crepe
     import openl3
+    from utils.models import MODELS, CREPE_CAPACITY, OPENL3_PARAMS
 
-    # Carica audio
-    y, sr = librosa.load(audio_path, sr=16000, mono=True)
-    y = librosa.util.normalize(y)
+    if not MODELS.load():
+        return {"source": "custom", "ok": False, "error": f"models_unavailable: {MODELS.error}"}
 
     # Pitch con CREPE (model capacity 'tiny' per velocità)
-    # CREPE vuole sr=16000 float32
+    # CREPE vuole sr=16000 float32 (bundle.y lo è già: nessuna copia)
     import numpy as _np
-    audio_f32 = _np.asarray(y, dtype=_np.float32)
-    time_f, frequency, confidence, activation = crepe.predict(
-        audio_f32, sr, step_size=20, model_capacity='tiny', viterbi=True
-    )
+    with MODELS.inference(), span("crepe"):
+        time_f, frequency, confidence, activation = crepe.predict(
+            y, sr, step_size=20, model_capacity=CREPE_CAPACITY, viterbi=True, verbose=0
+        )
     # pitch median (Hz) considerando confidenza > 0.5
     valid = frequency[confidence > 0.5]
     pitch_hz = float(_np.median(valid)) if valid.size else 0.0
 
-    # Beat/tempo + chroma
-    tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-    chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-    chroma_mean = chroma.mean(axis=1).tolist()
-
     # Embedding OpenL3 (modello audio, content_type music, 512 dim)
-    emb, ts = openl3.get_audio_embedding(
-        y, sr, input_repr="mel128", content_type="music", embedding_size=512, center=True, hop_size=0.5
-    )
+    with MODELS.inference(), span("openl3"):
+        emb, ts = openl3.get_audio_embedding(
+            y, sr, model=MODELS.openl3_model, center=True, hop_size=0.5, verbose=0, **OPENL3_PARAMS
+        )
     # media embedding
     emb_mean = emb.mean(axis=0).tolist()
 
     return {
         "source": "custom",
         "ok": True,
-        "results": [
-            {
-                "title": "Custom Analysis",
-                "artist": "",
-                "url": "",
-                "preview": "",
-                "image": "",
-                "confidence": 0.4,
-                "features": {
-                    "sr": sr,
-                    "duration_sec": float(len(y)/sr),
-                    "pitch_hz": pitch_hz,
-                    "tempo_bpm": float(tempo),
-                    "chroma_mean": chroma_mean,
-                    "embedding_size": len(emb_mean)
-                }
-            }
-        ]
-    }
\ No newline at end of file
+        "results": matches + [_analysis_card(bundle, pitch_hz, len(emb_mean))],
+    }
+
+
+def _analysis_card(bundle, pitch_hz: float, embedding_size: int) -> Dict[str, Any]:
+    """Card informativa con le feature del brano (esclusa dalla fusione)."""
+    return {
+        "title": "Custom Analysis",
+        "artist": "",
+        "url": "",
+        "preview": "",
+        "image": "",
+        "confidence": 0.4,
+        "features": {
+            "sr": bundle.sr,
+            "duration_sec": bundle.duration_sec,
+            "pitch_hz": pitch_hz,
+            "tempo_bpm": float(bundle.tempo_bpm),
+            "chroma_mean": bundle.chroma_mean,
+            "embedding_size": embedding_size,
+        },
+    }
+
+
+def run_custom_batch(audio_paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Come run_custom su più clip, ma con una sola chiamata per modello:
+      - CREPE sulle clip concatenate, pitch separato per intervallo di tempo
+      - OpenL3 sulla lista di clip (batch_size = OPENL3_BATCH_SIZE)
+    Il costo fisso per chiamata (grafo TF, batching) è pagato una volta per gruppo.
+    """
+    if _custom_disabled():
+        return [{"source": "custom", "ok": False, "disabled": True} for _ in audio_paths]
+    try:
+        import numpy as np
+        from audio_features import get_features
+    except Exception:
+        return [{"source": "custom", "ok": False, "error": "deps_missing: numpy/librosa"} for _ in audio_paths]
+
+    out: List[Dict[str, Any]] = [None] * len(audio_paths)
+    bundles = {}
+    for i, path in enumerate(audio_paths):
+        try:
+            bundles[i] = get_features(path)
+        except Exception as e:
+            out[i] = {"source": "custom", "ok": False, "error": str(e)}
+    matches = {i: _fingerprint_matches(b.S) for i, b in bundles.items()}
+
+    missing = _missing_deps()
+    from utils.models import MODELS, CREPE_CAPACITY, OPENL3_PARAMS, OPENL3_BATCH_SIZE
+    if missing or not bundles or not MODELS.load():
+        error = f"deps_missing: {','.join(missing)}" if missing else f"models_unavailable: {MODELS.error}"
+        for i in bundles:
+            if matches[i]:
+                out[i] = {"source": "custom", "ok": True, "results": matches[i], "features_error": error}
+            else:
+                out[i] = {"source": "custom", "ok": False, "error": error}
+        return out
+
+    import crepe
+    import openl3
+
+    idx = list(bundles)
+    ys = [bundles[i].y for i in idx]
+    sr = bundles[idx[0]].sr
+    offsets = np.cumsum([0] + [y.size for y in ys]) / sr
+
+    with MODELS.inference(), span("crepe"):
+        time_f, frequency, confidence, _ = crepe.predict(
+            np.concatenate(ys), sr, step_size=20, model_capacity=CREPE_CAPACITY, viterbi=True, verbose=0
+        )
+    with MODELS.inference(), span("openl3"):
+        embs, _ = openl3.get_audio_embedding(
+            ys, [sr] * len(ys), model=MODELS.openl3_model, center=True, hop_size=0.5,
+            batch_size=OPENL3_BATCH_SIZE, verbose=0, **OPENL3_PARAMS
+        )
+
+    for k, i in enumerate(idx):
+        in_clip = (time_f >= offsets[k]) & (time_f < offsets[k + 1]) & (confidence > 0.5)
+        valid = frequency[in_clip]
+        pitch_hz = float(np.median(valid)) if valid.size else 0.0
+        out[i] = {
+            "source": "custom",
+            "ok": True,
+            "results": matches[i] + [_analysis_card(bundles[i], pitch_hz, int(embs[k].shape[-1]))],
+        }
+    return out
+
+
+def embedding_vectors(audio_paths: List[str]) -> List[Any]:
+    """
+    Vettori "sounds like" (utils.embedding_store.embedding_vector) per più clip,
+    con una sola chiamata OpenL3; None per le clip illeggibili.
+    Solleva RuntimeError se TF/OpenL3 non sono disponibili.
+    """
+    from audio_features import get_features
+    from utils.embedding_store import embedding_vector
+    from utils.models import MODELS, OPENL3_PARAMS, OPENL3_BATCH_SIZE
+
+    missing = [m for m in _missing_deps() if m != "crepe"]
+    if missing:
+        raise RuntimeError(f"deps_missing: {','.join(missing)}")
+    if not MODELS.load():
+        raise RuntimeError(f"models_unavailable: {MODELS.error}")
+    import openl3
+
+    bundles = {}
+    for i, path in enumerate(audio_paths):
+        try:
+            bundles[i] = get_features(path)
+        except Exception:
+            continue
+    out: List[Any] = [None] * len(audio_paths)
+    if not bundles:
+        return out
+    idx = list(bundles)
+    with MODELS.inference(), span("openl3"):
+        embs, _ = openl3.get_audio_embedding(
+            [bundles[i].y for i in idx], [bundles[i].sr for i in idx], model=MODELS.openl3_model,
+            center=True, hop_size=0.5, batch_size=OPENL3_BATCH_SIZE, verbose=0, **OPENL3_PARAMS
+        )
+    for k, i in enumerate(idx):
+        out[i] = embedding_vector(embs[k].mean(axis=0), bundles[i].chroma_mean)
+    return out
+
+
+def run_sounds_like(audio_path: str, top_k: int = 10) -> Dict[str, Any]:
+    """Brani del catalogo embedding (EMBEDDING_STORE_DIR) più simili alla clip."""
+    from utils.embedding_store import get_embedding_store
+
+    store = get_embedding_store()
+    if store is None:
+        return {"source": "sounds_like", "ok": False, "error": "embedding_store_missing"}
+    try:
+        vec = embedding_vectors([audio_path])[0]
+    except RuntimeError as e:
+        return {"source": "sounds_like", "ok": False, "error": str(e)}
+    if vec is None:
+        return {"source": "sounds_like", "ok": False, "error": "audio_unreadable"}
+    with span("embedding_search"):
+        neighbours = store.search(vec, top_k=top_k)[0]
+    return {"source": "sounds_like", "ok": True, "results": neighbours}
@@ -1,16 +1,38 @@
 import os
 import re
 import time
+import asyncio
 from typing import List, Dict, Any
 
-import aiohttp
-from openai import OpenAI
+from utils.http_client import get_http_client
+from utils.metrics import span
+from utils.genius_search import GENIUS, GeniusError, genius_token
+from utils.clip import trimmed_clip, WHISPER_CLIP_SEC
+from utils.lyrics_index import get_lyrics_index, LYRICS_LOCAL_CONFIDENCE, LYRICS_LEARN
 
-# Client OpenAI (senza parametri strani: niente proxies/messages)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Tipo di carico per lo scheduler (utils/executor.py): I/O remoto
+EXECUTION = "io"
 
-GENIUS_API_TOKEN = os.getenv("GENIUS_API_TOKEN")  # opzionale ma consigliato
-GENIUS_API_URL = "https://api.genius.com/search"
+_openai_client = None
+_openai_http = None
+
+
+def _get_openai_client():
+    """Client OpenAI async sul pool httpx condiviso (creato al primo uso; l'SDK è importato solo qui)."""
+    from openai import AsyncOpenAI
+
+    global _openai_client, _openai_http
+    http = get_http_client()
+    if _openai_client is None or _openai_http is not http.openai_http:
+        _openai_http = http.openai_http
+        _openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=_openai_http)
+    return _openai_client
+
+
+def init():
+    """Hook del registry (lifespan): SDK OpenAI importato e client creato prima della prima richiesta."""
+    if os.getenv("OPENAI_API_KEY"):
+        _get_openai_client()
 
 # ✅ Regex per escludere risultati con caratteri non latini
 LATIN_PATTERN = re.compile(r"^[a-zA-Z0-9\s\-,.!?'\"éèàùìòç&()]+$", re.IGNORECASE)
@@ -24,28 +46,21 @@ async def _search_genius(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
     if not query.strip():
         return []
 
-    if not GENIUS_API_TOKEN:
+    if not genius_token():  # opzionale ma consigliato
         # Fallback senza token: link di ricerca su Genius
         q = query.replace(" ", "+")
-        return [{"title": query, "artist": "", "url": f"https://genius.com/search?q={q}"}]
-
-    headers = {"Authorization": f"Bearer {GENIUS_API_TOKEN}"}
-    params = {"q": query}
+        return [{"title": query, "artist": "", "url": f"https://genius.com/search?q={q}", "match": "search_link"}]
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(GENIUS_API_URL, headers=headers, params=params, timeout=20) as resp:
-            if resp.status != 200:
-                txt = await resp.text()
-                return [{"title": "Errore Genius", "artist": "", "url": None, "error": f"HTTP {resp.status}: {txt}"}]
-            data = await resp.json()
+    try:
+        hits = await GENIUS.search(query, top_k=top_k)
+    except GeniusError as e:
+        return [{"title": "Errore Genius", "artist": "", "url": None, "error": str(e)}]
 
-    hits = data.get("response", {}).get("hits", [])[:top_k]
     out: List[Dict[str, Any]] = []
     for h in hits:
-        r = h.get("result", {}) or {}
-        title = r.get("title") or r.get("full_title") or "Senza titolo"
-        artist = (r.get("primary_artist") or {}).get("name") or ""
-        url = r.get("url")
+        title = h.get("title") or "Senza titolo"
+        artist = h.get("artist") or ""
+        url = h.get("url")
 
         # ⚠️ Filtro per saltare risultati con caratteri non latini
         if not LATIN_PATTERN.match(title) or not LATIN_PATTERN.match(artist):
@@ -63,11 +78,23 @@ async def run_whisper_genius(file_path: str) -> Dict[str, Any]:
     t0 = time.perf_counter()
     try:
         # ✅ Whisper transcribe (niente 'messages', niente 'auto' esplicito)
-        with open(file_path, "rb") as f:
-            tx = client.audio.transcriptions.create(
-                model="whisper-1",   # puoi passare "gpt-4o-mini-transcribe" se preferisci
-                file=f,
-            )
+        http = get_http_client()
+        if not http.started:
+            await http.start()
+        breaker = http.breaker("api.openai.com")
+        breaker.check()
+        try:
+            # ✂️ Segmento più denso di voce (WHISPER_CLIP_SEC), ricodificato compatto
+            async with trimmed_clip(file_path, WHISPER_CLIP_SEC, vocal=True) as clip_path:
+                with open(clip_path, "rb") as f, span("whisper_transcribe"):
+                    tx = await _get_openai_client().audio.transcriptions.create(
+                        model="whisper-1",   # puoi passare "gpt-4o-mini-transcribe" se preferisci
+                        file=f,
+                    )
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
         transcript = (tx.text or "").strip()
     except Exception as e:
         return {
@@ -85,9 +112,32 @@ async def run_whisper_genius(file_path: str) -> Dict[str, Any]:
             "elapsed_sec": round(time.perf_counter() - t0, 2),
         }
 
+    # ⚡ Fast path: indice lyrics locale (nessuna chiamata di rete)
+    index = get_lyrics_index()
+    if index is not None:
+        try:
+            # query FTS5 bloccante: fuori dall'event loop (la connessione è protetta dal lock dell'indice)
+            local = await asyncio.to_thread(index.search, transcript, 5)
+        except Exception:
+            local = []
+        if local and local[0]["confidence"] >= LYRICS_LOCAL_CONFIDENCE:
+            return {
+                "source": "whisper_genius",
+                "ok": True,
+                "transcript": transcript,
+                "results": [{**r, "match": "local_lyrics"} for r in local],
+                "elapsed_sec": round(time.perf_counter() - t0, 2),
+            }
+
     # 🔎 Ricerca su Genius con la frase trascritta
     try:
         results = await _search_genius(transcript, top_k=5)
+        if index is not None and LYRICS_LEARN and results and results[0].get("url"):
+            # 📚 feedback: il primo risultato Genius arricchisce l'indice locale
+            try:
+                await asyncio.to_thread(index.learn, transcript, results[0])
+            except Exception:
+                pass
         return {
             "source": "whisper_genius",
             "ok": True,
@@ -0,0 +1,119 @@
+import os
+import asyncio
+import importlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+
+from utils.startup import STARTUP
+
+# Pipeline aggiuntive come plugin: "nome=modulo:funzione[,…]", abilitate con ENABLE_<NOME> (default 1)
+PIPELINE_PLUGINS = os.getenv("PIPELINE_PLUGINS", "")
+
+
+@dataclass
+class PipelineSpec:
+    """
+    Pipeline registrata: il modulo è importato solo se abilitata e solo al primo uso
+    (o nel lifespan). Il modulo dichiara EXECUTION ("io"/"cpu") e può esporre
+    `init()` (sync o async) per preparare client/modelli all'avvio.
+    """
+    name: str
+    module: str
+    func: str
+    env_flag: str
+    default_enabled: bool = True
+
+    @property
+    def enabled(self) -> bool:
+        return os.getenv(self.env_flag, "1" if self.default_enabled else "0") == "1"
+
+
+class PipelineRegistry:
+    """
+    Pipeline note al server. `errors`: moduli che non si importano (pipeline
+    trattata come disabilitata); `init_errors`: hook init() falliti (la pipeline
+    resta attiva e segnala l'errore nei propri risultati).
+    """
+
+    def __init__(self, specs: List[PipelineSpec]):
+        self.specs: Dict[str, PipelineSpec] = {s.name: s for s in specs}
+        self._modules: Dict[str, Any] = {}
+        self.errors: Dict[str, str] = {}
+        self.init_errors: Dict[str, str] = {}
+
+    def names(self) -> List[str]:
+        return list(self.specs)
+
+    def is_enabled(self, name: str) -> bool:
+        return self.specs[name].enabled and name not in self.errors
+
+    def enabled(self) -> List[str]:
+        return [name for name in self.specs if self.is_enabled(name)]
+
+    def module(self, name: str):
+        mod = self._modules.get(name)
+        if mod is None:
+            try:
+                with STARTUP.step(f"pipeline:{name}", kind="import"):
+                    mod = importlib.import_module(self.specs[name].module)
+            except Exception as e:
+                self.errors[name] = f"{type(e).__name__}: {e}"
+                raise
+            self._modules[name] = mod
+        return mod
+
+    def get(self, name: str) -> Callable:
+        return getattr(self.module(name), self.specs[name].func)
+
+    def execution(self, name: str) -> str:
+        return getattr(self.module(name), "EXECUTION", "io")
+
+    def loaded(self, name: str) -> bool:
+        return name in self._modules
+
+    async def init_enabled(self):
+        """Lifespan: import + init() delle sole pipeline abilitate; un errore non blocca l'avvio."""
+        for name in self.enabled():
+            try:
+                mod = self.module(name)
+            except Exception as e:
+                print(f"⚠️  Pipeline {name} disabilitata (import fallito): {e}")
+                continue
+            init = getattr(mod, "init", None)
+            if init is None:
+                continue
+            try:
+                with STARTUP.step(f"pipeline:{name}", kind="init"):
+                    res = init()
+                    if asyncio.iscoroutine(res):
+                        await res
+            except Exception as e:
+                self.init_errors[name] = str(e)
+                print(f"⚠️  Pipeline {name} non inizializzata: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "enabled": self.is_enabled(name),
+                "loaded": self.loaded(name),
+                "error": self.errors.get(name) or self.init_errors.get(name),
+            }
+            for name in self.specs
+        }
+
+
+def _plugin_specs(raw: str) -> List[PipelineSpec]:
+    specs = []
+    for item in filter(None, (p.strip() for p in raw.split(","))):
+        name, target = item.split("=", 1)
+        module, func = target.split(":", 1)
+        specs.append(PipelineSpec(name.strip(), module.strip(), func.strip(), f"ENABLE_{name.strip().upper()}"))
+    return specs
+
+
+PIPELINES = PipelineRegistry([
+    PipelineSpec("acrcloud", "pipelines.pipeline_acrcloud", "run_acrcloud", "ENABLE_ACRCLOUD"),
+    PipelineSpec("whisper_genius", "pipelines.pipeline_whisper_genius", "run_whisper_genius", "ENABLE_WHISPER_GENIUS"),
+    PipelineSpec("custom", "pipelines.pipeline_custom", "run_custom", "ENABLE_CUSTOM", default_enabled=False),
+    *_plugin_specs(PIPELINE_PLUGINS),
+])
@@ -1,39 +1,396 @@
 import os
+import json
 import asyncio
 import time
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from utils.sse import sse_pack
-from pipelines.pipeline_acrcloud import run_acrcloud
-from pipelines.pipeline_whisper_genius import run_whisper_genius
-from pipelines.pipeline_custom import run_custom
+import sys
+import tempfile
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+import uuid
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, WebSocket
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.requests import HTTPConnection
+from utils.sse import sse_pack, sse_comment, sse_retry
+from utils.stream_sessions import STREAM_SESSIONS, SSE_REPLAYED_EVENTS, SSE_SESSIONS, StreamSession
+from utils.upload_store import UPLOAD_STORE, UPLOAD_DIR
+from utils.http_client import get_http_client
+from utils.models import MODELS
+from utils.genius_search import GENIUS
+from utils.lyrics_index import get_lyrics_index
+from utils.result_cache import RESULT_CACHE, RESULT_CACHE_ENABLED, audio_cache_key_async, forget_audio_key
+from utils.executor import CPU_EXECUTOR, CapacityError, run_io
+from utils.scheduler import SCHEDULER, SCHED_RESOLVED_CONFIDENCE
+from utils.admission import (
+    ADMIT_TRUST_FORWARDED, CLIENT_DISCONNECTS, RateLimited, admit, pipeline_slot, snapshot as admission_snapshot,
+)
+from utils.metrics import (
+    REGISTRY, PIPELINE_SECONDS, PIPELINE_IN_FLIGHT, REQUESTS_IN_FLIGHT, span, record_span, start_trace,
+)
+from utils.startup import STARTUP
+from pipelines.registry import PIPELINES
 from pipelines.pipeline_genius_text import run_genius_text
 
+# audio/live/gate/fusion/embedding/batch (NumPy & co.) si importano nei soli handler che li usano:
+# come per le pipeline del registry, l'import del router resta leggero
+if TYPE_CHECKING:
+    from utils.fusion import Fusion
+
 router = APIRouter()
-UPLOADS = {}
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_MAX_DURATION_SEC = float(os.getenv("UPLOAD_MAX_DURATION_SEC", "300"))
+# Margine per boundary/header multipart oltre UPLOAD_MAX_BYTES (limite del body in UploadLimitMiddleware)
+UPLOAD_MULTIPART_OVERHEAD = 64 * 1024
+
+SSE_TIMEOUT_SEC = float(os.getenv("SSE_TIMEOUT_SEC", "45"))
+SSE_HEARTBEAT_SEC = float(os.getenv("SSE_HEARTBEAT_SEC", "15"))
+# Soglia di confidenza fusa oltre la quale (se early_stop) si cancellano le altre pipeline
+# (vuota = FUSION_EARLY_STOP_CONFIDENCE, vedi _stream_threshold)
+SSE_EARLY_STOP_CONFIDENCE = os.getenv("SSE_EARLY_STOP_CONFIDENCE", "")
+# Ogni quanto si verifica se il client di /identify_all ha chiuso la connessione
+DISCONNECT_POLL_SEC = float(os.getenv("DISCONNECT_POLL_SEC", "0.5"))
+# Attesa suggerita al client EventSource prima di riconnettersi (ms)
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "2000"))
+# Se = 1 /ready attende anche i modelli CREPE/OpenL3 (con ENABLE_CUSTOM=1)
+READY_REQUIRE_MODELS = os.getenv("READY_REQUIRE_MODELS", "0") == "1"
+
+
+def _stream_pipelines():
+    """
+    Pipeline per lo streaming: (source, funzione, abilitata). I moduli sono
+    importati dal registry solo se abilitati (funzione None per le disabilitate).
+    """
+    out = []
+    for source in PIPELINES.names():
+        enabled = PIPELINES.is_enabled(source)
+        out.append((source, PIPELINES.get(source) if enabled else None, enabled))
+    return out
+
+
+async def _stream_threshold() -> float:
+    """Soglia di early stop per stream e live (SSE_EARLY_STOP_CONFIDENCE o quella della fusione)."""
+    from utils.fusion import FUSION_EARLY_STOP_CONFIDENCE
+
+    return float(SSE_EARLY_STOP_CONFIDENCE) if SSE_EARLY_STOP_CONFIDENCE else FUSION_EARLY_STOP_CONFIDENCE
+
+
+def _embedding_snapshot() -> Optional[Dict[str, Any]]:
+    """Stato del catalogo embedding solo se già caricato (/health non importa NumPy)."""
+    module = sys.modules.get("utils.embedding_store")
+    store = module.get_embedding_store() if module is not None else None
+    return store.snapshot() if store is not None else None
+
+
+async def _resolve_upload(token: str) -> str:
+    """Path del file caricato per un token (400 se sconosciuto o scaduto)."""
+    path = await run_io(UPLOAD_STORE.get, token)
+    if not path:
+        raise HTTPException(status_code=400, detail="Token non valido")
+    return path
+
+
+def _check_cpu_capacity():
+    """503 immediato se una pipeline CPU abilitata non troverebbe posto nel pool."""
+    needs_cpu = any(
+        enabled and PIPELINES.execution(source) == "cpu"
+        for source, _, enabled in _stream_pipelines()
+    )
+    if needs_cpu and not CPU_EXECUTOR.has_capacity():
+        raise HTTPException(status_code=503, detail="Server occupato, riprova", headers={"Retry-After": "5"})
+
+
+def _busy(exc: CapacityError) -> HTTPException:
+    return HTTPException(status_code=503, detail="Server occupato, riprova", headers={"Retry-After": str(exc.retry_after)})
+
+
+def _client_id(request: HTTPConnection) -> str:
+    """Identità per il rate limit: X-API-Key, altrimenti IP (X-Forwarded-For solo se fidato)."""
+    key = request.headers.get("x-api-key")
+    if key:
+        return f"key:{key}"
+    if ADMIT_TRUST_FORWARDED and request.headers.get("x-forwarded-for"):
+        return request.headers["x-forwarded-for"].split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def _admit(request: Request):
+    """429 se il client supera il proprio rate, 503 se la coda globale è piena o l'attesa scade."""
+    try:
+        return await admit(_client_id(request))
+    except RateLimited as exc:
+        raise HTTPException(status_code=429, detail="Troppe richieste, riprova", headers={"Retry-After": str(exc.retry_after)})
+    except CapacityError as exc:
+        raise _busy(exc)
+
+
+async def _cancel_on_disconnect(request: Request, coro):
+    """Esegue `coro` cancellandolo (pipeline in corso incluse) se il client chiude la connessione."""
+    task = asyncio.create_task(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SEC)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                CLIENT_DISCONNECTS.inc(endpoint=request.url.path)
+                raise HTTPException(status_code=499, detail="Client disconnesso")
+    finally:
+        task.cancel()
+
+
+async def _run_pipeline(source: str, fn, path: str) -> Dict[str, Any]:
+    """
+    Esegue una pipeline (sync o async) passando dalla cache risultati:
+    su hit nessuna chiamata remota, su miss salva solo i risultati ok.
+    """
+    key = None
+    if RESULT_CACHE_ENABLED:
+        key = await audio_cache_key_async(path)
+        cached = await RESULT_CACHE.get(key, source)
+        if cached is not None:
+            PIPELINE_SECONDS.observe(0.0, source=source, outcome="cached")
+            return {**cached, "cached": True, "elapsed_sec": 0}
+
+    t0 = time.perf_counter()
+    outcome = "cancelled"
+    try:
+        async with pipeline_slot(source):
+            with PIPELINE_IN_FLIGHT.track(source=source):
+                if asyncio.iscoroutinefunction(fn):
+                    res = await fn(path)
+                elif PIPELINES.execution(source) == "cpu":
+                    res = await CPU_EXECUTOR.run_cpu(fn, path)
+                else:
+                    res = await run_io(fn, path)
+        outcome = "ok" if isinstance(res, dict) and res.get("ok") else "failed"
+    except CapacityError:
+        outcome = "busy"
+        raise
+    except Exception:
+        outcome = "error"
+        SCHEDULER.record(source, (time.perf_counter() - t0) * 1000, False)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        PIPELINE_SECONDS.observe(elapsed, source=source, outcome=outcome)
+        record_span(f"pipeline:{source}", t0, elapsed)
+    SCHEDULER.record(source, elapsed * 1000, outcome == "ok")
+
+    if key is not None and isinstance(res, dict) and res.get("ok"):
+        await RESULT_CACHE.set(key, source, res)
+    return res
+
+
+async def _run_with_timeout(source: str, fn, path: str, timeout: float) -> Dict[str, Any]:
+    """Esegue una pipeline con timeout; non solleva mai eccezioni."""
+    t0 = time.time()
+    try:
+        return await asyncio.wait_for(_run_pipeline(source, fn, path), timeout=timeout)
+    except asyncio.TimeoutError:
+        SCHEDULER.record(source, timeout * 1000, False)
+        return {"source": source, "ok": False, "error": "timeout", "elapsed_sec": round(time.time() - t0, 2)}
+    except CapacityError:
+        return {"source": source, "ok": False, "error": "busy", "elapsed_sec": round(time.time() - t0, 2)}
+    except Exception as e:
+        return {"source": source, "ok": False, "error": str(e), "elapsed_sec": round(time.time() - t0, 2)}
+
+
+async def _run_guarded(source: str, fn, path: str) -> Dict[str, Any]:
+    """
+    Come _run_pipeline, ma gli errori diventano risultati: una pipeline senza
+    slot (coda piena o attesa scaduta) risulta "busy" senza perdere le altre;
+    il 503 resta solo per l'ammissione della richiesta.
+    """
+    t0 = time.time()
+    try:
+        return await _run_pipeline(source, fn, path)
+    except CapacityError:
+        return {"source": source, "ok": False, "error": "busy", "elapsed_sec": round(time.time() - t0, 2)}
+    except Exception as e:
+        return {"source": source, "ok": False, "error": str(e), "elapsed_sec": 0}
+
+
+def _plan(adaptive: bool, budget_ms: Optional[int], budget_cost: Optional[float]) -> List[List[str]]:
+    """
+    Stadi di esecuzione. Senza `adaptive`/budget: un solo stadio con tutte le
+    pipeline abilitate (comportamento storico); altrimenti il piano dello scheduler.
+    """
+    enabled = [source for source, _, on in _stream_pipelines() if on]
+    if adaptive or budget_ms is not None or budget_cost is not None:
+        return SCHEDULER.plan(enabled, budget_ms, budget_cost)
+    return [enabled] if enabled else []
+
+
+async def _execute_plan(
+    stages: List[List[str]],
+    path: str,
+    fusion: "Fusion",
+    runner,
+    early_stop: bool,
+    threshold: float,
+    budget_ms: Optional[int] = None,
+    heartbeat: Optional[float] = None,
+):
+    """
+    Esegue gli stadi in sequenza (pipeline dello stesso stadio in parallelo).
+    Genera ("result", dict) per ogni esito, ("ping", None) ogni `heartbeat`
+    secondi di attesa e infine ("end", stopped_by). Uno stadio parte solo se i
+    precedenti non hanno portato la confidenza fusa sopra SCHED_RESOLVED_CONFIDENCE;
+    a budget di latenza esaurito le pipeline in corso vengono cancellate.
+    """
+    funcs = {source: fn for source, fn, _ in _stream_pipelines()}
+    deadline = time.time() + budget_ms / 1000 if budget_ms else None
+    stopped_by: Optional[str] = None
+    pending: Dict[asyncio.Task, str] = {}
+    try:
+        for i, stage in enumerate(stages):
+            if stopped_by:
+                for source in stage:
+                    yield "result", {"source": source, "ok": False, "skipped": True}
+                continue
+
+            pending = {asyncio.create_task(runner(source, funcs[source], path)): source for source in stage}
+            while pending:
+                wait = heartbeat
+                if deadline is not None:
+                    remaining = max(0.0, deadline - time.time())
+                    wait = remaining if wait is None else min(wait, remaining)
+                done, _ = await asyncio.wait(pending.keys(), timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if deadline is not None and time.time() >= deadline:
+                        stopped_by = "budget"
+                        for task, source in pending.items():
+                            task.cancel()
+                            yield "result", {"source": source, "ok": False, "error": "budget_exceeded"}
+                        pending.clear()
+                        break
+                    yield "ping", None
+                    continue
+                for task in done:
+                    pending.pop(task)
+                    res = task.result()
+                    fusion.add(res)
+                    yield "result", res
+                if early_stop and pending and fusion.best_confidence() >= threshold:
+                    stopped_by = "fusion"
+                    for task, source in pending.items():
+                        task.cancel()
+                        yield "result", {"source": source, "ok": False, "cancelled": True}
+                    pending.clear()
+
+            if not stopped_by and i < len(stages) - 1 and fusion.best_confidence() >= SCHED_RESOLVED_CONFIDENCE:
+                stopped_by = "resolved"
+        yield "end", stopped_by
+    finally:
+        for task in pending:
+            task.cancel()
+
 
 # =====================================================
 # 🔹 Health Check
 # =====================================================
 @router.get("/health")
 def health():
-    return {"ok": True, "service": "SingSync backend active"}
+    lyrics = get_lyrics_index()
+    return {
+        "ok": True,
+        "service": "SingSync backend active",
+        "cache": RESULT_CACHE.snapshot(),
+        "http": get_http_client().snapshot(),
+        "models": MODELS.snapshot(),
+        "executor": CPU_EXECUTOR.snapshot(),
+        "uploads": UPLOAD_STORE.snapshot(),
+        "genius": GENIUS.snapshot(),
+        "lyrics_index": lyrics.snapshot() if lyrics else None,
+        "scheduler": SCHEDULER.snapshot(),
+        "admission": admission_snapshot(),
+        "embedding_store": _embedding_snapshot(),
+        "pipelines": PIPELINES.snapshot(),
+        "streams": STREAM_SESSIONS.snapshot(),
+    }
+
+
+# =====================================================
+# 🔹 Readiness (fine avvio; /health risponde già durante il lifespan)
+# =====================================================
+@router.get("/ready")
+def ready():
+    """
+    200 quando il lifespan ha finito (pipeline abilitate importate e inizializzate,
+    pool e indici aperti), altrimenti 503. Riporta i tempi dei passi di avvio.
+    """
+    models = MODELS.snapshot()
+    waiting = []
+    if not STARTUP.ready:
+        waiting.append("startup")
+    # in mode "process" i modelli vivono nei worker (caricati dall'initializer prima del primo task):
+    # lo stato MODELS del processo principale resta "idle" e non indica la prontezza
+    if (
+        READY_REQUIRE_MODELS and CPU_EXECUTOR.mode != "process"
+        and PIPELINES.is_enabled("custom") and models.get("state") != "ready"
+    ):
+        waiting.append("models")
+    body = {
+        "ok": not waiting,
+        "waiting": waiting,
+        "startup": STARTUP.snapshot(),
+        "pipelines": PIPELINES.snapshot(),
+        "models": models,
+    }
+    if waiting:
+        raise HTTPException(status_code=503, detail=body, headers={"Retry-After": "1"})
+    return body
+
+
+# =====================================================
+# 🔹 Metriche (formato testo Prometheus)
+# =====================================================
+@router.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 # =====================================================
 # 🔹 Upload file audio
 # =====================================================
 @router.post("/upload_audio")
 async def upload_audio(file: UploadFile = File(...)):
-    """Riceve un file audio e restituisce un token temporaneo."""
+    """
+    Riceve un file audio e restituisce un token temporaneo.
+    Il token è l'hash del contenuto: upload identici riusano lo stesso file.
+    """
+    from utils.audio import UploadTooLarge, stream_upload_to_file, probe_duration_sec
+
+    # il body è già limitato prima del parsing (UploadLimitMiddleware); qui resta il limite sul solo file
+    if UPLOAD_MAX_BYTES and (file.size or 0) > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"File troppo grande (max {UPLOAD_MAX_BYTES} byte)")
+
+    tmp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.part")
     try:
-        token = str(int(time.time() * 1000))[-8:]
-        save_path = f"/tmp/{token}.m4a"
-        with open(save_path, "wb") as f:
-            f.write(await file.read())
-        UPLOADS[token] = save_path
-        return {"ok": True, "token": token}
+        with span("upload_write"):
+            digest, size = await stream_upload_to_file(file, tmp_path, UPLOAD_MAX_BYTES)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    token = digest[:32]
+    if await run_io(UPLOAD_STORE.get, token):
+        os.remove(tmp_path)
+        return {"ok": True, "token": token, "dedup": True}
+
+    if UPLOAD_MAX_DURATION_SEC:
+        with span("ffprobe"):
+            duration = await probe_duration_sec(tmp_path)
+        if duration is not None and duration > UPLOAD_MAX_DURATION_SEC:
+            os.remove(tmp_path)
+            raise HTTPException(status_code=413, detail=f"Audio troppo lungo (max {UPLOAD_MAX_DURATION_SEC:.0f} s)")
+
+    ext = os.path.splitext(file.filename or "")[-1] or ".m4a"
+    save_path = os.path.join(UPLOAD_DIR, f"up_{token}{ext}")
+    os.replace(tmp_path, save_path)
+    forget_audio_key(save_path)
+    await run_io(UPLOAD_STORE.put, token, save_path, size)
+    return {"ok": True, "token": token, "size": size}
+
 # =====================================================
 # 🔹 Ricerca testuale su Genius
 # =====================================================
@@ -42,91 +399,479 @@ async def identify_text(query: str):
     """Ricerca testuale su Genius."""
     return await run_genius_text(query)
 
+# =====================================================
+# 🔹 "Suona come" (vicini nel catalogo embedding)
+# =====================================================
+@router.get("/sounds_like")
+async def sounds_like(request: Request, token: str, top_k: int = 10):
+    """Brani del catalogo locale (EMBEDDING_STORE_DIR) più simili all'upload per timbro e armonia."""
+    from utils.embedding_store import get_embedding_store
+
+    path = await _resolve_upload(token)
+    if get_embedding_store() is None:
+        raise HTTPException(status_code=503, detail="Catalogo embedding non configurato")
+    from pipelines.pipeline_custom import run_sounds_like
+
+    ticket = await _admit(request)
+    try:
+        return await CPU_EXECUTOR.run_cpu(run_sounds_like, path, max(1, min(top_k, 100)))
+    except CapacityError as exc:
+        raise _busy(exc)
+    finally:
+        ticket.release()
+
 # =====================================================
 # 🔹 Identificazione completa (tutte le pipeline)
 # =====================================================
 @router.get("/identify_all")
-async def identify_all(token: str):
-    """Esegue tutte le pipeline (Whisper+Genius, ACRCloud, Custom)."""
-    if token not in UPLOADS:
-        raise HTTPException(status_code=400, detail="Token non valido")
+async def identify_all(
+    request: Request,
+    token: str,
+    early_stop: bool = False,
+    adaptive: bool = False,
+    budget_ms: Optional[int] = None,
+    budget_cost: Optional[float] = None,
+    trace: bool = False,
+    gate: bool = True,
+):
+    """
+    Esegue tutte le pipeline (Whisper+Genius, ACRCloud, Custom) e fonde i
+    risultati in un'unica classifica (`fused`). Con `early_stop=true` risponde
+    appena la confidenza fusa supera FUSION_EARLY_STOP_CONFIDENCE,
+    cancellando le pipeline ancora in corso.
+    Con `adaptive=true` (o `budget_ms`/`budget_cost`) le pipeline girano a
+    stadi secondo il piano dello scheduler (es. locale → ACRCloud → Whisper).
+    Con `trace=true` la risposta include gli span per fase della richiesta.
+    Il gate (`gate=true`, GATE_ENABLED) classifica prima la clip e salta le
+    pipeline inutili (tutte sul silenzio, Whisper senza voce…).
+    Ammissione: 429 oltre il rate del client, 503 con coda globale piena
+    (una pipeline senza slot risulta `"error": "busy"` tra i risultati);
+    se il client si disconnette le pipeline in corso vengono cancellate.
+    """
+    from utils.fusion import Fusion, FUSION_EARLY_STOP_CONFIDENCE
+    from utils.gate import gate_clip, apply_gate
 
-    path = UPLOADS[token]
-    tasks = []
-
-    # ✅ ACRCloud (sincrono → wrapper async)
-    if os.getenv("ENABLE_ACRCLOUD", "1") == "1":
-        async def acr_wrapper():
-            return await asyncio.to_thread(run_acrcloud, path)
-        tasks.append(acr_wrapper())
-
-    # ✅ Whisper + Genius (già async)
-    if os.getenv("ENABLE_WHISPER_GENIUS", "1") == "1":
-        tasks.append(run_whisper_genius(path))
-
-    # ✅ Custom (sincrono → wrapper async)
-    if os.getenv("ENABLE_CUSTOM", "0") == "1":
-        async def custom_wrapper():
-            return await asyncio.to_thread(run_custom, path)
-        tasks.append(custom_wrapper())
-
-    # 🔄 raccogli tutti i risultati
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    parsed = []
-    for r in results:
-        if isinstance(r, Exception):
-            parsed.append({
-                "source": "internal",
-                "ok": False,
-                "error": str(r),
-                "elapsed_sec": 0
-            })
-        else:
-            parsed.append(r)
+    path = await _resolve_upload(token)
+    _check_cpu_capacity()
+    ticket = await _admit(request)
+
+    async def run() -> Dict[str, Any]:
+        tr = start_trace()
+        decision = await gate_clip(path) if gate else None
+        stages, gated = apply_gate(_plan(adaptive, budget_ms, budget_cost), decision)
 
-    return {"ok": True, "results": parsed}
+        # 🔄 raccogli i risultati man mano che arrivano
+        fusion = Fusion()
+        parsed = [{"source": source, "ok": False, "skipped": True, "reason": f"gate:{decision['label']}"} for source in gated]
+        stopped_by: Optional[str] = None
+        async for kind, payload in _execute_plan(
+            stages, path, fusion, _run_guarded, early_stop, FUSION_EARLY_STOP_CONFIDENCE, budget_ms
+        ):
+            if kind == "result":
+                parsed.append(payload)
+            elif kind == "end":
+                stopped_by = payload
+
+        ranked = fusion.ranked()
+        out = {
+            "ok": True,
+            "best": ranked[0] if ranked else None,
+            "fused": ranked,
+            "early_stop": stopped_by,
+            "plan": stages,
+            "gate": decision,
+            "results": parsed,
+        }
+        if trace:
+            out["trace"] = tr.to_dict()
+        return out
+
+    REQUESTS_IN_FLIGHT.inc(endpoint="identify_all")
+    try:
+        return await _cancel_on_disconnect(request, run())
+    finally:
+        REQUESTS_IN_FLIGHT.dec(endpoint="identify_all")
+        ticket.release()
 
 # =====================================================
-# 🔹 Stream SSE (se usato)
+# 🔹 Stream SSE (pipeline in parallelo, primo risultato → primo evento)
 # =====================================================
 @router.get("/identify_stream")
-async def identify_stream(token: str):
-    """Versione streaming (per Expo fallback o SSE)."""
-    if token not in UPLOADS:
-        raise HTTPException(status_code=400, detail="Token non valido")
+async def identify_stream(
+    request: Request,
+    token: str,
+    early_stop: bool = False,
+    adaptive: bool = False,
+    budget_ms: Optional[int] = None,
+    budget_cost: Optional[float] = None,
+    trace: bool = False,
+    gate: bool = True,
+    last_event_id: Optional[str] = None,
+):
+    """
+    Versione streaming (per Expo fallback o SSE).
+    Tutte le pipeline abilitate partono insieme; ogni evento `message` viene
+    inviato appena la relativa pipeline termina. Con `early_stop=true` le
+    pipeline ancora in corso vengono cancellate quando la confidenza fusa
+    supera SSE_EARLY_STOP_CONFIDENCE. L'evento `done` contiene la classifica fusa.
+    In modalità adattiva il primo evento è `plan` con gli stadi scelti;
+    con `trace=true` l'evento `done` include gli span per fase.
+    Con il gate attivo l'evento `gate` (classe della clip e pipeline saltate)
+    precede i risultati.
+    Ogni evento ha un id: riconnettendosi con lo stesso token e parametri
+    (header Last-Event-ID o `last_event_id`) si ricevono gli eventi mancanti e
+    ci si aggancia alle pipeline ancora in corso invece di rilanciarle; più
+    client con la stessa richiesta condividono un'unica esecuzione. Se gli
+    eventi mancanti non sono più nel log (SSE_SESSION_MAX_EVENTS) arriva prima
+    un evento `gap` con il numero di eventi persi.
+    L'ammissione (429/503) avviene solo per un'esecuzione nuova, prima
+    dell'apertura dello stream; senza client collegati le pipeline vengono
+    cancellate dopo SSE_SESSION_ORPHAN_GRACE_SEC.
+    """
+    from utils.fusion import Fusion
+    from utils.gate import gate_clip, apply_gate
+
+    last_event_id = request.headers.get("last-event-id") or last_event_id
+    adaptive = adaptive or budget_ms is not None or budget_cost is not None
+    key = json.dumps([token, early_stop, adaptive, budget_ms, budget_cost, trace, gate])
+    session = STREAM_SESSIONS.get(key)
+    if session is not None:
+        SSE_SESSIONS.inc(outcome="resumed" if last_event_id else "attached")
+    else:
+        path = await _resolve_upload(token)
+        _check_cpu_capacity()
+        ticket = await _admit(request)
+        # un'altra richiesta identica può aver avviato la sessione durante l'attesa in coda
+        session = STREAM_SESSIONS.get(key)
+        if session is not None:
+            ticket.release()
+            SSE_SESSIONS.inc(outcome="attached")
+    if session is None:
+        stages = _plan(adaptive, budget_ms, budget_cost)
+
+        async def produce(session: StreamSession):
+            start = time.time()
+            fusion = Fusion()
+            tr = start_trace()
+            plan_events = None
+            REQUESTS_IN_FLIGHT.inc(endpoint="identify_stream")
+            try:
+                decision = await gate_clip(path) if gate else None
+                run_stages, gated = apply_gate(stages, decision)
+                if decision is not None:
+                    session.publish("gate", {**decision, "skipped": gated})
+                if adaptive:
+                    session.publish("plan", {"stages": run_stages, "budget_ms": budget_ms, "budget_cost": budget_cost})
+                planned = {source for stage in run_stages for source in stage}
+                for source, _, enabled in _stream_pipelines():
+                    if not enabled:
+                        session.publish("message", {"source": source, "ok": False, "disabled": True})
+                    elif source in gated:
+                        session.publish("message", {"source": source, "ok": False, "skipped": True, "reason": f"gate:{decision['label']}"})
+                    elif source not in planned:
+                        session.publish("message", {"source": source, "ok": False, "skipped": True})
+
+                stopped_by: Optional[str] = None
+                runner = lambda source, fn, p: _run_with_timeout(source, fn, p, SSE_TIMEOUT_SEC)
+                plan_events = _execute_plan(run_stages, path, fusion, runner, early_stop, _stream_threshold(), budget_ms)
+                async for kind, payload in plan_events:
+                    if kind == "result":
+                        session.publish("message", payload)
+                    else:
+                        stopped_by = payload
 
-    path = UPLOADS[token]
+                done = {
+                    "ok": True,
+                    "elapsed_sec": round(time.time() - start, 2),
+                    "early_stop": stopped_by,
+                    "fused": fusion.ranked(),
+                }
+                if trace:
+                    done["trace"] = tr.to_dict()
+                session.publish("done", done)
+            except Exception as e:
+                session.publish("error", {"error": str(e)})
+            finally:
+                if plan_events is not None:
+                    # chiusura esplicita: cancella subito le pipeline ancora in corso
+                    await plan_events.aclose()
+                REQUESTS_IN_FLIGHT.dec(endpoint="identify_stream")
+
+        session = STREAM_SESSIONS.start(key, produce)
+        # release alla fine dell'esecuzione (anche se cancellata prima di partire)
+        session.task.add_done_callback(lambda _: ticket.release())
+
+    after = session.resume_after(last_event_id)
+    replay_until = session.last_seq
+
+    async def event_generator():
+        yield sse_retry(SSE_RETRY_MS)
+        async for item in session.follow(after, SSE_HEARTBEAT_SEC):
+            if item is None:
+                if await request.is_disconnected():
+                    CLIENT_DISCONNECTS.inc(endpoint="/identify_stream")
+                    return
+                yield sse_comment("ping")
+                continue
+            seq, event, data = item
+            if seq <= replay_until:
+                SSE_REPLAYED_EVENTS.inc()
+            yield sse_pack(event, data, session.event_id(seq))
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Stream-Session": session.id},
+    )
+
+# =====================================================
+# 🔹 Job batch (cartella o manifest → JSONL)
+# =====================================================
+@router.post("/batch_jobs")
+async def create_batch_job(source: str, output: str, retry_failed: bool = False):
+    """
+    Avvia in background l'identificazione di tutti i file di una cartella
+    (o di un manifest) scrivendo una riga JSONL per file in `output`.
+    I path devono stare sotto BATCH_ROOT; rilanciare lo stesso job riprende
+    dai file non ancora scritti (con `retry_failed=true` ritenta anche quelli
+    con una riga non riuscita, che viene rimossa dall'output).
+    """
+    from utils.batch import BATCH_JOBS, BATCH_ROOT, BatchJob, within_root
+
+    if not BATCH_ROOT:
+        raise HTTPException(status_code=403, detail="Job batch disabilitati (BATCH_ROOT non impostata)")
+    if not (within_root(source) and within_root(output)):
+        raise HTTPException(status_code=403, detail="Path fuori da BATCH_ROOT")
+    if not os.path.exists(source):
+        raise HTTPException(status_code=400, detail="Sorgente inesistente")
+    if any(j.output == output and j.status == "running" for j in BATCH_JOBS.values()):
+        raise HTTPException(status_code=409, detail="Job già in corso su questo output")
+
+    job = BatchJob(source, output, retry_failed=retry_failed)
+    BATCH_JOBS[job.id] = job
+    job.task = asyncio.create_task(job.run())
+    return {"ok": True, "job": job.snapshot()}
+
+
+@router.get("/batch_jobs/{job_id}")
+async def get_batch_job(job_id: str):
+    from utils.batch import BATCH_JOBS
+
+    job = BATCH_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job sconosciuto")
+    return {"ok": True, "job": job.snapshot()}
+
+# =====================================================
+# 🔹 Riconoscimento live (WebSocket, durante la registrazione)
+# =====================================================
+async def _reject_live(ws: WebSocket, error: str, retry_after: int, code: int):
+    """Sessione live rifiutata dall'ammissione: messaggio error con Retry-After, poi chiusura."""
+    try:
+        await ws.send_json({"type": "error", "error": error, "retry_after": retry_after})
+        await ws.close(code=code)
+    except Exception:
+        pass
+
+
+@router.websocket("/identify_live")
+async def identify_live(ws: WebSocket, format: str = "pcm16", early_stop: bool = True):
+    """
+    Il client invia chunk binari mentre registra (`format=pcm16`: s16le 16k mono;
+    altrimenti il formato ffmpeg del contenitore, es. `webm`, oppure `auto`) e un
+    messaggio testo {"type": "stop"} a fine registrazione. Risposte JSON:
+      - features: livello e quota vocale dell'audio nuovo (ogni LIVE_LOCAL_EVERY_SEC)
+      - result: esito di fingerprint locale (a ogni giro) e API remote (ai checkpoint)
+      - match: appena la confidenza fusa supera SSE_EARLY_STOP_CONFIDENCE
+      - done: classifica fusa finale
+    Con `early_stop=true` (default) la sessione termina al primo match.
+    La sessione passa dalla stessa ammissione delle richieste HTTP (rate del
+    client + slot globale, tenuto fino alla chiusura): se rifiutata riceve un
+    messaggio error (`rate_limited`/`busy`) e la chiusura 1008/1013. Si chiude
+    dopo LIVE_IDLE_TIMEOUT_SEC senza messaggi e dopo LIVE_MAX_SESSION_SEC di
+    registrazione (audio ricevuto o tempo trascorso).
+    """
+    from utils.audio import PCM_SR, write_wav
+    from utils.fusion import Fusion
+    from utils.live import (
+        RollingPcmBuffer, make_decoder, analyze_window, LIVE_LOCAL_EVERY_SEC, LIVE_REMOTE_CHECKPOINTS_SEC,
+        LIVE_WHISPER_MIN_SEC, LIVE_MAX_SESSION_SEC, LIVE_IDLE_TIMEOUT_SEC,
+    )
+
+    await ws.accept()
+    try:
+        ticket = await admit(_client_id(ws))
+    except RateLimited as exc:
+        await _reject_live(ws, "rate_limited", exc.retry_after, 1008)
+        return
+    except CapacityError as exc:
+        await _reject_live(ws, "busy", exc.retry_after, 1013)
+        return
     start = time.time()
-    queue = asyncio.Queue()
+    buffer = RollingPcmBuffer()
+    decoder = make_decoder(format, buffer.append)
+    fusion = Fusion()
+    threshold = _stream_threshold()
+    remote = {source: fn for source, fn, enabled in _stream_pipelines() if enabled and source != "custom"}
+    checkpoints = sorted(LIVE_REMOTE_CHECKPOINTS_SEC)
+    matched = asyncio.Event()
+    state = {"local_at": 0, "remote_sec": 0.0, "connected": True}
+    local_task: Optional[asyncio.Task] = None
+    remote_task: Optional[asyncio.Task] = None
 
-    async def worker():
+    async def send(msg: Dict[str, Any]):
+        if not state["connected"]:
+            return
         try:
-            for fn, enabled in [
-                (run_acrcloud, os.getenv("ENABLE_ACRCLOUD", "1") == "1"),
-                (run_whisper_genius, os.getenv("ENABLE_WHISPER_GENIUS", "1") == "1"),
-                (run_custom, os.getenv("ENABLE_CUSTOM", "0") == "1"),
-            ]:
-                if not enabled:
-                    await queue.put(sse_pack("message", {"source": fn.__name__, "ok": False, "disabled": True}))
-                    continue
+            await ws.send_json(msg)
+        except Exception:
+            state["connected"] = False
 
-                if asyncio.iscoroutinefunction(fn):
-                    res = await fn(path)
-                else:
-                    res = await asyncio.to_thread(fn, path)
+    async def publish(res: Dict[str, Any], audio_sec: float):
+        fusion.add(res)
+        await send({"type": "result", "audio_sec": round(audio_sec, 1), **res})
+        if not matched.is_set() and fusion.best_confidence() >= threshold:
+            matched.set()
+            ranked = fusion.ranked()
+            await send({
+                "type": "match",
+                "best": ranked[0],
+                "fused": ranked,
+                "audio_sec": round(audio_sec, 1),
+                "elapsed_sec": round(time.time() - start, 2),
+            })
 
-                await queue.put(sse_pack("message", res))
-            await queue.put(sse_pack("done", {"ok": True, "elapsed_sec": round(time.time() - start, 2)}))
+    async def local_round():
+        """Fingerprint locale sulla finestra + feature dell'audio arrivato dall'ultimo giro."""
+        pcm, audio_sec = buffer.window(), buffer.total_sec
+        new = buffer.total_samples - state["local_at"]
+        state["local_at"] = buffer.total_samples
+        try:
+            features, matches = await CPU_EXECUTOR.run_cpu(analyze_window, pcm, new)
+        except CapacityError:
+            return
         except Exception as e:
-            await queue.put(sse_pack("error", {"error": str(e)}))
+            await send({"type": "error", "source": "custom", "error": str(e)})
+            return
+        await send({"type": "features", "audio_sec": round(audio_sec, 1), **features})
+        if matches:
+            await publish({"source": "custom", "ok": True, "results": matches}, audio_sec)
+
+    async def remote_round(final: bool = False):
+        """API remote sulla finestra corrente (Whisper solo oltre LIVE_WHISPER_MIN_SEC)."""
+        audio_sec = state["remote_sec"] = buffer.total_sec
+        sources = [s for s in remote if s != "whisper_genius" or final or audio_sec >= LIVE_WHISPER_MIN_SEC]
+        if not sources:
+            return
+        fd, path = tempfile.mkstemp(suffix=".wav", dir=UPLOAD_DIR)
+        os.close(fd)
+        pending: Dict[asyncio.Task, str] = {}
+        try:
+            await asyncio.to_thread(write_wav, buffer.window(), path)
+            pending = {
+                asyncio.create_task(_run_with_timeout(s, remote[s], path, SSE_TIMEOUT_SEC)): s for s in sources
+            }
+            while pending:
+                done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.pop(task)
+                    await publish(task.result(), audio_sec)
+                if early_stop and matched.is_set():
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            forget_audio_key(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
-    asyncio.create_task(worker())
+    def schedule():
+        nonlocal local_task, remote_task
+        if (local_task is None or local_task.done()) and \
+                buffer.total_samples - state["local_at"] >= LIVE_LOCAL_EVERY_SEC * PCM_SR:
+            local_task = asyncio.create_task(local_round())
+        if checkpoints and buffer.total_sec >= checkpoints[0] and (remote_task is None or remote_task.done()):
+            while checkpoints and buffer.total_sec >= checkpoints[0]:
+                checkpoints.pop(0)
+            remote_task = asyncio.create_task(remote_round())
 
-    async def event_generator():
+    stopped_by: Optional[str] = None
+    REQUESTS_IN_FLIGHT.inc(endpoint="identify_live")
+    try:
+        try:
+            await decoder.start()
+        except CapacityError as exc:
+            # nessuno slot ffmpeg libero per decodificare il formato richiesto
+            state["connected"] = False
+            await _reject_live(ws, "busy", exc.retry_after, 1013)
+            return
         while True:
-            data = await queue.get()
-            yield data
-            if "done" in data:
+            recv = asyncio.ensure_future(ws.receive())
+            waiters = {recv}
+            if early_stop:
+                stop = asyncio.ensure_future(matched.wait())
+                waiters.add(stop)
+            remaining = start + LIVE_MAX_SESSION_SEC - time.time()
+            await asyncio.wait(waiters, timeout=max(0.0, min(LIVE_IDLE_TIMEOUT_SEC, remaining)),
+                               return_when=asyncio.FIRST_COMPLETED)
+            if early_stop:
+                stop.cancel()
+                if matched.is_set():
+                    recv.cancel()
+                    stopped_by = "match"
+                    break
+            if not recv.done():
+                recv.cancel()
+                stopped_by = "max_duration" if time.time() - start >= LIVE_MAX_SESSION_SEC else "idle"
                 break
+            msg = recv.result()
+            if msg["type"] == "websocket.disconnect":
+                state["connected"] = False
+                stopped_by = "disconnect"
+                break
+            if msg.get("bytes"):
+                await decoder.feed(msg["bytes"])
+            elif msg.get("text"):
+                try:
+                    cmd = json.loads(msg["text"])
+                except ValueError:
+                    cmd = {}
+                if cmd.get("type") == "stop":
+                    stopped_by = "client"
+                    break
+            if buffer.total_sec >= LIVE_MAX_SESSION_SEC:
+                stopped_by = "max_duration"
+                break
+            schedule()
+
+        await decoder.close()
+        if state["connected"] and not matched.is_set() and buffer.total_samples:
+            # fine registrazione: un ultimo giro sull'audio completo
+            await asyncio.gather(*(t for t in (local_task, remote_task) if t), return_exceptions=True)
+            if not matched.is_set() and buffer.total_samples > state["local_at"]:
+                await local_round()
+            if not matched.is_set() and buffer.total_sec > state["remote_sec"] + 1:
+                await remote_round(final=True)
 
-    return EventSourceResponse(event_generator())
\ No newline at end of file
+        await send({
+            "type": "done",
+            "ok": True,
+            "early_stop": stopped_by,
+            "audio_sec": round(buffer.total_sec, 1),
+            "elapsed_sec": round(time.time() - start, 2),
+            "fused": fusion.ranked(),
+        })
+    finally:
+        REQUESTS_IN_FLIGHT.dec(endpoint="identify_live")
+        ticket.release()
+        for task in (local_task, remote_task):
+            if task is not None:
+                task.cancel()
+        await decoder.close()
+        if state["connected"]:
+            try:
+                await ws.close()
+            except Exception:
+                pass
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# I test importano i moduli del backend (utils/, benchmarks/) dalla radice del repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,47 @@
+from benchmarks.run_bench import compare, percentile, summarize
+
+
+def test_percentile_interpolates_between_samples():
+    values = [40.0, 10.0, 30.0, 20.0]
+    assert percentile(values, 0.0) == 10.0
+    assert percentile(values, 1.0) == 40.0
+    assert percentile(values, 0.5) == 25.0
+    assert percentile(values, 0.95) == 38.5
+
+
+def test_percentile_edge_cases():
+    assert percentile([], 0.95) == 0.0
+    assert percentile([7.0], 0.99) == 7.0
+
+
+def test_summarize_empty_and_rounding():
+    assert summarize([]) == {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    s = summarize([1.04, 2.06, 3.01])
+    assert s["p50_ms"] == 2.1 and s["max_ms"] == 3.0
+
+
+def test_compare_flags_p95_and_rps_regressions_only_beyond_tolerance():
+    baseline = {
+        "load": {"identify_all": {"p95_ms": 100.0, "rps": 50.0}},
+        "micro": {"features": {"p95_ms": 10.0}},
+    }
+    within = {
+        "load": {"identify_all": {"p95_ms": 124.0, "rps": 38.0}},
+        "micro": {"features": {"p95_ms": 12.4}},
+    }
+    assert compare(within, baseline, 0.25) == []
+
+    worse = {
+        "load": {"identify_all": {"p95_ms": 130.0, "rps": 30.0}},
+        "micro": {"features": {"p95_ms": 20.0}},
+    }
+    problems = compare(worse, baseline, 0.25)
+    assert len(problems) == 3
+    assert any(p.startswith("load.identify_all: p95") for p in problems)
+    assert any("req/s" in p for p in problems)
+    assert any(p.startswith("micro.features") for p in problems)
+
+
+def test_compare_ignores_entries_missing_from_current_run():
+    baseline = {"load": {"identify_stream": {"p95_ms": 100.0}}, "micro": {}}
+    assert compare({"load": {}}, baseline, 0.1) == []
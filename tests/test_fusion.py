@@ -0,0 +1,57 @@
+from utils.fusion import Fusion, candidates_from_result
+
+WEIGHTS = {"acrcloud": 0.9, "whisper_genius": 0.5, "custom": 0.8}
+
+
+def test_candidates_from_acrcloud_and_results_lists():
+    acr = {
+        "source": "acrcloud", "ok": True, "title": "Song", "artist": "Band", "confidence": 0.7,
+        "alternatives": [{"title": "Other", "artist": "X", "confidence": 0.2}],
+    }
+    whisper = {
+        "source": "whisper_genius", "ok": True,
+        "results": [
+            {"title": "A", "artist": "B", "url": "u"},
+            {"title": "Search", "match": "search_link"},
+            {"title": "C"},
+        ],
+    }
+    acr_c = candidates_from_result(acr)
+    assert [(c["title"], c["confidence"], c["source"]) for c in acr_c] == [
+        ("Song", 0.7, "acrcloud"), ("Other", 0.2, "acrcloud"),
+    ]
+    # senza confidence: prior per posizione (la card search_link è esclusa ma conta nella posizione)
+    wg = candidates_from_result(whisper)
+    assert [(c["title"], c["confidence"]) for c in wg] == [("A", 0.5), ("C", 0.2)]
+    assert candidates_from_result({"source": "acrcloud", "ok": False, "title": "x"}) == []
+
+
+def test_agreeing_sources_raise_confidence_noisy_or():
+    f = Fusion(WEIGHTS)
+    f.add({"source": "acrcloud", "ok": True, "title": "Bohemian Rhapsody", "artist": "Queen", "confidence": 1.0})
+    f.add({"source": "whisper_genius", "ok": True,
+           "results": [{"title": "Bohemian Rhapsody (Remastered 2011)", "artist": "Queen", "confidence": 0.8}]})
+    ranked = f.ranked()
+    assert len(ranked) == 1
+    # 1 − (1 − 0.9)(1 − 0.5·0.8)
+    assert ranked[0]["confidence"] == 0.94
+    assert ranked[0]["sources"] == ["acrcloud", "whisper_genius"]
+    assert f.best_confidence() == 0.94
+
+
+def test_one_evidence_per_source_keeps_the_strongest():
+    f = Fusion(WEIGHTS)
+    f.add({"source": "custom", "ok": True, "results": [{"title": "Song", "artist": "A", "confidence": 0.5}]})
+    f.add({"source": "custom", "ok": True, "results": [{"title": "Song", "artist": "A", "confidence": 1.0}]})
+    assert f.ranked()[0]["confidence"] == 0.8
+
+
+def test_ranking_orders_distinct_songs_and_fills_missing_fields():
+    f = Fusion(WEIGHTS)
+    f.add({"source": "whisper_genius", "ok": True, "results": [{"title": "Low", "artist": "", "confidence": 0.4}]})
+    f.add({"source": "acrcloud", "ok": True, "title": "High", "artist": "Z", "confidence": 0.9})
+    f.add({"source": "custom", "ok": True, "results": [{"title": "Low", "artist": "Y", "url": "http://x", "confidence": 0.1}]})
+    ranked = f.ranked()
+    assert [c["title"] for c in ranked] == ["High", "Low"]
+    assert ranked[1]["artist"] == "Y" and ranked[1]["url"] == "http://x"
+    assert Fusion(WEIGHTS).best_confidence() == 0.0
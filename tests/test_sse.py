@@ -0,0 +1,29 @@
+from utils.sse import parse_sse, sse_comment, sse_pack, sse_retry
+
+
+def test_roundtrip_of_packed_stream():
+    text = (
+        sse_retry(2000)
+        + sse_pack("gate", {"label": "music"}, "abc:1")
+        + sse_comment("ping")
+        + sse_pack("done", {"ok": True, "fused": []})
+    )
+    items = list(parse_sse(text))
+    assert [i["event"] for i in items] == [None, "gate", None, "done"]
+    assert items[0]["retry"] == 2000
+    assert items[1]["id"] == "abc:1" and items[1]["data"] == {"label": "music"}
+    assert items[2]["comment"] == "ping"
+    assert items[3]["id"] is None and items[3]["data"] == {"ok": True, "fused": []}
+
+
+def test_multiline_data_crlf_and_non_json():
+    text = "event: message\r\ndata: riga 1\r\ndata: riga 2\r\n\r\ndata:{\"a\": 1}\n\n"
+    items = list(parse_sse(text))
+    assert items[0]["event"] == "message" and items[0]["data"] == "riga 1\nriga 2"
+    assert items[1]["event"] == "message" and items[1]["data"] == {"a": 1}
+
+
+def test_unicode_is_not_escaped():
+    packed = sse_pack("message", {"title": "Perché"})
+    assert "Perché" in packed
+    assert next(parse_sse(packed))["data"]["title"] == "Perché"
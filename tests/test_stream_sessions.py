@@ -0,0 +1,67 @@
+import asyncio
+
+from utils import stream_sessions
+from utils.stream_sessions import GAP_EVENT, StreamSession
+
+
+def _collect(session: StreamSession, after: int = 0):
+    async def run():
+        return [item async for item in session.follow(after)]
+    return run()
+
+
+def test_replay_is_ordered_and_resumes_after_last_event_id():
+    async def main():
+        s = StreamSession("k")
+        for i in range(5):
+            s.publish("message", {"i": i})
+        s.finish()
+        full = await _collect(s)
+        after = s.resume_after(s.event_id(3))
+        tail = await _collect(s, after)
+        return s, full, after, tail
+
+    s, full, after, tail = asyncio.run(main())
+    assert [seq for seq, _, _ in full] == [1, 2, 3, 4, 5]
+    assert [d["i"] for _, _, d in full] == [0, 1, 2, 3, 4]
+    assert after == 3
+    assert [seq for seq, _, _ in tail] == [4, 5]
+    # id di un'altra sessione o malformato: si riparte da capo
+    assert s.resume_after("altra:3") == 0
+    assert s.resume_after(f"{s.id}:x") == 0
+    assert s.resume_after(None) == 0
+
+
+def test_live_subscriber_gets_replay_then_new_events_in_order():
+    async def main():
+        s = StreamSession("k")
+        s.publish("gate", {})
+        reader = asyncio.create_task(_collect(s))
+        await asyncio.sleep(0)
+        for i in range(3):
+            s.publish("message", {"i": i})
+            await asyncio.sleep(0)
+        s.publish("done", {})
+        s.finish()
+        return s, await reader
+
+    s, items = asyncio.run(main())
+    assert [e for _, e, _ in items] == ["gate", "message", "message", "message", "done"]
+    assert [seq for seq, _, _ in items] == [1, 2, 3, 4, 5]
+    assert s.complete and s.subscribers == 0
+
+
+def test_gap_event_when_resuming_before_retained_window(monkeypatch):
+    monkeypatch.setattr(stream_sessions, "SSE_SESSION_MAX_EVENTS", 3)
+
+    async def main():
+        s = StreamSession("k")
+        for i in range(6):
+            s.publish("message", {"i": i})
+        s.finish()
+        return await _collect(s, 1), await _collect(s, 4)
+
+    resumed, recent = asyncio.run(main())
+    assert resumed[0] == (3, GAP_EVENT, {"missed": 2, "after": 1})
+    assert [seq for seq, _, _ in resumed[1:]] == [4, 5, 6]
+    assert [seq for seq, _, _ in recent] == [5, 6]
@@ -0,0 +1,182 @@
+import os
+import json
+import math
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from utils.executor import CapacityError, CPU_WORKERS, CPU_QUEUE_MAX
+from utils.genius_search import TokenBucket
+from utils.metrics import REGISTRY
+
+# Richieste di identificazione eseguite insieme (le altre attendono in coda, poi 503)
+ADMIT_MAX_ACTIVE = int(os.getenv("ADMIT_MAX_ACTIVE", "32"))
+ADMIT_MAX_QUEUE = int(os.getenv("ADMIT_MAX_QUEUE", "64"))
+ADMIT_QUEUE_TIMEOUT_SEC = float(os.getenv("ADMIT_QUEUE_TIMEOUT_SEC", "2"))
+# Esecuzioni contemporanee per pipeline (JSON, es. {"whisper_genius": 4}) e attesa massima di uno slot
+PIPELINE_CONCURRENCY = {
+    "acrcloud": 16,
+    "whisper_genius": 8,
+    "custom": CPU_WORKERS + CPU_QUEUE_MAX,
+    **json.loads(os.getenv("PIPELINE_CONCURRENCY", "{}")),
+}
+PIPELINE_QUEUE_MAX = int(os.getenv("PIPELINE_QUEUE_MAX", "32"))
+PIPELINE_QUEUE_TIMEOUT_SEC = float(os.getenv("PIPELINE_QUEUE_TIMEOUT_SEC", "5"))
+# Token bucket per client (X-API-Key, altrimenti IP): richieste/s sostenute e burst
+CLIENT_RATE_PER_SEC = float(os.getenv("CLIENT_RATE_PER_SEC", "2"))
+CLIENT_RATE_BURST = int(os.getenv("CLIENT_RATE_BURST", "10"))
+CLIENT_TRACK_MAX = int(os.getenv("CLIENT_TRACK_MAX", "10000"))
+# Se = 1 il client è il primo IP di X-Forwarded-For (solo dietro un proxy fidato)
+ADMIT_TRUST_FORWARDED = os.getenv("ADMIT_TRUST_FORWARDED", "0") == "1"
+
+ADMISSION_REJECTED = REGISTRY.counter(
+    "singsync_admission_rejected_total", "Richieste/pipeline rifiutate per sovraccarico", ("scope", "reason")
+)
+
+CLIENT_DISCONNECTS = REGISTRY.counter(
+    "singsync_client_disconnects_total", "Richieste cancellate per disconnessione del client", ("endpoint",)
+)
+
+
+class RateLimited(RuntimeError):
+    """Client oltre il proprio rate: la richiesta va rifiutata con 429."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("rate_limited")
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """
+    Semaforo con coda d'attesa limitata: oltre `max_queue` richieste in attesa,
+    o dopo `timeout` secondi in coda, CapacityError (→ 503 / "busy") invece di
+    accumulare lavoro che finirebbe comunque oltre i timeout del client.
+    """
+
+    def __init__(self, scope: str, limit: int, max_queue: int, timeout: float):
+        self.scope = scope
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._sem = asyncio.Semaphore(self.limit)
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        ADMISSION_REJECTED.inc(scope=self.scope, reason=reason)
+        raise CapacityError(retry_after=max(1, math.ceil(self.timeout)))
+
+    async def acquire(self):
+        if self._sem.locked():
+            if self.waiting >= self.max_queue:
+                self._reject("queue_full")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._sem.acquire(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self._reject("queue_timeout")
+            finally:
+                self.waiting -= 1
+        else:
+            await self._sem.acquire()
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._sem.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting, "rejected": self.rejected}
+
+
+class ClientLimiter:
+    """Token bucket per client (LRU di CLIENT_TRACK_MAX client), non bloccante."""
+
+    def __init__(self, rate_per_sec: float, burst: int, max_clients: int):
+        self.rate = rate_per_sec
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def check(self, client: str):
+        """Consuma un token del client; RateLimited se il bucket è vuoto."""
+        if self.rate <= 0:
+            return
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        wait = bucket.try_acquire()
+        if wait > 0:
+            ADMISSION_REJECTED.inc(scope="client", reason="rate_limited")
+            raise RateLimited(retry_after=max(1, math.ceil(wait)))
+
+
+class Ticket:
+    """Slot di ammissione di una richiesta; `release` è idempotente."""
+
+    def __init__(self, limiter: Limiter):
+        self._limiter = limiter
+        self._held = True
+
+    def release(self):
+        if self._held:
+            self._held = False
+            self._limiter.release()
+
+
+REQUEST_LIMITER = Limiter("request", ADMIT_MAX_ACTIVE, ADMIT_MAX_QUEUE, ADMIT_QUEUE_TIMEOUT_SEC)
+PIPELINE_LIMITERS = {
+    source: Limiter(f"pipeline:{source}", limit, PIPELINE_QUEUE_MAX, PIPELINE_QUEUE_TIMEOUT_SEC)
+    for source, limit in PIPELINE_CONCURRENCY.items()
+}
+CLIENT_LIMITER = ClientLimiter(CLIENT_RATE_PER_SEC, CLIENT_RATE_BURST, CLIENT_TRACK_MAX)
+
+REGISTRY.gauge(
+    "singsync_admission_active", "Richieste/pipeline in esecuzione per ambito", ("scope",),
+    fn=lambda: {(lim.scope,): lim.active for lim in [REQUEST_LIMITER, *PIPELINE_LIMITERS.values()]},
+)
+REGISTRY.gauge(
+    "singsync_admission_waiting", "Richieste/pipeline in coda per ambito", ("scope",),
+    fn=lambda: {(lim.scope,): lim.waiting for lim in [REQUEST_LIMITER, *PIPELINE_LIMITERS.values()]},
+)
+
+
+async def admit(client: str) -> Ticket:
+    """Rate limit del client (RateLimited) + slot globale con coda limitata (CapacityError)."""
+    CLIENT_LIMITER.check(client)
+    await REQUEST_LIMITER.acquire()
+    return Ticket(REQUEST_LIMITER)
+
+
+@asynccontextmanager
+async def pipeline_slot(source: str):
+    """Slot di esecuzione per pipeline (nessun limite per sorgenti non configurate)."""
+    limiter = PIPELINE_LIMITERS.get(source)
+    if limiter is None:
+        yield
+        return
+    async with limiter.slot():
+        yield
+
+
+def snapshot() -> Dict[str, Any]:
+    return {
+        "requests": REQUEST_LIMITER.snapshot(),
+        "pipelines": {source: lim.snapshot() for source, lim in PIPELINE_LIMITERS.items()},
+        "clients_tracked": len(CLIENT_LIMITER._buckets),
+    }
@@ -1,44 +1,259 @@
 import os
+import wave
+import asyncio
+import hashlib
 import tempfile
-import subprocess
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Tuple, Union
+
+import numpy as np
+import aiofiles
 from fastapi import UploadFile
 
+from utils.metrics import span
+
 FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+UPLOAD_CHUNK_BYTES = 256 * 1024
+# Processi ffmpeg contemporanei per processo
+FFMPEG_CONCURRENCY = int(os.getenv("FFMPEG_CONCURRENCY", str(os.cpu_count() or 2)))
+PCM_SR = 16000
+# PCM decodificato per file, per processo: una decodifica per upload condivisa da
+# chiave cache, gate, clip remote e pipeline custom (~10 MB per 5 minuti di audio)
+PCM_CACHE_MAX_BYTES = int(os.getenv("PCM_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
 
-async def ensure_wav_16k_mono(uploaded: UploadFile) -> str:
+_FFMPEG_SEM: Optional[asyncio.Semaphore] = None
+
+
+def ffmpeg_slots() -> asyncio.Semaphore:
+    global _FFMPEG_SEM
+    if _FFMPEG_SEM is None:
+        _FFMPEG_SEM = asyncio.Semaphore(max(1, FFMPEG_CONCURRENCY))
+    return _FFMPEG_SEM
+
+
+class UploadTooLarge(ValueError):
+    """Upload oltre il limite di dimensione/durata configurato."""
+
+
+async def stream_upload_to_file(uploaded: UploadFile, dest_path: str, max_bytes: int = 0) -> Tuple[str, int]:
     """
-    Salva l'UploadFile su disco e converte (se serve) in WAV PCM s16le 16k mono usando ffmpeg.
-    Ritorna il path al file WAV normalizzato.
+    Copia l'UploadFile su disco a chunk con I/O asincrono, calcolando lo
+    SHA-256 durante la scrittura. Ritorna (sha256, byte scritti).
+    Con max_bytes > 0 interrompe appena superato il limite (file parziale rimosso).
     """
-    # Salva input grezzo
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded.filename or "")[-1] or ".bin") as tmp_in:
-        raw = await uploaded.read()
-        tmp_in.write(raw)
-        in_path = tmp_in.name
+    h = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(dest_path, "wb") as out:
+            while True:
+                chunk = await uploaded.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(f"file oltre {max_bytes} byte")
+                h.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        try:
+            os.remove(dest_path)
+        except Exception:
+            pass
+        raise
+    return h.hexdigest(), size
+
 
-    # Output WAV 16k mono
+async def probe_duration_sec(path: str) -> Optional[float]:
+    """Durata del file via ffprobe (None se ffprobe manca o non riesce a leggerlo)."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            FFPROBE_BIN, "-v", "error", "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1", path,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+        )
+        out, _ = await proc.communicate()
+        return float(out.decode().strip())
+    except Exception:
+        return None
+
+
+async def ensure_wav_16k_mono(uploaded: UploadFile) -> str:
+    """
+    Converte l'UploadFile in WAV PCM s16le 16k mono usando ffmpeg.
+    I byte passano in pipe a ffmpeg (nessun file di input temporaneo);
+    l'unica scrittura su disco è il WAV normalizzato di cui si ritorna il path.
+    """
+    pcm = await decode_pcm_16k_mono(uploaded)
     out_fd, out_path = tempfile.mkstemp(suffix=".wav")
     os.close(out_fd)
+    await asyncio.to_thread(write_wav, pcm, out_path)
+    return out_path
+
 
+async def _iter_upload(uploaded: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await uploaded.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def decode_pcm_16k_mono(
+    source: Union[str, bytes, UploadFile, AsyncIterator[bytes]], max_sec: Optional[float] = None
+) -> np.ndarray:
+    """
+    Decodifica asincrona con ffmpeg in PCM s16le 16k mono, senza file intermedi:
+    - path: ffmpeg legge direttamente dal file
+    - bytes / UploadFile / iteratore async: i byte vengono scritti su stdin a chunk
+    Lo stdout viene letto in un buffer NumPy int16 (np.frombuffer, senza copie).
+    Con `max_sec` decodifica solo l'inizio del file.
+    Il numero di ffmpeg concorrenti è limitato da FFMPEG_CONCURRENCY.
+    """
+    from_file = isinstance(source, str)
     cmd = [
-        FFMPEG_BIN, "-y",
-        "-i", in_path,
-        "-vn",
-        "-ac", "1",
-        "-ar", "16000",
-        "-sample_fmt", "s16",
-        out_path
+        FFMPEG_BIN, "-hide_banner",
+        "-i", source if from_file else "pipe:0",
+        "-vn", "-ac", "1", "-ar", str(PCM_SR),
+        *(["-t", str(max_sec)] if max_sec else []),
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "pipe:1",
     ]
+
+    async with ffmpeg_slots():
+        with span("ffmpeg_decode"):
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.DEVNULL if from_file else asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+
+            async def feed():
+                try:
+                    if isinstance(source, (bytes, bytearray)):
+                        proc.stdin.write(source)
+                        await proc.stdin.drain()
+                    else:
+                        chunks = _iter_upload(source) if isinstance(source, UploadFile) else source
+                        async for chunk in chunks:
+                            proc.stdin.write(chunk)
+                            await proc.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    proc.stdin.close()
+
+            try:
+                if from_file:
+                    out, err = await proc.communicate()
+                else:
+                    feeder = asyncio.create_task(feed())
+                    out_task = asyncio.create_task(proc.stdout.read())
+                    err_task = asyncio.create_task(proc.stderr.read())
+                    await feeder
+                    out, err = await out_task, await err_task
+                    await proc.wait()
+            except BaseException:
+                if proc.returncode is None:
+                    proc.kill()
+                raise
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg conversion failed: {err.decode(errors='ignore')[-400:]}")
+    return np.frombuffer(out, dtype=np.int16)
+
+
+def pcm_to_float32(pcm: np.ndarray) -> np.ndarray:
+    """int16 → float32 [-1, 1] (formato atteso da librosa/CREPE/OpenL3)."""
+    return pcm.astype(np.float32) / 32768.0
+
+
+def write_wav(pcm: np.ndarray, path: str, sr: int = PCM_SR):
+    """Codifica il PCM in WAV solo quando un'API remota richiede un file."""
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm.tobytes())
+
+
+_PCM: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+_PCM_LOCK = threading.Lock()
+_PCM_BYTES = 0
+_PCM_TASKS: Dict[tuple, "asyncio.Task"] = {}
+
+
+def _pcm_key(path: str) -> tuple:
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def _pcm_lookup(key: tuple) -> Optional[np.ndarray]:
+    with _PCM_LOCK:
+        pcm = _PCM.get(key)
+        if pcm is not None:
+            _PCM.move_to_end(key)
+        return pcm
+
+
+def _pcm_store(key: tuple, pcm: np.ndarray):
+    global _PCM_BYTES
+    if pcm.nbytes > PCM_CACHE_MAX_BYTES:
+        return
+    with _PCM_LOCK:
+        if key in _PCM:
+            return
+        _PCM[key] = pcm
+        _PCM_BYTES += pcm.nbytes
+        while _PCM_BYTES > PCM_CACHE_MAX_BYTES:
+            _, evicted = _PCM.popitem(last=False)
+            _PCM_BYTES -= evicted.nbytes
+
+
+def read_wav(path: str) -> np.ndarray:
+    """PCM int16 di un WAV scritto da `write_wav` (lettura diretta, senza ffmpeg)."""
+    with wave.open(path, "rb") as w:
+        return np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+
+
+def prime_pcm(path: str, pcm: np.ndarray):
+    """Registra il PCM già decodificato di `path` (es. job batch): `get_pcm` non rilancia ffmpeg."""
     try:
-        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-    except subprocess.CalledProcessError as e:
-        # Se fallisce, riprova forcing format
-        raise RuntimeError(f"ffmpeg conversion failed: {e.stderr.decode(errors='ignore')[:400]}")
-    finally:
-        # pulizia input sorgente
-        try:
-            os.remove(in_path)
-        except Exception:
-            pass
+        _pcm_store(_pcm_key(path), pcm)
+    except OSError:
+        pass
+
+
+def peek_pcm(path: str) -> Optional[np.ndarray]:
+    """PCM già decodificato da `get_pcm` per questo file (None se assente); sincrono, thread-safe."""
+    try:
+        return _pcm_lookup(_pcm_key(path))
+    except OSError:
+        return None
+
+
+async def get_pcm(path: str) -> np.ndarray:
+    """
+    PCM 16k mono (int16, sola lettura) di un file, decodificato una sola volta:
+    LRU per (path, mtime, size) limitata a PCM_CACHE_MAX_BYTES e single-flight
+    (chiamate concorrenti sullo stesso file condividono un unico ffmpeg, che
+    prosegue anche se il chiamante che l'ha avviato viene cancellato).
+    """
+    key = _pcm_key(path)
+    pcm = _pcm_lookup(key)
+    if pcm is not None:
+        return pcm
+    task = _PCM_TASKS.get(key)
+    if task is None:
+        task = asyncio.create_task(decode_pcm_16k_mono(path))
+        _PCM_TASKS[key] = task
+
+        def done(t: "asyncio.Task"):
+            _PCM_TASKS.pop(key, None)
+            if not t.cancelled() and t.exception() is None:
+                _pcm_store(key, t.result())
 
-    return out_path
\ No newline at end of file
+        task.add_done_callback(done)
+    return await asyncio.shield(task)
@@ -0,0 +1,360 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import tempfile
+from typing import Any, Dict, List, Optional, Set
+
+from utils.audio import FFMPEG_CONCURRENCY, decode_pcm_16k_mono, peek_pcm, prime_pcm, read_wav, write_wav
+from utils.executor import CPU_EXECUTOR, CapacityError
+from utils.fusion import Fusion
+from utils.gate import GATE_DECISIONS, GATE_ENABLED, apply_gate, classify_pcm
+from utils.genius_search import TokenBucket
+from utils.metrics import REGISTRY
+from pipelines.registry import PIPELINES
+
+# Radice entro cui devono stare cartelle/manifest/output dei job avviati via API ("" = API disabilitata)
+BATCH_ROOT = os.getenv("BATCH_ROOT", "")
+# Decodifiche ffmpeg contemporanee (limitate comunque da FFMPEG_CONCURRENCY)
+BATCH_DECODE_WORKERS = int(os.getenv("BATCH_DECODE_WORKERS", str(FFMPEG_CONCURRENCY)))
+# File decodificati in lavorazione (WAV temporanei su disco)
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", "32"))
+# Chiamate remote contemporanee (ACRCloud + Whisper) e rate limit per upstream
+BATCH_REMOTE_CONCURRENCY = int(os.getenv("BATCH_REMOTE_CONCURRENCY", "4"))
+BATCH_ACRCLOUD_RATE_PER_SEC = float(os.getenv("BATCH_ACRCLOUD_RATE_PER_SEC", "2"))
+BATCH_WHISPER_RATE_PER_SEC = float(os.getenv("BATCH_WHISPER_RATE_PER_SEC", "1"))
+BATCH_PIPELINE_TIMEOUT_SEC = float(os.getenv("BATCH_PIPELINE_TIMEOUT_SEC", "120"))
+# Clip per chiamata CREPE/OpenL3 e attesa massima per riempire un gruppo
+BATCH_MODEL_SIZE = int(os.getenv("BATCH_MODEL_SIZE", "8"))
+BATCH_MODEL_WAIT_SEC = float(os.getenv("BATCH_MODEL_WAIT_SEC", "2"))
+# Gruppi di inferenza in parallelo (>1 utile solo con EXECUTOR_MODE=process)
+BATCH_MODEL_WORKERS = int(os.getenv("BATCH_MODEL_WORKERS", "1"))
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".aac", ".flac", ".ogg", ".opus", ".webm", ".wma", ".aiff"}
+
+BATCH_FILES = REGISTRY.counter("singsync_batch_files_total", "File elaborati dai job batch", ("outcome",))
+
+
+def list_inputs(source: str) -> List[str]:
+    """
+    File audio di un job:
+      - cartella: scansione ricorsiva per estensione (ordine stabile)
+      - manifest: JSONL con {"path": ...} per riga oppure un path per riga
+    I path relativi del manifest sono risolti rispetto al manifest stesso.
+    """
+    if os.path.isdir(source):
+        found = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                    found.append(os.path.join(root, name))
+        return found
+
+    base = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = json.loads(line)["path"] if line.startswith("{") else line
+            paths.append(path if os.path.isabs(path) else os.path.join(base, path))
+    return paths
+
+
+def done_paths(output: str, retry_failed: bool = False) -> Set[str]:
+    """
+    Checkpoint: path già scritti nell'output JSONL (righe troncate ignorate).
+    Con `retry_failed` le righe non riuscite (ok = false) vengono rimosse
+    dall'output (riscritto atomicamente) e i relativi file rielaborati.
+    """
+    done = set()
+    if not os.path.exists(output):
+        return done
+    kept = []
+    with open(output, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+                path = row["path"]
+            except (ValueError, KeyError):
+                continue
+            if retry_failed and not row.get("ok"):
+                continue
+            done.add(path)
+            kept.append(line if line.endswith("\n") else line + "\n")
+    if retry_failed:
+        tmp = output + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(tmp, output)
+    return done
+
+
+def within_root(path: str, root: str = BATCH_ROOT) -> bool:
+    """True se `path` (risolti i symlink) sta sotto `root`."""
+    if not root:
+        return False
+    root = os.path.realpath(root)
+    return os.path.commonpath([root, os.path.realpath(path)]) == root
+
+
+def _warm_features(wav_path: str):
+    from audio_features import get_features
+
+    try:
+        get_features(wav_path)
+    except Exception:
+        pass   # l'errore riemerge (per file) in run_custom_batch
+
+
+async def _run_cpu_retry(fn, *args):
+    """Come CPU_EXECUTOR.run_cpu, ma attende se il pool è saturo (il batch cede il passo alle richieste online)."""
+    while True:
+        try:
+            return await CPU_EXECUTOR.run_cpu(fn, *args)
+        except CapacityError as exc:
+            await asyncio.sleep(exc.retry_after)
+
+
+class BatchJob:
+    """
+    Job di identificazione su molti file, a stadi in pipeline:
+      decode (ffmpeg, BATCH_DECODE_WORKERS) → riconoscimento remoto (ACRCloud/Whisper,
+      rate limit per upstream) + inferenza custom a gruppi (run_custom_batch) → fusione
+      → una riga JSONL per file, scritta e flushata appena pronta.
+    Ripartendo sullo stesso output i file già presenti vengono saltati
+    (con `retry_failed` solo quelli riusciti: gli altri vengono ritentati).
+    Il PCM decodificato è condiviso con le pipeline remote (prime_pcm): ogni
+    file passa da ffmpeg una sola volta.
+    """
+
+    def __init__(self, source: str, output: str, job_id: Optional[str] = None, retry_failed: bool = False):
+        self.id = job_id or str(uuid.uuid4())
+        self.source = source
+        self.output = output
+        self.retry_failed = retry_failed
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.total = 0
+        self.skipped = 0
+        self.done = 0
+        self.failed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self.sources = {source: PIPELINES.is_enabled(source) for source in ("acrcloud", "whisper_genius", "custom")}
+        self._buckets = {
+            "acrcloud": TokenBucket(BATCH_ACRCLOUD_RATE_PER_SEC, 1),
+            "whisper_genius": TokenBucket(BATCH_WHISPER_RATE_PER_SEC, 1),
+        }
+        self._remote_slots = asyncio.Semaphore(max(1, BATCH_REMOTE_CONCURRENCY))
+        self._in_flight = asyncio.Semaphore(max(1, BATCH_MAX_IN_FLIGHT))
+        self._custom_q: "asyncio.Queue" = asyncio.Queue()
+        self._out = None
+        self.task: Optional[asyncio.Task] = None
+
+    # ---------------- stadi ----------------
+
+    async def _remote(self, source: str, path: str, wav: str) -> Dict[str, Any]:
+        fn = PIPELINES.get(source)
+        await self._buckets[source].acquire()
+        async with self._remote_slots:
+            t0 = time.time()
+            try:
+                if peek_pcm(path) is None:
+                    # PCM uscito dalla LRU durante l'attesa: si rilegge il WAV decodificato, senza ffmpeg
+                    prime_pcm(path, await asyncio.to_thread(read_wav, wav))
+                res = await asyncio.wait_for(fn(path), timeout=BATCH_PIPELINE_TIMEOUT_SEC)
+            except asyncio.TimeoutError:
+                res = {"source": source, "ok": False, "error": "timeout"}
+            except Exception as e:
+                res = {"source": source, "ok": False, "error": str(e)}
+        res.setdefault("elapsed_sec", round(time.time() - t0, 2))
+        return res
+
+    async def _custom_batcher(self):
+        """Raccoglie fino a BATCH_MODEL_SIZE WAV (o attende BATCH_MODEL_WAIT_SEC) per chiamata ai modelli."""
+        from pipelines.pipeline_custom import run_custom_batch
+
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            first = await self._custom_q.get()
+            if first is None:
+                return
+            group = [first]
+            deadline = loop.time() + BATCH_MODEL_WAIT_SEC
+            while len(group) < BATCH_MODEL_SIZE:
+                try:
+                    item = await asyncio.wait_for(self._custom_q.get(), timeout=max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                group.append(item)
+
+            t0 = time.time()
+            try:
+                results = await _run_cpu_retry(run_custom_batch, [wav for wav, _ in group])
+            except Exception as e:
+                results = [{"source": "custom", "ok": False, "error": str(e)}] * len(group)
+            elapsed = round(time.time() - t0, 2)
+            for (_, fut), res in zip(group, results):
+                if not fut.done():
+                    fut.set_result({**res, "elapsed_sec": elapsed, "batch_size": len(group)})
+
+    async def _process(
+        self, path: str, wav: Optional[str], error: Optional[str], t0: float, decision: Optional[Dict[str, Any]] = None
+    ):
+        """Riconoscimento + fusione di un file già decodificato; scrive la sua riga JSONL."""
+        try:
+            results: List[Dict[str, Any]] = []
+            if wav is not None:
+                stages, gated = apply_gate([[s for s, on in self.sources.items() if on]], decision)
+                sources = stages[0] if stages else []
+                results = [
+                    {"source": source, "ok": False, "skipped": True, "reason": f"gate:{decision['label']}"}
+                    for source in gated
+                ]
+                waits = [self._remote(src, path, wav) for src in ("acrcloud", "whisper_genius") if src in sources]
+                if "custom" in sources:
+                    fut = asyncio.get_running_loop().create_future()
+                    await self._custom_q.put((wav, fut))
+                    waits.append(fut)
+                results += list(await asyncio.gather(*waits))
+
+            fusion = Fusion()
+            for res in results:
+                fusion.add(res)
+            ranked = fusion.ranked()
+            ok = error is None and any(r.get("ok") for r in results)
+            self._write({
+                "path": path,
+                "ok": ok,
+                "error": error,
+                "best": ranked[0] if ranked else None,
+                "fused": ranked,
+                "gate": decision,
+                "results": results,
+                "elapsed_sec": round(time.time() - t0, 2),
+            })
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+            BATCH_FILES.inc(outcome="ok" if ok else "failed")
+        finally:
+            if wav is not None:
+                try:
+                    os.remove(wav)
+                except Exception:
+                    pass
+            self._in_flight.release()
+
+    async def _decode_worker(self, paths: "asyncio.Queue", tasks: List["asyncio.Task"]):
+        while True:
+            path = await paths.get()
+            if path is None:
+                return
+            await self._in_flight.acquire()
+            t0 = time.time()
+            wav, error, decision = None, None, None
+            try:
+                pcm = await decode_pcm_16k_mono(path)
+                # le pipeline remote (clip ACRCloud/Whisper) ritrovano questo PCM invece di ridecodificare
+                prime_pcm(path, pcm)
+                fd, wav = tempfile.mkstemp(suffix=".wav")
+                os.close(fd)
+                await asyncio.to_thread(write_wav, pcm, wav)
+                if GATE_ENABLED:
+                    # PCM già in memoria: il gate costa solo una STFT
+                    try:
+                        decision = await _run_cpu_retry(classify_pcm, pcm)
+                        GATE_DECISIONS.inc(label=decision["label"])
+                    except Exception:
+                        decision = None
+                gated_out = decision is not None and decision["run"] is not None and "custom" not in decision["run"]
+                if self.sources["custom"] and CPU_EXECUTOR.mode == "thread" and not gated_out:
+                    # feature (STFT/CQT) calcolate qui, in parallelo all'inferenza del gruppo precedente:
+                    # run_custom_batch le ritrova nella LRU di processo (FEATURE_CACHE_MAX_ITEMS)
+                    await _run_cpu_retry(_warm_features, wav)
+            except Exception as e:
+                error = f"decode_failed: {e}"
+                if wav is not None:
+                    os.remove(wav)
+                    wav = None
+            # il prossimo file si decodifica mentre questo attende le API e i modelli
+            tasks.append(asyncio.create_task(self._process(path, wav, error, t0, decision)))
+
+    def _write(self, row: Dict[str, Any]):
+        self._out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._out.flush()
+
+    # ---------------- job ----------------
+
+    async def run(self):
+        self.status = "running"
+        self.started_at = time.time()
+        try:
+            pending = done_paths(self.output, self.retry_failed)
+            paths = [p for p in list_inputs(self.source) if p not in pending]
+            self.total = len(paths) + len(pending)
+            self.skipped = len(pending)
+
+            queue: "asyncio.Queue" = asyncio.Queue()
+            for p in paths:
+                queue.put_nowait(p)
+            n_decoders = max(1, BATCH_DECODE_WORKERS)
+            for _ in range(n_decoders):
+                queue.put_nowait(None)
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.output)), exist_ok=True)
+            with open(self.output, "a", encoding="utf-8") as self._out:
+                n_batchers = max(1, BATCH_MODEL_WORKERS) if self.sources["custom"] else 0
+                batchers = [asyncio.create_task(self._custom_batcher()) for _ in range(n_batchers)]
+                tasks: List[asyncio.Task] = []
+                try:
+                    await asyncio.gather(*(self._decode_worker(queue, tasks) for _ in range(n_decoders)))
+                    await asyncio.gather(*tasks)
+                finally:
+                    for _ in batchers:
+                        await self._custom_q.put(None)
+                    for t in tasks + batchers:
+                        t.cancel()
+                    await asyncio.gather(*tasks, *batchers, return_exceptions=True)
+            self.status = "done"
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+            raise
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        processed = self.done + self.failed
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "source": self.source,
+            "output": self.output,
+            "retry_failed": self.retry_failed,
+            "total": self.total,
+            "skipped": self.skipped,
+            "done": self.done,
+            "failed": self.failed,
+            "elapsed_sec": round(elapsed, 2),
+            "files_per_sec": round(processed / elapsed, 3) if elapsed else 0.0,
+        }
+
+
+# job avviati via API (in memoria, per processo)
+BATCH_JOBS: Dict[str, BatchJob] = {}
@@ -0,0 +1,96 @@
+import os
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Tuple
+
+import numpy as np
+
+from utils.audio import FFMPEG_BIN, PCM_SR, get_pcm, pcm_to_float32, ffmpeg_slots
+from utils.metrics import span
+
+CLIP_ENABLED = os.getenv("CLIP_ENABLED", "1") == "1"
+# Finestra inviata ad ACRCloud (s) e a Whisper (s)
+ACR_CLIP_SEC = float(os.getenv("ACR_CLIP_SEC", "12"))
+WHISPER_CLIP_SEC = float(os.getenv("WHISPER_CLIP_SEC", "30"))
+# opus (default, .ogg) | mp3
+CLIP_FORMAT = os.getenv("CLIP_FORMAT", "opus")
+
+_ENCODERS = {
+    "opus": (".ogg", ["-c:a", "libopus", "-b:a", "24k", "-application", "audio"]),
+    "mp3": (".mp3", ["-c:a", "libmp3lame", "-b:a", "48k"]),
+}
+
+
+def best_window(pcm: np.ndarray, window_sec: float, vocal: bool = False) -> Tuple[int, int]:
+    """
+    Finestra [start, end) (in campioni) più informativa:
+    massima energia RMS, pesata per la quota di banda vocale se `vocal`.
+    """
+    from audio_features import energy_profile, HOP
+
+    rms, vocal_ratio = energy_profile(pcm_to_float32(pcm), PCM_SR)
+    score = rms * vocal_ratio if vocal else rms
+    win = max(1, int(window_sec * PCM_SR / HOP))
+    if score.size <= win:
+        return 0, pcm.size
+    csum = np.concatenate([[0.0], np.cumsum(score)])
+    start_frame = int(np.argmax(csum[win:] - csum[:-win]))
+    start = start_frame * HOP
+    return start, min(pcm.size, start + int(window_sec * PCM_SR))
+
+
+async def encode_pcm(pcm: np.ndarray, out_path: str, fmt: str = CLIP_FORMAT):
+    """Codifica PCM 16k mono in formato compatto via ffmpeg (stdin in pipe)."""
+    _, codec_args = _ENCODERS.get(fmt, _ENCODERS["opus"])
+    cmd = [
+        FFMPEG_BIN, "-hide_banner", "-y",
+        "-f", "s16le", "-ar", str(PCM_SR), "-ac", "1", "-i", "pipe:0",
+        *codec_args, out_path,
+    ]
+    async with ffmpeg_slots():
+        with span("clip_encode"):
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, err = await proc.communicate(pcm.tobytes())
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg encode failed: {err.decode(errors='ignore')[-400:]}")
+
+
+@asynccontextmanager
+async def trimmed_clip(path: str, window_sec: float, vocal: bool = False) -> AsyncIterator[str]:
+    """
+    Path da inviare a un'API remota: la finestra migliore di `window_sec`
+    ricodificata mono 16 kHz (Opus/MP3). Se il file è già corto, o qualcosa
+    fallisce, ritorna il file originale. Il file temporaneo viene rimosso all'uscita.
+    """
+    out_path = None
+    try:
+        if CLIP_ENABLED and window_sec > 0:
+            pcm = await get_pcm(path)
+            if pcm.size > window_sec * PCM_SR:
+                start, end = await asyncio.to_thread(best_window, pcm, window_sec, vocal)
+                ext, _ = _ENCODERS.get(CLIP_FORMAT, _ENCODERS["opus"])
+                fd, out_path = tempfile.mkstemp(suffix=ext)
+                os.close(fd)
+                await encode_pcm(pcm[start:end], out_path)
+    except Exception:
+        if out_path:
+            try:
+                os.remove(out_path)
+            except Exception:
+                pass
+        out_path = None
+
+    try:
+        yield out_path or path
+    finally:
+        if out_path:
+            try:
+                os.remove(out_path)
+            except Exception:
+                pass
@@ -0,0 +1,352 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "")
+# Quantizzazione su disco: int8 (scala per riga, 1 byte/dim) o float16 (2 byte/dim)
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "int8")
+# Peso del chroma medio (armonia) rispetto all'embedding OpenL3 (timbro) nel vettore
+EMBEDDING_CHROMA_WEIGHT = float(os.getenv("EMBEDDING_CHROMA_WEIGHT", "0.5"))
+# Righe dequantizzate per passata di ricerca (limita la memoria per worker)
+EMBEDDING_SEARCH_BLOCK = int(os.getenv("EMBEDDING_SEARCH_BLOCK", "16384"))
+# Crescita del file vettori (righe preallocate per volta)
+EMBEDDING_GROW_ROWS = int(os.getenv("EMBEDDING_GROW_ROWS", "65536"))
+# IVF: liste visitate per query e righe minime perché l'indice approssimato sia usato
+EMBEDDING_NPROBE = int(os.getenv("EMBEDDING_NPROBE", "8"))
+EMBEDDING_IVF_MIN_ROWS = int(os.getenv("EMBEDDING_IVF_MIN_ROWS", "200000"))
+
+
+def _unit(v) -> np.ndarray:
+    v = np.asarray(v, dtype=np.float32).ravel()
+    return v / (np.linalg.norm(v) + 1e-9)
+
+
+def embedding_vector(emb_mean, chroma_mean) -> np.ndarray:
+    """Vettore "sounds like": OpenL3 medio + chroma medio (peso EMBEDDING_CHROMA_WEIGHT), norma 1."""
+    return _unit(np.concatenate([_unit(emb_mean), EMBEDDING_CHROMA_WEIGHT * _unit(chroma_mean)]))
+
+
+class EmbeddingStore:
+    """
+    Vettori a norma 1 (prodotto scalare = coseno) in array memory-mapped:
+      - vectors.bin: righe int8 (scala per riga in scales.bin) o float16, file a capacità crescente
+      - alive.bin: 1 byte per riga; la cancellazione azzera il flag (nessun rebuild)
+      - items.sqlite: metadati per id, letti solo per i top-k (RSS indipendente dal catalogo)
+      - store.json: dimensione, dtype, righe scritte, stato IVF (scritto per ultimo, atomico)
+      - ivf_*: indice IVF opzionale (centroidi k-means + liste invertite), vedi `train_ivf`
+    Un solo processo scrittore (CLI); i lettori rimappano quando cambia store.json.
+    """
+
+    def __init__(self, path: str, dim: Optional[int] = None, dtype: str = EMBEDDING_DTYPE, writable: bool = False):
+        self.path = path
+        self.writable = writable
+        self._lock = threading.Lock()
+        self._meta_path = os.path.join(path, "store.json")
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self.meta: Dict[str, Any] = json.load(f)
+        elif writable and dim:
+            os.makedirs(path, exist_ok=True)
+            self.meta = {"dim": dim, "dtype": dtype, "count": 0, "capacity": 0, "deleted": 0,
+                         "ivf_lists": 0, "ivf_trained": 0}
+            self._save_meta()
+        else:
+            raise FileNotFoundError(self._meta_path)
+
+        self._db = sqlite3.connect(os.path.join(path, "items.sqlite"), timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "id INTEGER PRIMARY KEY, key TEXT UNIQUE, title TEXT, artist TEXT, url TEXT)"
+        )
+        self._db.commit()
+        self._meta_mtime = os.stat(self._meta_path).st_mtime_ns
+        self._map()
+
+    # ---------------- layout su disco ----------------
+
+    @property
+    def dim(self) -> int:
+        return self.meta["dim"]
+
+    @property
+    def count(self) -> int:
+        return self.meta["count"]
+
+    @property
+    def quantized(self) -> bool:
+        return self.meta["dtype"] == "int8"
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _memmap(self, name: str, dtype, shape):
+        if not self.meta["capacity"]:
+            return None
+        return np.memmap(self._file(name), dtype=dtype, mode="r+" if self.writable else "r", shape=shape)
+
+    def _map(self):
+        cap = self.meta["capacity"]
+        self._vec = self._memmap("vectors.bin", self.meta["dtype"], (cap, self.dim))
+        self._scales = self._memmap("scales.bin", np.float32, (cap,)) if self.quantized else None
+        self._alive = self._memmap("alive.bin", np.uint8, (cap,))
+        self._centroids = self._order = self._offsets = self._assign = None
+        if self.meta["ivf_lists"]:
+            self._centroids = np.load(self._file("ivf_centroids.npy"))
+            self._order = np.load(self._file("ivf_order.npy"), mmap_mode="r")
+            self._offsets = np.load(self._file("ivf_offsets.npy"))
+            self._assign = self._memmap("ivf_assign.bin", np.int32, (cap,))
+
+    def _grow(self, rows: int):
+        """Estende i file a capacità ≥ rows (a blocchi di EMBEDDING_GROW_ROWS) e rimappa."""
+        cap = self.meta["capacity"]
+        new_cap = max(rows, cap + EMBEDDING_GROW_ROWS)
+        files = [("vectors.bin", np.dtype(self.meta["dtype"]).itemsize * self.dim), ("alive.bin", 1)]
+        if self.quantized:
+            files.append(("scales.bin", 4))
+        if self.meta["ivf_lists"]:
+            files.append(("ivf_assign.bin", 4))
+        self._flush()
+        self._vec = self._scales = self._alive = self._assign = None
+        for name, row_bytes in files:
+            with open(self._file(name), "ab") as f:
+                f.truncate(new_cap * row_bytes)
+        self.meta["capacity"] = new_cap
+        self._map()
+
+    def _flush(self):
+        for arr in (self._vec, self._scales, self._alive, self._assign):
+            if arr is not None:
+                arr.flush()
+
+    def _save_meta(self):
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._meta_path)
+
+    def _refresh(self):
+        """Lettori: rimappa se lo scrittore ha aggiunto righe, cancellato o riaddestrato l'IVF."""
+        if self.writable:
+            return
+        mtime = os.stat(self._meta_path).st_mtime_ns
+        if mtime != self._meta_mtime:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+            self._meta_mtime = mtime
+            self._map()
+
+    # ---------------- scrittura ----------------
+
+    def add(self, items: Sequence[Dict[str, Any]], vectors: np.ndarray) -> List[int]:
+        """
+        Aggiunge vettori (n, dim) con metadati {key, title, artist, url}.
+        Una key già presente viene sostituita (vecchia riga marcata come cancellata).
+        """
+        V = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            self._delete_keys([it["key"] for it in items])
+            start, n = self.count, len(items)
+            if start + n > self.meta["capacity"]:
+                self._grow(start + n)
+            end = start + n
+            if self.quantized:
+                scale = np.abs(V).max(axis=1) / 127.0
+                scale[scale == 0] = 1.0
+                self._vec[start:end] = np.round(V / scale[:, None]).astype(np.int8)
+                self._scales[start:end] = scale
+            else:
+                self._vec[start:end] = V.astype(np.float16)
+            self._alive[start:end] = 1
+            if self._centroids is not None:
+                # nuove righe nella "coda" IVF: assegnate alla lista più vicina, senza riordinare
+                self._assign[start:end] = np.argmax(V @ self._centroids.T, axis=1)
+            self._flush()
+            ids = list(range(start, end))
+            self._db.executemany(
+                "INSERT INTO items (id, key, title, artist, url) VALUES (?, ?, ?, ?, ?)",
+                [(i, it["key"], it.get("title", ""), it.get("artist", ""), it.get("url", "")) for i, it in zip(ids, items)],
+            )
+            self._db.commit()
+            self.meta["count"] = end
+            self._save_meta()
+        return ids
+
+    def _delete_keys(self, keys: Sequence[str]) -> int:
+        ids = []
+        for key in keys:
+            row = self._db.execute("SELECT id FROM items WHERE key = ?", (key,)).fetchone()
+            if row:
+                ids.append(row[0])
+        if not ids:
+            return 0
+        self._alive[ids] = 0
+        self._alive.flush()
+        self._db.executemany("DELETE FROM items WHERE id = ?", [(i,) for i in ids])
+        self._db.commit()
+        self.meta["deleted"] += len(ids)
+        return len(ids)
+
+    def delete(self, keys: Sequence[str]) -> int:
+        """Cancella per key (la riga resta nel file, esclusa dalle ricerche)."""
+        with self._lock:
+            n = self._delete_keys(keys)
+            if n:
+                self._save_meta()
+        return n
+
+    def has_key(self, key: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM items WHERE key = ?", (key,)).fetchone() is not None
+
+    def train_ivf(self, n_lists: int, iters: int = 10, sample: int = 64, seed: int = 0) -> int:
+        """
+        K-means sferico su un campione (≤ sample × n_lists righe), poi assegna tutte le righe
+        e salva le liste invertite ordinate. Le righe aggiunte dopo restano in coda (assegnate
+        ma non ordinate) fino al prossimo training.
+        """
+        with self._lock:
+            n = self.count
+            if n == self.meta["deleted"]:
+                raise ValueError("store vuoto: niente da addestrare")
+            rng = np.random.default_rng(seed)
+            ids = np.sort(rng.choice(n, size=min(n, sample * n_lists), replace=False))
+            ids = ids[np.asarray(self._alive[ids]) == 1]
+            X = self._rows(ids)
+            n_lists = max(1, min(n_lists, len(X)))
+            C = X[rng.choice(len(X), n_lists, replace=False)].copy()
+            for _ in range(iters):
+                a = np.argmax(X @ C.T, axis=1)
+                sums = np.zeros_like(C)
+                np.add.at(sums, a, X)
+                norms = np.linalg.norm(sums, axis=1)
+                filled = norms > 0
+                C[filled] = sums[filled] / norms[filled, None]
+
+            assign = np.empty(n, dtype=np.int32)
+            for lo in range(0, n, EMBEDDING_SEARCH_BLOCK):
+                hi = min(n, lo + EMBEDDING_SEARCH_BLOCK)
+                assign[lo:hi] = np.argmax(self._rows(np.arange(lo, hi)) @ C.T, axis=1)
+
+            with open(self._file("ivf_assign.bin"), "wb") as f:
+                f.truncate(self.meta["capacity"] * 4)
+            mm = np.memmap(self._file("ivf_assign.bin"), dtype=np.int32, mode="r+", shape=(self.meta["capacity"],))
+            mm[:n] = assign
+            mm.flush()
+            del mm
+            np.save(self._file("ivf_centroids.npy"), C.astype(np.float32))
+            np.save(self._file("ivf_order.npy"), np.argsort(assign, kind="stable").astype(np.int64))
+            np.save(self._file("ivf_offsets.npy"), np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))]))
+            self.meta["ivf_lists"] = n_lists
+            self.meta["ivf_trained"] = n
+            self._save_meta()
+            self._map()
+        return n_lists
+
+    # ---------------- ricerca ----------------
+
+    def _rows(self, ids: np.ndarray) -> np.ndarray:
+        """Righe dequantizzate in float32 (ids ordinati → letture sequenziali dal memmap)."""
+        X = np.asarray(self._vec[ids], dtype=np.float32)
+        if self.quantized:
+            X *= np.asarray(self._scales[ids])[:, None]
+        return X
+
+    def _scores(self, Q: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """Similarità (q, len(ids)); righe cancellate a -inf."""
+        s = Q @ self._rows(ids).T
+        s[:, np.asarray(self._alive[ids]) == 0] = -np.inf
+        return s
+
+    def _top_k(self, Q: np.ndarray, candidates: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k esatto su `candidates`, a blocchi di EMBEDDING_SEARCH_BLOCK righe."""
+        best_s = np.empty((len(Q), 0), dtype=np.float32)
+        best_i = np.empty((len(Q), 0), dtype=np.int64)
+        for lo in range(0, len(candidates), EMBEDDING_SEARCH_BLOCK):
+            ids = candidates[lo:lo + EMBEDDING_SEARCH_BLOCK]
+            cand_s = np.concatenate([best_s, self._scores(Q, ids)], axis=1)
+            cand_i = np.concatenate([best_i, np.broadcast_to(ids, (len(Q), ids.size))], axis=1)
+            if cand_s.shape[1] > k:
+                part = np.argpartition(-cand_s, k - 1, axis=1)[:, :k]
+                cand_s = np.take_along_axis(cand_s, part, axis=1)
+                cand_i = np.take_along_axis(cand_i, part, axis=1)
+            best_s, best_i = cand_s, cand_i
+        order = np.argsort(-best_s, axis=1)
+        return np.take_along_axis(best_s, order, axis=1), np.take_along_axis(best_i, order, axis=1)
+
+    def _ivf_candidates(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        lists = np.argsort(-(self._centroids @ q))[:nprobe]
+        parts = [np.asarray(self._order[self._offsets[l]:self._offsets[l + 1]]) for l in lists]
+        trained, n = self.meta["ivf_trained"], self.count
+        if n > trained:
+            tail = np.asarray(self._assign[trained:n])
+            parts.append(trained + np.nonzero(np.isin(tail, lists))[0])
+        return np.sort(np.concatenate(parts))
+
+    def search(self, queries: np.ndarray, top_k: int = 10, nprobe: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Vicini più simili per ogni query (q, dim): scansione esatta a prodotti matriciali
+        per blocchi, oppure IVF (nprobe liste) se addestrato e il catalogo supera
+        EMBEDDING_IVF_MIN_ROWS.
+        """
+        with self._lock:
+            self._refresh()
+            Q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+            n = self.count
+            if n == 0 or top_k <= 0:
+                return [[] for _ in Q]
+            nprobe = EMBEDDING_NPROBE if nprobe is None else nprobe
+            if self._centroids is not None and nprobe > 0 and n >= EMBEDDING_IVF_MIN_ROWS:
+                found = [self._top_k(q[None, :], self._ivf_candidates(q, nprobe), top_k) for q in Q]
+            else:
+                s, i = self._top_k(Q, np.arange(n), top_k)
+                found = [(s[r:r + 1], i[r:r + 1]) for r in range(len(Q))]
+            return [self._describe(s[0], i[0]) for s, i in found]
+
+    def _describe(self, scores: np.ndarray, ids: np.ndarray) -> List[Dict[str, Any]]:
+        keep = np.isfinite(scores)
+        scores, ids = scores[keep], ids[keep]
+        if not ids.size:
+            return []
+        marks = ",".join("?" * ids.size)
+        rows = {
+            r[0]: r for r in self._db.execute(
+                f"SELECT id, key, title, artist, url FROM items WHERE id IN ({marks})", ids.tolist()
+            )
+        }
+        out = []
+        for i, s in zip(ids.tolist(), scores.tolist()):
+            if i not in rows:
+                continue
+            _, key, title, artist, url = rows[i]
+            out.append({"title": title, "artist": artist, "url": url or "", "key": key, "similarity": round(s, 3)})
+        return out
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "dim": self.dim,
+            "dtype": self.meta["dtype"],
+            "rows": self.count,
+            "alive": self.count - self.meta["deleted"],
+            "ivf_lists": self.meta["ivf_lists"],
+            "ivf_untrained_rows": self.count - self.meta["ivf_trained"] if self.meta["ivf_lists"] else 0,
+        }
+
+
+_STORE: Optional[EmbeddingStore] = None
+
+
+def get_embedding_store() -> Optional[EmbeddingStore]:
+    """Store aperto (sola lettura) una volta per processo da EMBEDDING_STORE_DIR (None se assente)."""
+    global _STORE
+    if _STORE is None and EMBEDDING_STORE_DIR and os.path.exists(os.path.join(EMBEDDING_STORE_DIR, "store.json")):
+        try:
+            _STORE = EmbeddingStore(EMBEDDING_STORE_DIR)
+        except Exception as e:
+            print(f"⚠️  Store embedding non disponibile: {e}")
+    return _STORE
@@ -0,0 +1,141 @@
+import os
+import asyncio
+import contextvars
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from utils.metrics import REGISTRY
+
+# thread (default) | process
+EXECUTOR_MODE = os.getenv("EXECUTOR_MODE", "thread")
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+# Task CPU in attesa oltre a quelli in esecuzione (oltre → 503)
+CPU_QUEUE_MAX = int(os.getenv("CPU_QUEUE_MAX", str(CPU_WORKERS * 2)))
+CPU_TASK_TIMEOUT_SEC = float(os.getenv("CPU_TASK_TIMEOUT_SEC", "120"))
+
+
+class CapacityError(RuntimeError):
+    """Pool CPU saturo: la richiesta va rifiutata con 503."""
+
+    def __init__(self, retry_after: int = 5):
+        super().__init__("cpu_pool_full")
+        self.retry_after = retry_after
+
+
+def _init_worker():
+    """Initializer dei processi worker: precarica i modelli della pipeline custom."""
+    if os.getenv("ENABLE_CUSTOM", "0") == "1":
+        from utils.models import MODELS
+        MODELS.load()
+
+
+class CpuExecutor:
+    """
+    Esecuzione dei task CPU-bound (librosa, CREPE, OpenL3):
+      - mode "process": ProcessPoolExecutor (spawn) con modelli precaricati per worker
+      - mode "thread": ThreadPoolExecutor dedicato (contesto copiato come asyncio.to_thread)
+    In entrambi i casi limita i task in volo a CPU_WORKERS + CPU_QUEUE_MAX. Lo slot
+    si libera quando il job finisce davvero: un task scaduto (timeout) continua a
+    occupare il pool e resta contato in `in_flight` (e in `abandoned`).
+    """
+
+    def __init__(self, mode: str, workers: int, queue_max: int, timeout_sec: float):
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.queue_max = max(0, queue_max)
+        self.timeout_sec = timeout_sec
+        self.in_flight = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.abandoned = 0
+        self._pool: Optional[Executor] = None
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_max
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < self.capacity
+
+    def start(self):
+        if self._pool is not None:
+            return
+        if self.mode == "process":
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cpu")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _release(self, job: Dict[str, bool]):
+        self.in_flight -= 1
+        if job["timed_out"]:
+            self.abandoned -= 1
+
+    async def run_cpu(self, fn: Callable[..., Any], *args) -> Any:
+        """Esegue `fn(*args)` sul backend CPU; CapacityError se saturo, TimeoutError oltre il limite."""
+        if not self.has_capacity():
+            self.rejected += 1
+            raise CapacityError()
+        self.start()
+        loop = asyncio.get_running_loop()
+        if self.mode == "process":
+            cf: Future = self._pool.submit(fn, *args)
+        else:
+            cf = self._pool.submit(contextvars.copy_context().run, fn, *args)
+        self.in_flight += 1
+        job = {"timed_out": False}
+        def done(_):
+            # gira nel thread del worker (o subito, se il job è già concluso)
+            try:
+                loop.call_soon_threadsafe(self._release, job)
+            except RuntimeError:
+                pass  # loop già chiuso (shutdown)
+
+        cf.add_done_callback(done)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(cf), timeout=self.timeout_sec)
+        except asyncio.TimeoutError:
+            # se il job non è ancora partito wrap_future lo ha cancellato; altrimenti gira fino in fondo
+            if not cf.done():
+                job["timed_out"] = True
+                self.abandoned += 1
+            self.timeouts += 1
+            raise
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "capacity": self.capacity,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "abandoned": self.abandoned,
+        }
+
+
+CPU_EXECUTOR = CpuExecutor(EXECUTOR_MODE, CPU_WORKERS, CPU_QUEUE_MAX, CPU_TASK_TIMEOUT_SEC)
+
+REGISTRY.gauge("singsync_cpu_pool_in_flight", "Task CPU in esecuzione o in coda", fn=lambda: CPU_EXECUTOR.in_flight)
+REGISTRY.gauge("singsync_cpu_pool_capacity", "Task CPU ammessi (worker + coda)", fn=lambda: CPU_EXECUTOR.capacity)
+REGISTRY.gauge("singsync_cpu_pool_rejected", "Task CPU rifiutati per pool saturo", fn=lambda: CPU_EXECUTOR.rejected)
+REGISTRY.gauge("singsync_cpu_pool_timeouts", "Task CPU oltre CPU_TASK_TIMEOUT_SEC", fn=lambda: CPU_EXECUTOR.timeouts)
+REGISTRY.gauge(
+    "singsync_cpu_pool_abandoned", "Task CPU scaduti ma ancora in esecuzione (slot occupato)", fn=lambda: CPU_EXECUTOR.abandoned
+)
+IO_IN_FLIGHT = REGISTRY.gauge("singsync_io_pool_in_flight", "Task I/O sincroni nel thread pool")
+
+
+async def run_io(fn: Callable[..., Any], *args) -> Any:
+    """Task I/O-bound sincroni: thread pool di default."""
+    with IO_IN_FLIGHT.track():
+        return await asyncio.to_thread(fn, *args)
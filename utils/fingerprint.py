@@ -0,0 +1,186 @@
+import os
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Parametri landmark (stile "constellation map")
+FP_SR = 16000
+FP_N_FFT = 1024
+FP_HOP = 256                # ~16 ms per frame
+FP_PEAK_NEIGHBORHOOD = 15   # finestra (freq x tempo) per massimi locali
+FP_FAN_OUT = 8              # coppie per ancora
+FP_MAX_DT = 63              # distanza massima in frame (6 bit)
+FP_MIN_MATCHES = int(os.getenv("FP_MIN_MATCHES", "8"))
+FP_CONFIDENT_MATCHES = int(os.getenv("FP_CONFIDENT_MATCHES", "50"))
+
+AUDIO_EXTS = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".aac"}
+
+
+def compute_landmarks(y: np.ndarray, sr: int = FP_SR) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Estrae gli hash landmark (f1, f2, dt) da un segnale mono.
+    Ritorna (hashes uint32, offsets uint32 in frame dell'ancora).
+    """
+    import librosa
+
+    if sr != FP_SR:
+        y = librosa.resample(y, orig_sr=sr, target_sr=FP_SR)
+    if y.size < FP_N_FFT:
+        return np.empty(0, np.uint32), np.empty(0, np.uint32)
+    return landmarks_from_stft(np.abs(librosa.stft(y, n_fft=FP_N_FFT, hop_length=FP_HOP)))
+
+
+def landmarks_from_stft(S: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Come `compute_landmarks`, ma da una |STFT| già calcolata
+    (n_fft=1024, hop=256 a 16 kHz, es. FeatureBundle.S).
+    """
+    from scipy.ndimage import maximum_filter
+
+    S = np.log1p(S[:512] * 1000.0)
+
+    local_max = maximum_filter(S, size=FP_PEAK_NEIGHBORHOOD) == S
+    peaks = local_max & (S > S.mean() + S.std())
+    freqs, times = np.nonzero(peaks)
+    if times.size < 2:
+        return np.empty(0, np.uint32), np.empty(0, np.uint32)
+
+    order = np.argsort(times, kind="stable")
+    freqs, times = freqs[order].astype(np.uint32), times[order].astype(np.uint32)
+
+    hashes, offsets = [], []
+    n = times.size
+    for k in range(1, FP_FAN_OUT + 1):
+        if k >= n:
+            break
+        dt = times[k:] - times[:-k]
+        ok = (dt > 0) & (dt <= FP_MAX_DT)
+        f1, f2, t1 = freqs[:-k][ok], freqs[k:][ok], times[:-k][ok]
+        hashes.append((f1 << 15) | (f2 << 6) | dt[ok])
+        offsets.append(t1)
+    return np.concatenate(hashes).astype(np.uint32), np.concatenate(offsets).astype(np.uint32)
+
+
+def _track_meta(path: str) -> Dict[str, str]:
+    """Metadati dal nome file: 'Artista - Titolo.ext' (altrimenti solo titolo)."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if " - " in stem:
+        artist, title = stem.split(" - ", 1)
+        return {"title": title.strip(), "artist": artist.strip(), "file": os.path.basename(path)}
+    return {"title": stem, "artist": "", "file": os.path.basename(path)}
+
+
+def build_index(audio_dir: str, out_dir: str, verbose: bool = True) -> int:
+    """
+    Costruisce l'indice fingerprint da una cartella di brani di riferimento.
+    Salva array .npy ordinati per hash (caricabili in mmap) + tracks.json.
+    """
+    import librosa
+
+    os.makedirs(out_dir, exist_ok=True)
+    tracks: List[Dict[str, str]] = []
+    all_h, all_t, all_o = [], [], []
+
+    files = sorted(
+        os.path.join(root, f)
+        for root, _, names in os.walk(audio_dir)
+        for f in names
+        if os.path.splitext(f)[1].lower() in AUDIO_EXTS
+    )
+    for path in files:
+        try:
+            y, sr = librosa.load(path, sr=FP_SR, mono=True)
+            h, o = compute_landmarks(librosa.util.normalize(y), sr)
+        except Exception as e:
+            if verbose:
+                print(f"⚠️  {path}: {e}")
+            continue
+        tid = len(tracks)
+        tracks.append(_track_meta(path))
+        all_h.append(h)
+        all_o.append(o)
+        all_t.append(np.full(h.size, tid, dtype=np.uint32))
+        if verbose:
+            print(f"✅ [{tid}] {tracks[-1]['artist']} - {tracks[-1]['title']} ({h.size} hash)")
+
+    hashes = np.concatenate(all_h) if all_h else np.empty(0, np.uint32)
+    order = np.argsort(hashes, kind="stable")
+    np.save(os.path.join(out_dir, "hashes.npy"), hashes[order])
+    np.save(os.path.join(out_dir, "track_ids.npy"), (np.concatenate(all_t) if all_t else np.empty(0, np.uint32))[order])
+    np.save(os.path.join(out_dir, "offsets.npy"), (np.concatenate(all_o) if all_o else np.empty(0, np.uint32))[order])
+    with open(os.path.join(out_dir, "tracks.json"), "w", encoding="utf-8") as f:
+        json.dump(tracks, f, ensure_ascii=False)
+    return len(tracks)
+
+
+class FingerprintIndex:
+    """Indice landmark in sola lettura, memory-mapped (condiviso tra worker via page cache)."""
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.hashes = np.load(os.path.join(index_dir, "hashes.npy"), mmap_mode="r")
+        self.track_ids = np.load(os.path.join(index_dir, "track_ids.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(index_dir, "offsets.npy"), mmap_mode="r")
+        with open(os.path.join(index_dir, "tracks.json"), "r", encoding="utf-8") as f:
+            self.tracks: List[Dict[str, str]] = json.load(f)
+
+    def query(self, y: np.ndarray, sr: int, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Ritorna i brani più probabili con numero di hash allineati e confidenza."""
+        return self._match(*compute_landmarks(y, sr), top_k=top_k)
+
+    def query_stft(self, S: np.ndarray, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Come `query`, riusando una |STFT| già calcolata (FeatureBundle.S)."""
+        return self._match(*landmarks_from_stft(S), top_k=top_k)
+
+    def _match(self, qh: np.ndarray, qo: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        if qh.size == 0 or self.hashes.size == 0:
+            return []
+
+        lo = np.searchsorted(self.hashes, qh, side="left")
+        hi = np.searchsorted(self.hashes, qh, side="right")
+        n = hi - lo
+        total = int(n.sum())
+        if total == 0:
+            return []
+
+        # espansione vettoriale dei range [lo, hi) per ogni hash della query
+        q_idx = np.repeat(np.arange(qh.size), n)
+        db_idx = np.repeat(lo, n) + (np.arange(total) - np.repeat(np.cumsum(n) - n, n))
+
+        tids = np.asarray(self.track_ids[db_idx], dtype=np.int64)
+        delta = np.asarray(self.offsets[db_idx], dtype=np.int64) - qo[q_idx].astype(np.int64)
+        keys = (tids << 32) | (delta & 0xFFFFFFFF)
+        uniq, counts = np.unique(keys, return_counts=True)
+
+        # per ogni brano: il picco dell'istogramma degli offset allineati
+        best: Dict[int, int] = {}
+        for key, c in zip((uniq >> 32).tolist(), counts.tolist()):
+            if c > best.get(key, 0):
+                best[key] = c
+
+        ranked = sorted(best.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+        out = []
+        for tid, score in ranked:
+            if score < FP_MIN_MATCHES:
+                continue
+            meta = self.tracks[tid]
+            out.append({
+                "title": meta.get("title", ""),
+                "artist": meta.get("artist", ""),
+                "matches": int(score),
+                "confidence": round(min(1.0, score / FP_CONFIDENT_MATCHES), 2),
+            })
+        return out
+
+
+_INDEX: Optional[FingerprintIndex] = None
+
+
+def get_fingerprint_index() -> Optional[FingerprintIndex]:
+    """Indice caricato una volta per processo da FINGERPRINT_INDEX_DIR (None se assente)."""
+    global _INDEX
+    index_dir = os.getenv("FINGERPRINT_INDEX_DIR", "")
+    if _INDEX is None and index_dir and os.path.exists(os.path.join(index_dir, "hashes.npy")):
+        _INDEX = FingerprintIndex(index_dir)
+    return _INDEX
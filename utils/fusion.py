@@ -0,0 +1,132 @@
+import os
+import re
+import json
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional
+
+from utils.genius_search import normalize_query
+
+# Affidabilità per sorgente (moltiplica la confidenza dichiarata dalla pipeline)
+SOURCE_WEIGHTS: Dict[str, float] = {
+    "acrcloud": 0.95,
+    "custom": 0.85,
+    "whisper_genius": 0.6,
+    **json.loads(os.getenv("FUSION_SOURCE_WEIGHTS", "{}")),
+}
+# Confidenza implicita per i risultati senza campo `confidence` (per posizione)
+RANK_PRIOR = [0.5, 0.3, 0.2, 0.1, 0.05]
+FUSION_MATCH_RATIO = float(os.getenv("FUSION_MATCH_RATIO", "0.85"))
+FUSION_EARLY_STOP_CONFIDENCE = float(os.getenv("FUSION_EARLY_STOP_CONFIDENCE", "0.9"))
+
+_DECORATIONS = re.compile(r"\s*[\(\[][^\)\]]*(feat|ft\.|remaster|live|version|edit|mix)[^\)\]]*[\)\]]", re.IGNORECASE)
+
+
+def _clean_title(title: str) -> str:
+    return normalize_query(_DECORATIONS.sub("", title or ""))
+
+
+def candidates_from_result(res: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Schema comune {title, artist, url, confidence, source} per l'output di
+    qualsiasi pipeline (ACRCloud: campi top-level + alternatives, Whisper e
+    Custom: lista `results`). Le card di sola analisi (senza brano) sono escluse.
+    """
+    if not isinstance(res, dict) or not res.get("ok"):
+        return []
+    source = res.get("source", "unknown")
+    out: List[Dict[str, Any]] = []
+
+    if res.get("title"):
+        out.append({
+            "title": res["title"],
+            "artist": res.get("artist") or "",
+            "url": res.get("url") or "",
+            "confidence": float(res.get("confidence") if res.get("confidence") is not None else 0.8),
+        })
+        for alt in res.get("alternatives") or []:
+            if alt.get("title"):
+                out.append({
+                    "title": alt["title"],
+                    "artist": alt.get("artist") or "",
+                    "url": "",
+                    "confidence": float(alt.get("confidence") or 0.0),
+                })
+
+    for i, r in enumerate(res.get("results") or []):
+        if not r.get("title") or r.get("features") is not None or r.get("error") or r.get("match") == "search_link":
+            continue
+        conf = r.get("confidence")
+        if conf is None:
+            conf = RANK_PRIOR[i] if i < len(RANK_PRIOR) else 0.0
+        out.append({
+            "title": r["title"],
+            "artist": r.get("artist") or "",
+            "url": r.get("url") or "",
+            "confidence": float(conf),
+        })
+
+    for c in out:
+        c["source"] = source
+    return out
+
+
+class Fusion:
+    """
+    Fusione incrementale dei risultati delle pipeline:
+    dedup fuzzy su titolo/artista, punteggio noisy-OR pesato per sorgente
+    (più sorgenti d'accordo → confidenza più alta).
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        self.weights = weights or SOURCE_WEIGHTS
+        self.groups: List[Dict[str, Any]] = []
+
+    def _find(self, title: str, artist: str) -> Optional[Dict[str, Any]]:
+        for g in self.groups:
+            if SequenceMatcher(None, g["_title"], title).ratio() < FUSION_MATCH_RATIO:
+                continue
+            if artist and g["_artist"] and SequenceMatcher(None, g["_artist"], artist).ratio() < FUSION_MATCH_RATIO:
+                continue
+            return g
+        return None
+
+    def add(self, res: Dict[str, Any]):
+        for c in candidates_from_result(res):
+            title, artist = _clean_title(c["title"]), normalize_query(c["artist"])
+            if not title:
+                continue
+            g = self._find(title, artist)
+            if g is None:
+                g = {"_title": title, "_artist": artist, "title": c["title"], "artist": c["artist"],
+                     "url": c["url"], "support": {}}
+                self.groups.append(g)
+            w = self.weights.get(c["source"], 0.5) * max(0.0, min(1.0, c["confidence"]))
+            # una sola evidenza per sorgente: la più forte
+            g["support"][c["source"]] = max(w, g["support"].get(c["source"], 0.0))
+            if not g["artist"] and c["artist"]:
+                g["artist"], g["_artist"] = c["artist"], artist
+            if not g["url"] and c["url"]:
+                g["url"] = c["url"]
+
+    @staticmethod
+    def _score(g: Dict[str, Any]) -> float:
+        miss = 1.0
+        for w in g["support"].values():
+            miss *= 1.0 - w
+        return round(1.0 - miss, 3)
+
+    def ranked(self, top_k: int = 5) -> List[Dict[str, Any]]:
+        out = [
+            {
+                "title": g["title"],
+                "artist": g["artist"],
+                "url": g["url"],
+                "confidence": self._score(g),
+                "sources": sorted(g["support"]),
+            }
+            for g in self.groups
+        ]
+        return sorted(out, key=lambda c: c["confidence"], reverse=True)[:top_k]
+
+    def best_confidence(self) -> float:
+        return max((self._score(g) for g in self.groups), default=0.0)
@@ -0,0 +1,140 @@
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.audio import PCM_SR, get_pcm, pcm_to_float32
+from utils.executor import CPU_EXECUTOR
+from utils.metrics import REGISTRY, span
+
+# Pre-classificazione della clip prima delle pipeline (silenzio/rumore/parlato/musica)
+GATE_ENABLED = os.getenv("GATE_ENABLED", "1") == "1"
+# Secondi analizzati (dall'inizio della clip)
+GATE_MAX_SEC = float(os.getenv("GATE_MAX_SEC", "20"))
+# Frame sotto questa soglia (dBFS, segnale non normalizzato) contano come silenzio
+GATE_SILENCE_DBFS = float(os.getenv("GATE_SILENCE_DBFS", "-50"))
+# Quota minima di frame attivi perché la clip non sia "silence"
+GATE_MIN_ACTIVE_RATIO = float(os.getenv("GATE_MIN_ACTIVE_RATIO", "0.1"))
+# Spectral flatness mediana oltre cui (senza tonalità né ritmo) la clip è "noise"
+GATE_NOISE_FLATNESS = float(os.getenv("GATE_NOISE_FLATNESS", "0.35"))
+# Quota di energia 300–3400 Hz oltre cui si assume presenza di voce
+GATE_VOCAL_RATIO = float(os.getenv("GATE_VOCAL_RATIO", "0.5"))
+# Punteggio (0–1: tonalità, chroma, periodicità degli onset) oltre cui la clip è musica
+GATE_MUSIC_SCORE = float(os.getenv("GATE_MUSIC_SCORE", "0.45"))
+
+# Pipeline utili per classe (None = tutte). Nel dubbio si eseguono tutte.
+GATE_RUN: Dict[str, Optional[List[str]]] = {
+    "silence": [],
+    "noise": [],
+    "speech": ["whisper_genius"],
+    "instrumental": ["acrcloud", "custom"],
+    "music": None,
+    "uncertain": None,
+}
+
+GATE_DECISIONS = REGISTRY.counter("singsync_gate_decisions_total", "Classificazioni del gate pre-pipeline", ("label",))
+
+
+def _onset_periodicity(S: np.ndarray, hop: int) -> float:
+    """Picco dell'autocorrelazione dello spectral flux tra 60 e 200 BPM (0 = nessun ritmo)."""
+    flux = np.maximum(0.0, np.diff(np.log1p(S), axis=1)).sum(axis=0)
+    fps = PCM_SR / hop
+    lo, hi = int(fps * 60 / 200), int(fps * 60 / 60)
+    if flux.size <= hi * 2:
+        return 0.0
+    flux = flux - flux.mean()
+    ac = np.correlate(flux, flux, mode="full")[flux.size - 1:]
+    if ac[0] <= 0:
+        return 0.0
+    return float(np.clip(ac[lo:hi + 1].max() / ac[0], 0.0, 1.0))
+
+
+def classify_pcm(pcm: np.ndarray) -> Dict[str, Any]:
+    """
+    Classificazione leggera (una STFT sui primi GATE_MAX_SEC secondi, niente CQT/beat tracking):
+    RMS per frame → silenzio; spectral flatness, picco di chroma e periodicità degli onset
+    → musica/rumore; quota di energia in banda vocale → voce.
+    Ritorna {"label", "run" (pipeline utili, None = tutte), "features"}.
+    Funzione di modulo: eseguibile nel pool CPU anche in mode "process".
+    """
+    import librosa
+    from audio_features import N_FFT, HOP
+
+    y = pcm_to_float32(pcm[: int(GATE_MAX_SEC * PCM_SR)])
+    if y.size < N_FFT:
+        y = np.pad(y, (0, N_FFT - y.size))
+    S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP))
+    rms_db = 20 * np.log10(librosa.feature.rms(S=S, frame_length=N_FFT, hop_length=HOP)[0] + 1e-10)
+    active = rms_db > GATE_SILENCE_DBFS
+    features: Dict[str, Any] = {
+        "level_dbfs": round(float(20 * np.log10(np.sqrt(np.mean(y ** 2)) + 1e-10)), 1),
+        "active_ratio": round(float(active.mean()), 3),
+    }
+    if features["active_ratio"] < GATE_MIN_ACTIVE_RATIO:
+        return {"label": "silence", "run": GATE_RUN["silence"], "features": features}
+
+    Sa = S[:, active]
+    power = Sa ** 2
+    freqs = librosa.fft_frequencies(sr=PCM_SR, n_fft=N_FFT)
+    band = (freqs >= 300) & (freqs <= 3400)
+    flatness = float(np.median(librosa.feature.spectral_flatness(S=Sa)))
+    chroma = librosa.feature.chroma_stft(S=power, sr=PCM_SR, n_fft=N_FFT)
+    chroma_peak = float(np.mean(chroma.max(axis=0) / (chroma.sum(axis=0) + 1e-10)))
+    periodicity = _onset_periodicity(S, HOP)
+    vocal_ratio = float(power[band].sum() / (power.sum() + 1e-10))
+
+    # rumore bianco: chroma ≈ uniforme (picco ~0.12); accordi/note tenute: 0.3+
+    tonal = float(np.clip((chroma_peak - 0.12) / 0.23, 0.0, 1.0))
+    music_score = (
+        0.4 * (1.0 - min(1.0, flatness / GATE_NOISE_FLATNESS))
+        + 0.3 * tonal
+        + 0.3 * periodicity
+    )
+    features.update({
+        "flatness": round(flatness, 3),
+        "chroma_peak": round(chroma_peak, 3),
+        "periodicity": round(periodicity, 3),
+        "vocal_ratio": round(vocal_ratio, 3),
+        "music_score": round(music_score, 3),
+    })
+
+    if flatness >= GATE_NOISE_FLATNESS and tonal < 0.2 and periodicity < 0.3:
+        label = "noise"
+    elif music_score >= GATE_MUSIC_SCORE:
+        label = "music" if vocal_ratio >= GATE_VOCAL_RATIO else "instrumental"
+    elif vocal_ratio >= GATE_VOCAL_RATIO:
+        label = "speech"
+    else:
+        label = "uncertain"
+    return {"label": label, "run": GATE_RUN[label], "features": features}
+
+
+async def gate_clip(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Decisione del gate per un file (PCM condiviso di get_pcm, primi GATE_MAX_SEC
+    secondi a classify_pcm nel pool CPU).
+    None se il gate è disabilitato o fallisce: in quel caso girano tutte le pipeline.
+    """
+    if not GATE_ENABLED:
+        return None
+    t0 = time.perf_counter()
+    try:
+        with span("gate"):
+            pcm = (await get_pcm(path))[: int(GATE_MAX_SEC * PCM_SR)]
+            decision = await CPU_EXECUTOR.run_cpu(classify_pcm, pcm)
+    except Exception:
+        return None
+    GATE_DECISIONS.inc(label=decision["label"])
+    decision["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return decision
+
+
+def apply_gate(stages: List[List[str]], decision: Optional[Dict[str, Any]]) -> Tuple[List[List[str]], List[str]]:
+    """Stadi senza le pipeline escluse dal gate (stadi vuoti rimossi) + elenco delle escluse."""
+    if decision is None or decision.get("run") is None:
+        return stages, []
+    keep = set(decision["run"])
+    gated = [source for stage in stages for source in stage if source not in keep]
+    kept = [[source for source in stage if source in keep] for stage in stages]
+    return [stage for stage in kept if stage], gated
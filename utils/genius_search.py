@@ -1,29 +1,185 @@
 import os
-import aiohttp
+import re
+import time
+import asyncio
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from utils.http_client import get_http_client
+from utils.metrics import REGISTRY, span
+
+GENIUS_API_URL = os.getenv("GENIUS_API_URL", "https://api.genius.com/search")
+GENIUS_CACHE_TTL_SEC = float(os.getenv("GENIUS_CACHE_TTL_SEC", "21600"))
+GENIUS_CACHE_MAX_ITEMS = int(os.getenv("GENIUS_CACHE_MAX_ITEMS", "5000"))
+# Token bucket: richieste/secondo sostenute e burst massimo verso Genius
+GENIUS_RATE_PER_SEC = float(os.getenv("GENIUS_RATE_PER_SEC", "5"))
+GENIUS_RATE_BURST = int(os.getenv("GENIUS_RATE_BURST", "10"))
+
+_PUNCT = re.compile(r"[^\w\s]", re.UNICODE)
+_SPACES = re.compile(r"\s+")
+
+
+class GeniusError(RuntimeError):
+    """Errore HTTP dalla Genius API."""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"HTTP {status}: {body[:200]}")
+        self.status = status
+
+
+def genius_token() -> str:
+    return os.getenv("GENIUS_API_TOKEN") or os.getenv("GENIUS_TOKEN") or ""
+
+
+def normalize_query(query: str) -> str:
+    """Chiave di cache: NFKC, minuscole, senza punteggiatura, spazi compressi."""
+    q = unicodedata.normalize("NFKC", query).casefold()
+    q = _PUNCT.sub(" ", q)
+    return _SPACES.sub(" ", q).strip()
+
+
+class TokenBucket:
+    """Rate limiter async a token bucket (attende invece di fallire)."""
+
+    def __init__(self, rate_per_sec: float, burst: int):
+        self.rate = max(rate_per_sec, 0.001)
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def try_acquire(self) -> float:
+        """Variante non bloccante: 0 se il token è stato preso, altrimenti i secondi d'attesa."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class GeniusClient:
+    """
+    Unico punto di accesso alla ricerca Genius:
+      - cache TTL + LRU su query normalizzata
+      - single-flight: N ricerche identiche concorrenti → una chiamata
+      - token bucket per restare nelle quote
+    """
+
+    def __init__(self):
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Task"] = {}
+        self._bucket: Optional[TokenBucket] = None
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "calls": 0}
+
+    def _cache_get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        item = self._cache.get(key)
+        if item is None:
+            return None
+        if time.time() - item[1] > GENIUS_CACHE_TTL_SEC:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return item[0]
+
+    def _cache_set(self, key: str, hits: List[Dict[str, Any]]):
+        self._cache[key] = (hits, time.time())
+        self._cache.move_to_end(key)
+        while len(self._cache) > GENIUS_CACHE_MAX_ITEMS:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, query: str) -> List[Dict[str, Any]]:
+        token = genius_token()
+        if not token:
+            raise RuntimeError("GENIUS_API_TOKEN mancante")
+        if self._bucket is None:
+            self._bucket = TokenBucket(GENIUS_RATE_PER_SEC, GENIUS_RATE_BURST)
+        await self._bucket.acquire()
+        self.stats["calls"] += 1
+
+        resp = await get_http_client().get(
+            GENIUS_API_URL, headers={"Authorization": f"Bearer {token}"}, params={"q": query}, timeout=10
+        )
+        if resp.status != 200:
+            raise GeniusError(resp.status, resp.text())
+        data = resp.json()
+
+        out: List[Dict[str, Any]] = []
+        for hit in (data.get("response", {}) or {}).get("hits", []):
+            res = hit.get("result", {}) or {}
+            title = res.get("title") or res.get("full_title") or ""
+            primary = (res.get("primary_artist") or {}).get("name") or ""
+            url = res.get("url") or None
+            if title or primary or url:
+                out.append({"title": title, "artist": primary, "url": url})
+        return out
+
+    async def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Lista di {title, artist, url} per una query testo (max top_k)."""
+        key = normalize_query(query)
+        if not key:
+            return []
+
+        cached = self._cache_get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached[:top_k]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            task = asyncio.create_task(self._fetch_shared(key, query))
+            self._inflight[key] = task
+            # evita "exception was never retrieved" se nessuno è più in attesa
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        # la chiamata condivisa prosegue anche se chi l'ha avviata viene cancellato
+        # (early_stop, disconnessione, timeout): gli altri in attesa ricevono comunque l'esito
+        return (await asyncio.shield(task))[:top_k]
+
+    async def _fetch_shared(self, key: str, query: str) -> List[Dict[str, Any]]:
+        """Task staccato del single-flight: fetch + cache, poi rimozione da _inflight."""
+        try:
+            with span("genius"):
+                hits = await self._fetch(query)
+            self._cache_set(key, hits)
+            return hits
+        finally:
+            self._inflight.pop(key, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "items": len(self._cache)}
+
+
+GENIUS = GeniusClient()
+
+REGISTRY.gauge(
+    "singsync_genius_cache_hit_ratio", "Quota di ricerche Genius servite da cache o coalescing",
+    fn=lambda: (GENIUS.stats["hits"] + GENIUS.stats["coalesced"])
+    / max(1, GENIUS.stats["hits"] + GENIUS.stats["coalesced"] + GENIUS.stats["misses"]),
+)
+REGISTRY.gauge("singsync_genius_calls", "Chiamate effettive alla Genius API", fn=lambda: GENIUS.stats["calls"])
 
-GENIUS_API_TOKEN = os.getenv("GENIUS_API_TOKEN", "")
 
 async def search_genius_text(query: str):
     """
     Ricerca su Genius API (solo testo libero).
     """
-    if not GENIUS_API_TOKEN:
+    if not genius_token():
         raise ValueError("GENIUS_API_TOKEN non impostato")
-
-    headers = {"Authorization": f"Bearer {GENIUS_API_TOKEN}"}
-    url = f"https://api.genius.com/search?q={query}"
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as resp:
-            data = await resp.json()
-
-    hits = data.get("response", {}).get("hits", [])
-    results = []
-    for h in hits[:5]:
-        result = h["result"]
-        results.append({
-            "title": result["title"],
-            "artist": result["primary_artist"]["name"],
-            "url": result["url"],
-        })
-    return results
\ No newline at end of file
+    return await GENIUS.search(query, top_k=5)
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import random
+import asyncio
+from contextlib import AbstractContextManager, nullcontext
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+import httpx
+
+from utils.metrics import REGISTRY, span
+
+HTTP_TIMEOUT_SEC = float(os.getenv("HTTP_TIMEOUT_SEC", "20"))
+HTTP_CONNECT_TIMEOUT_SEC = float(os.getenv("HTTP_CONNECT_TIMEOUT_SEC", "5"))
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "20"))
+HTTP_KEEPALIVE_SEC = float(os.getenv("HTTP_KEEPALIVE_SEC", "30"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF_BASE_SEC = float(os.getenv("HTTP_BACKOFF_BASE_SEC", "0.3"))
+HTTP_BREAKER_THRESHOLD = int(os.getenv("HTTP_BREAKER_THRESHOLD", "5"))
+HTTP_BREAKER_COOLDOWN_SEC = float(os.getenv("HTTP_BREAKER_COOLDOWN_SEC", "30"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+HTTP_ATTEMPT_SECONDS = REGISTRY.histogram(
+    "singsync_http_attempt_seconds", "Durata dei singoli tentativi HTTP verso le API remote", ("host", "status")
+)
+HTTP_RETRIES_TOTAL = REGISTRY.counter("singsync_http_retries_total", "Tentativi HTTP ripetuti", ("host",))
+
+
+class CircuitOpenError(RuntimeError):
+    """Host temporaneamente escluso dopo troppi errori consecutivi."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per host: apre dopo N errori; dopo il cooldown passa in
+    half-open e lascia passare UNA richiesta di prova (le altre restano
+    rifiutate finché la prova non si conclude): successo → chiuso, errore → riaperto.
+    Una prova senza esito entro il cooldown (es. cancellata) viene sostituita.
+    """
+
+    def __init__(self, host: str, threshold: int, cooldown_sec: float):
+        self.host = host
+        self.threshold = threshold
+        self.cooldown_sec = cooldown_sec
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_at: Optional[float] = None
+
+    def check(self):
+        if self.opened_at is None:
+            return
+        now = time.monotonic()
+        probe_free = self.probe_at is None or now - self.probe_at >= self.cooldown_sec
+        if now - self.opened_at >= self.cooldown_sec and probe_free:
+            # half-open: questa è la richiesta di prova
+            self.probe_at = now
+            return
+        raise CircuitOpenError(f"circuit_open: {self.host}")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probe_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self.probe_at = None
+
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.probe_at is not None else "open"
+
+
+class HttpResponse:
+    """Risposta già letta (la connessione torna subito nel pool)."""
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.body or b"null")
+
+
+class HttpClient:
+    """
+    Client HTTP condiviso a livello applicazione:
+      - aiohttp con keep-alive e limiti per host (Genius, ACRCloud)
+      - httpx.AsyncClient con pool per l'SDK OpenAI
+      - retry con backoff esponenziale + jitter, circuit breaker per host
+    """
+
+    def __init__(self):
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.openai_http: Optional[httpx.AsyncClient] = None
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    @property
+    def started(self) -> bool:
+        return self.session is not None and not self.session.closed
+
+    async def start(self):
+        if self.started:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_SEC,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SEC, connect=HTTP_CONNECT_TIMEOUT_SEC)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        self.openai_http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_PER_HOST,
+                max_keepalive_connections=HTTP_POOL_PER_HOST,
+                keepalive_expiry=HTTP_KEEPALIVE_SEC,
+            ),
+            timeout=httpx.Timeout(120.0, connect=HTTP_CONNECT_TIMEOUT_SEC),
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+        if self.openai_http is not None:
+            await self.openai_http.aclose()
+        self.session = None
+        self.openai_http = None
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(host, HTTP_BREAKER_THRESHOLD, HTTP_BREAKER_COOLDOWN_SEC)
+        return self.breakers[host]
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        retries: Optional[int] = None,
+        timeout: Optional[float] = None,
+        data: Any = None,
+        **kwargs,
+    ) -> HttpResponse:
+        """
+        Richiesta con retry/backoff e circuit breaker.
+        `data` può essere una callable che ricostruisce il body a ogni tentativo
+        (necessario per aiohttp.FormData, consumabile una sola volta); se ritorna
+        un context manager (es. @contextmanager che apre il file da inviare) il
+        body vive solo per quel tentativo e viene chiuso anche in caso di errore.
+        """
+        if not self.started:
+            await self.start()
+        host = urlsplit(url).hostname or ""
+        with span("remote_http"):
+            return await self._request(method, url, host, retries, timeout, data, **kwargs)
+
+    async def _request(self, method, url, host, retries, timeout, data, **kwargs) -> HttpResponse:
+        breaker = self.breaker(host)
+        retries = HTTP_RETRIES if retries is None else retries
+        req_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+
+        attempt = 0
+        while True:
+            breaker.check()
+            built = data() if callable(data) else data
+            t0 = time.perf_counter()
+            try:
+                with built if isinstance(built, AbstractContextManager) else nullcontext(built) as body:
+                    async with self.session.request(method, url, data=body, timeout=req_timeout, **kwargs) as resp:
+                        payload = await resp.read()
+                        result = HttpResponse(resp.status, dict(resp.headers), payload)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                HTTP_ATTEMPT_SECONDS.observe(time.perf_counter() - t0, host=host, status="error")
+                breaker.record_failure()
+                if attempt >= retries:
+                    raise
+                retry_after = None
+            else:
+                HTTP_ATTEMPT_SECONDS.observe(time.perf_counter() - t0, host=host, status=result.status)
+                if result.status not in RETRY_STATUS:
+                    breaker.record_success()
+                    return result
+                breaker.record_failure()
+                if attempt >= retries:
+                    return result
+                retry_after = result.headers.get("Retry-After")
+
+            attempt += 1
+            HTTP_RETRIES_TOTAL.inc(host=host)
+            delay = HTTP_BACKOFF_BASE_SEC * (2 ** (attempt - 1))
+            delay = random.uniform(0, delay) + delay / 2  # jitter
+            if retry_after:
+                try:
+                    delay = max(delay, min(float(retry_after), 10.0))
+                except ValueError:
+                    pass
+            await asyncio.sleep(delay)
+
+    async def get(self, url: str, **kwargs) -> HttpResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> HttpResponse:
+        return await self.request("POST", url, **kwargs)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "started": self.started,
+            "breakers": {h: b.state() for h, b in self.breakers.items()},
+        }
+
+
+HTTP = HttpClient()
+
+
+def get_http_client() -> HttpClient:
+    """Client HTTP condiviso (avviato nel lifespan di app.py, altrimenti lazy)."""
+    return HTTP
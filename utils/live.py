@@ -0,0 +1,203 @@
+import os
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.audio import FFMPEG_BIN, PCM_SR, ffmpeg_slots, pcm_to_float32
+from utils.executor import CapacityError
+from utils.metrics import span
+
+# Finestra audio mantenuta in memoria per sessione (le più recenti)
+LIVE_MAX_WINDOW_SEC = float(os.getenv("LIVE_MAX_WINDOW_SEC", "30"))
+# Ogni quanti secondi di audio nuovo si rifà il matching locale (fingerprint)
+LIVE_LOCAL_EVERY_SEC = float(os.getenv("LIVE_LOCAL_EVERY_SEC", "2"))
+# Secondi di registrazione a cui interrogare le API remote (ACRCloud/Whisper)
+LIVE_REMOTE_CHECKPOINTS_SEC = [
+    float(s) for s in os.getenv("LIVE_REMOTE_CHECKPOINTS_SEC", "6,12,20").split(",") if s.strip()
+]
+# Whisper solo da questa durata in poi (testo troppo corto prima)
+LIVE_WHISPER_MIN_SEC = float(os.getenv("LIVE_WHISPER_MIN_SEC", "10"))
+LIVE_MAX_SESSION_SEC = float(os.getenv("LIVE_MAX_SESSION_SEC", "120"))
+# Secondi senza messaggi dal client dopo cui la sessione viene chiusa
+LIVE_IDLE_TIMEOUT_SEC = float(os.getenv("LIVE_IDLE_TIMEOUT_SEC", "15"))
+
+
+class RollingPcmBuffer:
+    """
+    Buffer circolare PCM int16 16k mono (preallocato) con le ultime `max_sec`
+    di audio e il totale ricevuto: append copia solo i campioni nuovi.
+    """
+
+    def __init__(self, max_sec: float = LIVE_MAX_WINDOW_SEC, sr: int = PCM_SR):
+        self.sr = sr
+        self.max_samples = max(1, int(max_sec * sr))
+        self._buf = np.zeros(self.max_samples, dtype=np.int16)
+        self._pos = 0
+        self.total_samples = 0
+
+    def append(self, pcm: np.ndarray):
+        if not pcm.size:
+            return
+        self.total_samples += pcm.size
+        if pcm.size >= self.max_samples:
+            self._buf[:] = pcm[-self.max_samples:]
+            self._pos = 0
+            return
+        end = self._pos + pcm.size
+        if end <= self.max_samples:
+            self._buf[self._pos:end] = pcm
+        else:
+            head = self.max_samples - self._pos
+            self._buf[self._pos:] = pcm[:head]
+            self._buf[:end - self.max_samples] = pcm[head:]
+        self._pos = end % self.max_samples
+
+    def window(self) -> np.ndarray:
+        """Copia in ordine cronologico dell'audio in finestra (al più `max_sec`)."""
+        if self.total_samples < self.max_samples:
+            return self._buf[:self.total_samples].copy()
+        return np.concatenate((self._buf[self._pos:], self._buf[:self._pos]))
+
+    @property
+    def total_sec(self) -> float:
+        return self.total_samples / self.sr
+
+
+class PcmDecoder:
+    """Chunk già in PCM s16le 16k mono (es. AudioWorklet dal browser): nessuna decodifica."""
+
+    def __init__(self, on_pcm: Callable[[np.ndarray], None]):
+        self.on_pcm = on_pcm
+        self._rest = b""
+
+    async def start(self):
+        pass
+
+    async def feed(self, data: bytes):
+        data = self._rest + data
+        cut = len(data) - len(data) % 2
+        self._rest = data[cut:]
+        self.on_pcm(np.frombuffer(data[:cut], dtype=np.int16))
+
+    async def close(self):
+        pass
+
+
+class FfmpegStreamDecoder:
+    """
+    Un processo ffmpeg per sessione: i chunk compressi (webm/opus, m4a, mp3…)
+    entrano su stdin, il PCM 16k mono esce su stdout ed è consegnato man mano.
+    Il processo occupa uno slot FFMPEG_CONCURRENCY per tutta la sessione:
+    senza slot liberi la sessione viene rifiutata (CapacityError).
+    """
+
+    def __init__(self, on_pcm: Callable[[np.ndarray], None], input_format: Optional[str] = None):
+        self.on_pcm = on_pcm
+        self.input_format = input_format
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._slot = False
+
+    async def start(self):
+        sem = ffmpeg_slots()
+        if sem.locked():
+            raise CapacityError()
+        await sem.acquire()
+        self._slot = True
+        cmd = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error"]
+        if self.input_format:
+            cmd += ["-f", self.input_format]
+        cmd += ["-i", "pipe:0", "-vn", "-ac", "1", "-ar", str(PCM_SR), "-f", "s16le", "pipe:1"]
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except BaseException:
+            self._release_slot()
+            raise
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        rest = b""
+        while True:
+            chunk = await self.proc.stdout.read(32 * 1024)
+            if not chunk:
+                break
+            chunk = rest + chunk
+            cut = len(chunk) - len(chunk) % 2
+            rest = chunk[cut:]
+            self.on_pcm(np.frombuffer(chunk[:cut], dtype=np.int16))
+
+    async def feed(self, data: bytes):
+        try:
+            self.proc.stdin.write(data)
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _release_slot(self):
+        if self._slot:
+            self._slot = False
+            ffmpeg_slots().release()
+
+    async def close(self):
+        """Chiude stdin e attende lo svuotamento dell'output (ultimo PCM incluso); libera lo slot ffmpeg."""
+        if self.proc is None:
+            self._release_slot()
+            return
+        try:
+            self.proc.stdin.close()
+            await asyncio.wait_for(self._reader, timeout=5)
+            await asyncio.wait_for(self.proc.wait(), timeout=5)
+        except (asyncio.TimeoutError, BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            if self.proc.returncode is None:
+                self.proc.kill()
+            self._release_slot()
+
+
+def make_decoder(fmt: str, on_pcm: Callable[[np.ndarray], None]):
+    """`pcm16` → PcmDecoder, altrimenti ffmpeg (`auto` lascia a ffmpeg il riconoscimento del container)."""
+    if fmt == "pcm16":
+        return PcmDecoder(on_pcm)
+    return FfmpegStreamDecoder(on_pcm, None if fmt == "auto" else fmt)
+
+
+def analyze_window(pcm: np.ndarray, new_samples: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Una STFT sulla finestra corrente: livello/quota vocale dei soli frame nuovi
+    (feature incrementali per il client) + match sull'indice fingerprint locale.
+    Eseguita nel pool CPU (funzione di modulo → serializzabile anche in mode "process").
+    """
+    import librosa
+    from audio_features import N_FFT, HOP, normalize
+    from utils.fingerprint import get_fingerprint_index
+
+    y = pcm_to_float32(pcm)
+    if y.size < N_FFT:
+        y = np.pad(y, (0, N_FFT - y.size))
+    with span("live_stft"):
+        S = np.abs(librosa.stft(normalize(y), n_fft=N_FFT, hop_length=HOP))
+
+    # energia sul segnale non normalizzato: silenzio resta silenzio
+    tail = pcm_to_float32(pcm[-max(new_samples, N_FFT):])
+    freqs = librosa.fft_frequencies(sr=PCM_SR, n_fft=N_FFT)
+    n_new = max(1, new_samples // HOP)
+    power = S[:, -n_new:] ** 2
+    band = (freqs >= 300) & (freqs <= 3400)
+    features = {
+        "rms": float(np.sqrt(np.mean(tail ** 2))) if tail.size else 0.0,
+        "vocal_ratio": float(power[band].sum() / (power.sum() + 1e-10)),
+    }
+
+    index = get_fingerprint_index()
+    if index is None:
+        return features, []
+    with span("fingerprint"):
+        found = index.query_stft(S, top_k=5)
+    return features, [{**m, "url": "", "preview": "", "image": "", "match": "fingerprint"} for m in found]
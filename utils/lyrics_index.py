@@ -0,0 +1,164 @@
+import os
+import json
+import sqlite3
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+from utils.genius_search import normalize_query
+
+LYRICS_INDEX_PATH = os.getenv("LYRICS_INDEX_PATH", "")
+# Quota di parole della trascrizione presenti nel testo per un match "sicuro"
+LYRICS_LOCAL_CONFIDENCE = float(os.getenv("LYRICS_LOCAL_CONFIDENCE", "0.6"))
+LYRICS_MIN_TERMS = int(os.getenv("LYRICS_MIN_TERMS", "4"))
+# Se = 1 salva nell'indice le associazioni trascrizione → primo risultato Genius
+LYRICS_LEARN = os.getenv("LYRICS_LEARN", "1") == "1"
+LYRICS_MMAP_BYTES = int(os.getenv("LYRICS_MMAP_BYTES", str(256 * 1024 * 1024)))
+# Dopo un'apertura fallita dell'indice si riprova solo dopo questi secondi
+LYRICS_INDEX_RETRY_SEC = float(os.getenv("LYRICS_INDEX_RETRY_SEC", "60"))
+
+
+class LyricsIndex:
+    """
+    Indice full-text locale (SQLite FTS5, tokenizer trigram se disponibile →
+    match tollerante a errori di trascrizione). Il file è letto via mmap.
+      - songs: metadati (title, artist, url)
+      - docs: testi/frammenti indicizzati (lyrics offline o trascrizioni apprese)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA mmap_size={LYRICS_MMAP_BYTES}")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS songs ("
+            "id INTEGER PRIMARY KEY, title TEXT, artist TEXT, url TEXT, UNIQUE(title, artist))"
+        )
+        try:
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5("
+                "text, song_id UNINDEXED, kind UNINDEXED, tokenize='trigram')"
+            )
+        except sqlite3.OperationalError:
+            # SQLite < 3.34: niente trigram, tokenizer standard
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(text, song_id UNINDEXED, kind UNINDEXED)"
+            )
+        self._db.commit()
+
+    def _song_id(self, title: str, artist: str, url: Optional[str]) -> int:
+        row = self._db.execute(
+            "SELECT id FROM songs WHERE title = ? AND artist = ?", (title, artist)
+        ).fetchone()
+        if row:
+            if url:
+                self._db.execute("UPDATE songs SET url = ? WHERE id = ?", (url, row[0]))
+            return row[0]
+        cur = self._db.execute(
+            "INSERT INTO songs (title, artist, url) VALUES (?, ?, ?)", (title, artist, url)
+        )
+        return cur.lastrowid
+
+    def add(self, title: str, artist: str, url: Optional[str], text: str, kind: str = "lyrics", commit: bool = True):
+        """Aggiunge un testo (lyrics completo o frammento) associato a un brano."""
+        text = normalize_query(text)
+        if not text:
+            return
+        with self._lock:
+            sid = self._song_id(title, artist, url)
+            self._db.execute("INSERT INTO docs (text, song_id, kind) VALUES (?, ?, ?)", (text, sid, kind))
+            if commit:
+                self._db.commit()
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def optimize(self):
+        """Compatta l'indice FTS (dopo un build offline)."""
+        with self._lock:
+            self._db.execute("INSERT INTO docs(docs) VALUES ('optimize')")
+            self._db.commit()
+
+    def learn(self, transcript: str, result: Dict[str, Any]):
+        """Feedback da Genius: la trascrizione diventa un frammento del brano trovato."""
+        if result.get("title") and result.get("url"):
+            self.add(result["title"], result.get("artist") or "", result["url"], transcript, kind="learned")
+
+    def search(self, transcript: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Brani candidati per una trascrizione, con confidenza = quota di parole
+        della trascrizione presenti nel testo indicizzato.
+        """
+        norm = normalize_query(transcript)
+        terms = sorted({t for t in norm.split() if len(t) >= 3})
+        if len(terms) < LYRICS_MIN_TERMS:
+            return []
+        match = " OR ".join('"' + t.replace('"', "") + '"' for t in terms)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT d.text, s.title, s.artist, s.url FROM docs d JOIN songs s ON s.id = d.song_id "
+                "WHERE docs MATCH ? ORDER BY bm25(docs) LIMIT 50",
+                (match,),
+            ).fetchall()
+
+        best: Dict[tuple, Dict[str, Any]] = {}
+        for text, title, artist, url in rows:
+            words = set(text.split())
+            found = sum(1 for t in terms if t in words or t in text)
+            conf = round(found / len(terms), 2)
+            key = (title, artist)
+            if key not in best or conf > best[key]["confidence"]:
+                best[key] = {"title": title, "artist": artist, "url": url, "confidence": conf}
+        return sorted(best.values(), key=lambda r: r["confidence"], reverse=True)[:top_k]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            songs = self._db.execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+        return {"path": self.path, "songs": songs}
+
+
+def build_from_manifest(manifest_path: str, db_path: str) -> int:
+    """
+    Build offline da un manifest JSONL: una riga per brano
+    {"title": ..., "artist": ..., "url": ..., "lyrics": ...}.
+    """
+    index = LyricsIndex(db_path)
+    n = 0
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            index.add(item.get("title", ""), item.get("artist", ""), item.get("url"), item.get("lyrics", ""), commit=False)
+            n += 1
+    index.commit()
+    index.optimize()
+    return n
+
+
+_INDEX: Optional[LyricsIndex] = None
+_FAILED_AT: Optional[float] = None
+
+
+def get_lyrics_index() -> Optional[LyricsIndex]:
+    """
+    Indice aperto una volta per processo da LYRICS_INDEX_PATH (None se non
+    configurato). Un'apertura fallita non viene ritentata (né stampata) a ogni
+    chiamata, ma al più ogni LYRICS_INDEX_RETRY_SEC.
+    """
+    global _INDEX, _FAILED_AT
+    if _INDEX is not None or not LYRICS_INDEX_PATH:
+        return _INDEX
+    if _FAILED_AT is not None and time.monotonic() - _FAILED_AT < LYRICS_INDEX_RETRY_SEC:
+        return None
+    try:
+        _INDEX = LyricsIndex(LYRICS_INDEX_PATH)
+        _FAILED_AT = None
+    except Exception as e:
+        _FAILED_AT = time.monotonic()
+        print(f"⚠️  Indice lyrics non disponibile (nuovo tentativo tra {LYRICS_INDEX_RETRY_SEC:.0f} s): {e}")
+    return _INDEX
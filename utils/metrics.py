@@ -0,0 +1,247 @@
+import os
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Bucket (secondi) dalle fasi brevi (hash, fingerprint) alle chiamate remote lente
+METRICS_BUCKETS: Tuple[float, ...] = tuple(
+    float(b) for b in os.getenv(
+        "METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60"
+    ).split(",")
+)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], le: Optional[str] = None) -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        parts.append(f'le="{le}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self._samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, value: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """
+    Gauge impostato a mano (set/inc/dec) oppure letto al momento dello scrape
+    da `fn`: numero (senza label) o dict {tupla valori label: numero}.
+    """
+    kind = "gauge"
+
+    def __init__(self, *args, fn: Optional[Callable[[], Any]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fn = fn
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, value: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def dec(self, value: float = 1.0, **labels):
+        self.inc(-value, **labels)
+
+    @contextmanager
+    def track(self, **labels) -> Iterator[None]:
+        """+1 per la durata del blocco (richieste/pipeline in volo)."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self) -> List[str]:
+        if self.fn is not None:
+            try:
+                value = self.fn()
+            except Exception:
+                return []
+            items = value.items() if isinstance(value, dict) else [((), value)]
+            return [
+                f"{self.name}{_fmt_labels(self.labelnames, k if isinstance(k, tuple) else (k,))} {float(v)}"
+                for k, v in items
+            ]
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = METRICS_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # per serie: [conteggi per bucket..., somma, totale]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        out = []
+        for key, series in items:
+            for i, b in enumerate(self.buckets):
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, str(b))} {series[i]}")
+            out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, '+Inf')} {series[-1]}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {series[-2]}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {series[-1]}")
+        return out
+
+
+class Registry:
+    """Registro delle metriche del processo, esposto in formato testo Prometheus su /metrics."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # idempotente: un modulo re-importato non duplica la serie
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (), fn: Optional[Callable[[], Any]] = None) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames, fn=fn))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = METRICS_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets=buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+PIPELINE_SECONDS = REGISTRY.histogram(
+    "singsync_pipeline_seconds", "Durata delle pipeline di riconoscimento", ("source", "outcome")
+)
+PIPELINE_IN_FLIGHT = REGISTRY.gauge(
+    "singsync_pipeline_in_flight", "Pipeline in esecuzione", ("source",)
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "singsync_stage_seconds", "Durata delle singole fasi (upload, ffmpeg, feature, modelli, HTTP, Genius)", ("stage",)
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "singsync_requests_in_flight", "Richieste di identificazione in corso", ("endpoint",)
+)
+
+
+# =====================================================
+# 🔹 Tracing per richiesta
+# =====================================================
+class Trace:
+    """Span (fase, inizio, durata) raccolti durante una richiesta."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:16]
+        self.t0 = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def add(self, stage: str, start: float, duration: float):
+        self.spans.append((stage, start, duration))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "spans": [
+                {"stage": s, "start_ms": round((t - self.t0) * 1000, 1), "duration_ms": round(d * 1000, 1)}
+                for s, t, d in sorted(self.spans, key=lambda x: x[1])
+            ],
+        }
+
+
+# La ContextVar è copiata nei task asyncio e in asyncio.to_thread:
+# gli span delle pipeline finiscono nel Trace della richiesta che le ha lanciate.
+_TRACE: contextvars.ContextVar = contextvars.ContextVar("singsync_trace", default=None)
+
+
+def start_trace() -> Trace:
+    trace = Trace()
+    _TRACE.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _TRACE.get()
+
+
+def record_span(stage: str, start: float, duration: float):
+    """Aggiunge uno span al Trace corrente (se presente), senza toccare gli istogrammi."""
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.add(stage, start, duration)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Misura un blocco: istogramma `singsync_stage_seconds{stage}` + span nel Trace corrente."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - t0
+        STAGE_SECONDS.observe(duration, stage=stage)
+        record_span(stage, t0, duration)
@@ -0,0 +1,89 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# Numero massimo di inferenze CREPE/OpenL3 contemporanee per processo
+CUSTOM_INFERENCE_CONCURRENCY = int(os.getenv("CUSTOM_INFERENCE_CONCURRENCY", "1"))
+# Se = 1 carica i modelli in background all'avvio (solo con ENABLE_CUSTOM=1)
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+
+CREPE_CAPACITY = "tiny"
+OPENL3_PARAMS = {"input_repr": "mel128", "content_type": "music", "embedding_size": 512}
+# Finestre OpenL3 per chiamata al modello (run_custom_batch)
+OPENL3_BATCH_SIZE = int(os.getenv("OPENL3_BATCH_SIZE", "64"))
+
+
+class ModelManager:
+    """
+    Modelli residenti per la pipeline custom (CREPE-tiny, OpenL3 music/mel128):
+    caricati una sola volta (lock contro caricamenti concorrenti), con
+    concorrenza di inferenza limitata e stato esposto su /health.
+    """
+
+    def __init__(self, concurrency: int):
+        self.state = "idle"      # idle | loading | ready | error
+        self.error: Optional[str] = None
+        self.load_sec: Optional[float] = None
+        self.openl3_model: Any = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+        self.concurrency = max(1, concurrency)
+
+    def load(self) -> bool:
+        """Carica (idempotente) i modelli; ritorna True se pronti."""
+        if self.state == "ready":
+            return True
+        with self._lock:
+            if self.state == "ready":
+                return True
+            self.state = "loading"
+            t0 = time.perf_counter()
+            try:
+                import numpy as np
+                import crepe
+                import openl3
+
+                # CREPE tiene i modelli in una cache interna per capacità
+                crepe.core.build_and_load_model(CREPE_CAPACITY)
+                self.openl3_model = openl3.models.load_audio_embedding_model(**OPENL3_PARAMS)
+
+                # warm-up: prima inferenza (grafo TF) su 1 s di silenzio
+                silence = np.zeros(16000, dtype=np.float32)
+                crepe.predict(silence, 16000, step_size=20, model_capacity=CREPE_CAPACITY, verbose=0)
+                openl3.get_audio_embedding(silence, 16000, model=self.openl3_model, verbose=0, **OPENL3_PARAMS)
+
+                self.state = "ready"
+                self.error = None
+            except Exception as e:
+                self.state = "error"
+                self.error = str(e)
+            finally:
+                self.load_sec = round(time.perf_counter() - t0, 2)
+        return self.state == "ready"
+
+    def start_background(self):
+        """Avvia il caricamento in un thread daemon (l'app risponde subito)."""
+        if self.state in ("idle", "error"):
+            threading.Thread(target=self.load, name="model-warmup", daemon=True).start()
+
+    @contextmanager
+    def inference(self):
+        """Slot di inferenza: limita le chiamate TF contemporanee."""
+        self._slots.acquire()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "load_sec": self.load_sec,
+            "error": self.error,
+            "concurrency": self.concurrency,
+        }
+
+
+MODELS = ModelManager(CUSTOM_INFERENCE_CONCURRENCY)
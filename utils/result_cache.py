@@ -0,0 +1,227 @@
+import os
+import json
+import asyncio
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from utils.metrics import REGISTRY
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_TTL_SEC = float(os.getenv("RESULT_CACHE_TTL_SEC", "86400"))
+RESULT_CACHE_MAX_ITEMS = int(os.getenv("RESULT_CACHE_MAX_ITEMS", "2000"))
+# Path SQLite opzionale: se vuoto la cache resta solo in memoria
+RESULT_CACHE_SQLITE = os.getenv("RESULT_CACHE_SQLITE", "")
+# Intervallo tra due pulizie dei risultati scaduti nel backend SQLite
+RESULT_CACHE_PRUNE_SEC = float(os.getenv("RESULT_CACHE_PRUNE_SEC", "600"))
+# Fingerprint grossolana chroma/energia per match di clip quasi identiche
+RESULT_CACHE_FINGERPRINT = os.getenv("RESULT_CACHE_FINGERPRINT", "0") == "1"
+# Path → chiave audio memorizzati per processo (LRU)
+AUDIO_KEY_MEMO_MAX_ITEMS = int(os.getenv("AUDIO_KEY_MEMO_MAX_ITEMS", "4096"))
+
+
+class ResultCache:
+    """
+    Cache dei risultati per pipeline, indicizzata per chiave audio.
+    LRU + TTL in memoria, con backend SQLite opzionale (condiviso tra worker):
+    letture su miss e scritture SQLite girano in un thread, mai sull'event loop;
+    le righe scadute sono rimosse periodicamente da `prune_loop`.
+    """
+
+    def __init__(self, max_items: int, ttl_sec: float, sqlite_path: str = ""):
+        self.max_items = max_items
+        self.ttl_sec = ttl_sec
+        self._mem: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.stats: Dict[str, Dict[str, int]] = {}
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (k TEXT PRIMARY KEY, v TEXT, ts REAL)"
+            )
+            self._db.commit()
+
+    def _count(self, source: str, field: str):
+        self.stats.setdefault(source, {"hits": 0, "misses": 0})[field] += 1
+
+    def _mem_get(self, k: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._mem.get(k)
+            if item and now - item[1] <= self.ttl_sec:
+                self._mem.move_to_end(k)
+                return item[0]
+            if item:
+                del self._mem[k]
+            return None
+
+    def _db_get(self, k: str) -> Optional[tuple]:
+        with self._db_lock:
+            return self._db.execute("SELECT v, ts FROM results WHERE k = ?", (k,)).fetchone()
+
+    def _db_put(self, k: str, value: Dict[str, Any], ts: float):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (k, v, ts) VALUES (?, ?, ?)",
+                (k, json.dumps(value, ensure_ascii=False), ts),
+            )
+            self._db.commit()
+
+    async def get(self, audio_key: str, source: str) -> Optional[Dict[str, Any]]:
+        k = f"{source}:{audio_key}"
+        now = time.time()
+        value = self._mem_get(k, now)
+        if value is None and self._db is not None:
+            row = await asyncio.to_thread(self._db_get, k)
+            if row and now - row[1] <= self.ttl_sec:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._put_mem(k, value, row[1])
+        self._count(source, "hits" if value is not None else "misses")
+        return value
+
+    async def set(self, audio_key: str, source: str, value: Dict[str, Any]):
+        k = f"{source}:{audio_key}"
+        now = time.time()
+        with self._lock:
+            self._put_mem(k, value, now)
+        if self._db is not None:
+            await asyncio.to_thread(self._db_put, k, value, now)
+
+    def prune(self) -> int:
+        """Rimuove da SQLite i risultati oltre il TTL; ritorna le righe eliminate. Bloccante."""
+        if self._db is None:
+            return 0
+        with self._db_lock:
+            cur = self._db.execute("DELETE FROM results WHERE ts < ?", (time.time() - self.ttl_sec,))
+            self._db.commit()
+            return cur.rowcount
+
+    def _put_mem(self, k: str, value: Dict[str, Any], ts: float):
+        self._mem[k] = (value, ts)
+        self._mem.move_to_end(k)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        hits = sum(s["hits"] for s in self.stats.values())
+        misses = sum(s["misses"] for s in self.stats.values())
+        return {
+            "enabled": RESULT_CACHE_ENABLED,
+            "backend": "sqlite" if self._db is not None else "memory",
+            "items": len(self._mem),
+            "hits": hits,
+            "misses": misses,
+            "per_source": self.stats,
+        }
+
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_MAX_ITEMS, RESULT_CACHE_TTL_SEC, RESULT_CACHE_SQLITE)
+
+
+async def prune_loop(cache: ResultCache = RESULT_CACHE, interval_sec: float = RESULT_CACHE_PRUNE_SEC):
+    """Task di background (lifespan): elimina periodicamente i risultati scaduti dal backend SQLite."""
+    while True:
+        try:
+            await asyncio.to_thread(cache.prune)
+        except Exception as e:
+            print(f"⚠️  Pulizia cache risultati fallita: {e}")
+        await asyncio.sleep(interval_sec)
+
+REGISTRY.gauge(
+    "singsync_result_cache_hit_ratio", "Quota di hit della cache risultati", ("source",),
+    fn=lambda: {(src,): s["hits"] / max(1, s["hits"] + s["misses"]) for src, s in list(RESULT_CACHE.stats.items())},
+)
+REGISTRY.gauge("singsync_result_cache_items", "Risultati in cache (memoria)", fn=lambda: len(RESULT_CACHE._mem))
+
+# path upload → chiave audio (calcolata una sola volta per file)
+_AUDIO_KEYS: "OrderedDict[str, str]" = OrderedDict()
+_AUDIO_KEYS_LOCK = threading.Lock()
+_AUDIO_KEY_TASKS: Dict[str, "asyncio.Task"] = {}
+
+
+def _known_key(path: str) -> Optional[str]:
+    with _AUDIO_KEYS_LOCK:
+        key = _AUDIO_KEYS.get(path)
+        if key is not None:
+            _AUDIO_KEYS.move_to_end(path)
+        return key
+
+
+def _remember_key(path: str, key: str):
+    with _AUDIO_KEYS_LOCK:
+        _AUDIO_KEYS[path] = key
+        _AUDIO_KEYS.move_to_end(path)
+        while len(_AUDIO_KEYS) > AUDIO_KEY_MEMO_MAX_ITEMS:
+            _AUDIO_KEYS.popitem(last=False)
+
+
+def _fingerprint_from_features(f: Dict[str, Any]) -> str:
+    parts = [
+        round(f["duration_sec"] * 2) / 2,
+        round(f["rms"], 2),
+        [round(c, 1) for c in f["chroma_mean"]],
+    ]
+    return "fp-" + hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def _raw_key(path: str) -> str:
+    """Chiave sui byte grezzi del file (ffmpeg assente o file non decodificabile). Bloccante."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return "raw-" + h.hexdigest()
+
+
+def forget_audio_key(path: str):
+    """Invalida la chiave memorizzata per un path (file sovrascritto o rimosso dallo store upload)."""
+    with _AUDIO_KEYS_LOCK:
+        _AUDIO_KEYS.pop(path, None)
+
+
+async def _decode_cache_key(path: str) -> str:
+    """Chiave calcolata sul PCM condiviso (get_pcm: la stessa decodifica serve gate, clip e pipeline)."""
+    from utils.audio import get_pcm
+
+    try:
+        pcm = await get_pcm(path)
+    except Exception:
+        # ffmpeg non disponibile / file illeggibile: hash dei byte grezzi, fuori dall'event loop
+        key = await asyncio.to_thread(_raw_key, path)
+        _remember_key(path, key)
+        return key
+
+    key = ""
+    if RESULT_CACHE_FINGERPRINT:
+        try:
+            from audio_features import features_from_pcm
+
+            bundle = await asyncio.to_thread(features_from_pcm, pcm)
+            key = _fingerprint_from_features(bundle.to_dict())
+        except Exception:
+            key = ""
+    key = key or "pcm-" + hashlib.sha256(pcm.data).hexdigest()
+    _remember_key(path, key)
+    return key
+
+
+async def audio_cache_key_async(path: str) -> str:
+    """
+    Chiave content-addressed di un file audio: SHA-256 del PCM normalizzato
+    (16k mono); con RESULT_CACHE_FINGERPRINT=1 la fingerprint chroma/energia.
+    Pipeline concorrenti sullo stesso file condividono un'unica decodifica ffmpeg.
+    """
+    known = _known_key(path)
+    if known is not None:
+        return known
+    task = _AUDIO_KEY_TASKS.get(path)
+    if task is None:
+        task = asyncio.ensure_future(_decode_cache_key(path))
+        _AUDIO_KEY_TASKS[path] = task
+        task.add_done_callback(lambda _t: _AUDIO_KEY_TASKS.pop(path, None))
+    return await asyncio.shield(task)
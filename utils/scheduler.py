@@ -0,0 +1,153 @@
+import os
+import json
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+# Costo stimato per chiamata (unità arbitrarie, es. USD)
+PIPELINE_COSTS: Dict[str, float] = {
+    "custom": 0.0,
+    "acrcloud": 0.002,
+    "whisper_genius": 0.006,
+    **json.loads(os.getenv("PIPELINE_COSTS", "{}")),
+}
+# Latenza attesa prima di avere misure reali (ms)
+PIPELINE_DEFAULT_LATENCY_MS: Dict[str, float] = {
+    "custom": 3000,
+    "acrcloud": 4000,
+    "whisper_genius": 6000,
+}
+SCHED_WINDOW = int(os.getenv("SCHED_WINDOW", "50"))
+# Sotto questo tasso di successo (con almeno SCHED_MIN_SAMPLES misure) la pipeline è "degradata"
+SCHED_MIN_SUCCESS = float(os.getenv("SCHED_MIN_SUCCESS", "0.3"))
+SCHED_MIN_SAMPLES = int(os.getenv("SCHED_MIN_SAMPLES", "5"))
+# Misure più vecchie di così non contano più (una pipeline degradata torna "sana" col tempo)
+SCHED_SAMPLE_MAX_AGE_SEC = float(os.getenv("SCHED_SAMPLE_MAX_AGE_SEC", "300"))
+# Pipeline degradata: una richiesta di prova ogni SCHED_PROBE_COOLDOWN_SEC (half-open)
+SCHED_PROBE_COOLDOWN_SEC = float(os.getenv("SCHED_PROBE_COOLDOWN_SEC", "30"))
+# Confidenza fusa oltre la quale la richiesta è "risolta" e gli stadi successivi non partono
+SCHED_RESOLVED_CONFIDENCE = float(os.getenv("SCHED_RESOLVED_CONFIDENCE", "0.8"))
+
+
+class PipelineStats:
+    """Finestra mobile di latenza/esito delle ultime esecuzioni di una pipeline."""
+
+    def __init__(self, source: str, window: int):
+        self.source = source
+        self.samples: deque = deque(maxlen=window)  # (latency_ms, ok, ts)
+        self.calls = 0
+        self.cost = 0.0
+        self.last_probe = 0.0
+
+    def record(self, latency_ms: float, ok: bool):
+        self.samples.append((latency_ms, ok, time.time()))
+        self.calls += 1
+        self.cost += PIPELINE_COSTS.get(self.source, 0.0)
+
+    def _expire(self):
+        """Scarta le misure più vecchie di SCHED_SAMPLE_MAX_AGE_SEC (la finestra è in ordine di tempo)."""
+        cutoff = time.time() - SCHED_SAMPLE_MAX_AGE_SEC
+        while self.samples and self.samples[0][2] < cutoff:
+            self.samples.popleft()
+
+    def allow_probe(self) -> bool:
+        """Half-open: True (e avvia il cooldown) se è passato SCHED_PROBE_COOLDOWN_SEC dall'ultima prova."""
+        now = time.time()
+        if now - self.last_probe < SCHED_PROBE_COOLDOWN_SEC:
+            return False
+        self.last_probe = now
+        return True
+
+    @property
+    def success_rate(self) -> float:
+        self._expire()
+        if not self.samples:
+            return 1.0
+        return sum(1 for _, ok, _ in self.samples if ok) / len(self.samples)
+
+    def latency_ms(self, q: float = 0.5) -> float:
+        self._expire()
+        if not self.samples:
+            return PIPELINE_DEFAULT_LATENCY_MS.get(self.source, 5000)
+        lat = sorted(s[0] for s in self.samples)
+        return lat[min(len(lat) - 1, int(q * len(lat)))]
+
+    @property
+    def degraded(self) -> bool:
+        rate = self.success_rate
+        return len(self.samples) >= SCHED_MIN_SAMPLES and rate < SCHED_MIN_SUCCESS
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "samples": len(self.samples),
+            "success_rate": round(self.success_rate, 3),
+            "p50_ms": round(self.latency_ms(0.5)),
+            "p95_ms": round(self.latency_ms(0.95)),
+            "calls": self.calls,
+            "cost": round(self.cost, 4),
+            "degraded": self.degraded,
+        }
+
+
+class Scheduler:
+    """
+    Pianificatore adattivo: ordina le pipeline per costo e latenza osservata,
+    esclude quelle degradate o fuori budget e costruisce gli stadi di
+    esecuzione (uno stadio parte solo se i precedenti non hanno risolto).
+    """
+
+    def __init__(self, window: int = SCHED_WINDOW):
+        self.window = window
+        self.stats: Dict[str, PipelineStats] = {}
+
+    def _get(self, source: str) -> PipelineStats:
+        if source not in self.stats:
+            self.stats[source] = PipelineStats(source, self.window)
+        return self.stats[source]
+
+    def record(self, source: str, latency_ms: float, ok: bool):
+        self._get(source).record(latency_ms, ok)
+
+    def plan(
+        self,
+        sources: List[str],
+        budget_ms: Optional[float] = None,
+        budget_cost: Optional[float] = None,
+    ) -> List[List[str]]:
+        """
+        Stadi di esecuzione per le pipeline abilitate.
+        Default: locale → ACRCloud → Whisper (ordine per costo, poi latenza p50).
+        Le pipeline che non stanno in sequenza nel budget di latenza vengono
+        affiancate al primo stadio; quelle oltre budget di costo sono escluse.
+        Le degradate sono escluse, salvo una richiesta di prova ogni
+        SCHED_PROBE_COOLDOWN_SEC che ne misura di nuovo lo stato.
+        """
+        healthy = [s for s in sources if not self._get(s).degraded or self._get(s).allow_probe()] or list(sources)
+        ordered = sorted(healthy, key=lambda s: (PIPELINE_COSTS.get(s, 0.0), self._get(s).latency_ms()))
+
+        stages: List[List[str]] = []
+        elapsed = 0.0
+        spent = 0.0
+        for s in ordered:
+            cost = PIPELINE_COSTS.get(s, 0.0)
+            if budget_cost is not None and spent + cost > budget_cost:
+                continue
+            lat = self._get(s).latency_ms()
+            if budget_ms is None or elapsed + lat <= budget_ms:
+                stages.append([s])
+                elapsed += lat
+            elif lat <= budget_ms and stages:
+                stages[0].append(s)
+            else:
+                continue
+            spent += cost
+        if not stages and ordered:
+            # budget troppo stretto: almeno la pipeline più economica
+            stages.append([ordered[0]])
+        return stages
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {s: st.snapshot() for s, st in self.stats.items()}
+
+
+SCHEDULER = Scheduler()
@@ -1,11 +1,59 @@
 import json
-from typing import Any, Dict
+from typing import Any, Dict, Iterator, Optional
 
-def sse_pack(event: str, data: Dict[str, Any]) -> str:
+def sse_pack(event: str, data: Dict[str, Any], event_id: Optional[str] = None) -> str:
     """
     Confeziona un evento SSE:
+      id:    <id>            (opzionale: il client lo rimanda come Last-Event-ID)
       event: <nome-evento>
       data:  <json>
     """
     payload = json.dumps(data, ensure_ascii=False)
-    return f"event: {event}\n" + f"data: {payload}\n\n"
\ No newline at end of file
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return head + f"event: {event}\n" + f"data: {payload}\n\n"
+
+def sse_comment(text: str = "ping") -> str:
+    """
+    Commento SSE (heartbeat): ignorato dai client, mantiene viva la connessione
+    attraverso proxy/load balancer.
+    """
+    return f": {text}\n\n"
+
+def sse_retry(ms: int) -> str:
+    """Attesa (ms) suggerita al client EventSource prima di riconnettersi."""
+    return f"retry: {int(ms)}\n\n"
+
+def parse_sse(text: str) -> Iterator[Dict[str, Any]]:
+    """
+    Parser del formato prodotto da sse_pack/sse_comment/sse_retry (stream salvati
+    su file, analyze_logs.py). Un dict per blocco: {"id", "event", "data", "retry",
+    "comment"}; `data` è decodificato da JSON quando possibile.
+    """
+    for block in text.replace("\r\n", "\n").split("\n\n"):
+        if not block.strip():
+            continue
+        item: Dict[str, Any] = {"id": None, "event": "message", "data": None, "retry": None, "comment": None}
+        data_lines = []
+        for ln in block.split("\n"):
+            if ln.startswith(":"):
+                item["comment"] = ln[1:].strip()
+                continue
+            field, _, value = ln.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "data":
+                data_lines.append(value)
+            elif field == "id":
+                item["id"] = value
+            elif field == "event":
+                item["event"] = value
+            elif field == "retry" and value.isdigit():
+                item["retry"] = int(value)
+        if data_lines:
+            raw = "\n".join(data_lines)
+            try:
+                item["data"] = json.loads(raw)
+            except ValueError:
+                item["data"] = raw
+        elif item["comment"] is not None or item["retry"] is not None:
+            item["event"] = None
+        yield item
@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# Se = 1 misura il tempo di import di ogni modulo (come `python -X importtime`, ma esposto su /ready)
+STARTUP_PROFILE_IMPORTS = os.getenv("STARTUP_PROFILE_IMPORTS", "0") == "1"
+# Moduli più lenti riportati nel profilo
+STARTUP_PROFILE_TOP = int(os.getenv("STARTUP_PROFILE_TOP", "25"))
+
+
+class _TimedLoader:
+    """Proxy del loader originale: cronometra exec_module (tempo proprio = totale − import annidati)."""
+
+    def __init__(self, loader, profiler: "StartupProfiler"):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        p = self._profiler
+        p._stack.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - t0
+            nested = p._stack.pop()
+            if p._stack:
+                p._stack[-1] += total
+            p.imports[module.__name__] = {"self_ms": round((total - nested) * 1000, 2), "total_ms": round(total * 1000, 2)}
+
+
+class _TimingFinder:
+    """Meta path finder che delega agli altri finder e avvolge il loader trovato."""
+
+    def __init__(self, profiler: "StartupProfiler"):
+        self._profiler = profiler
+        self._resolving = set()
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname in self._resolving:
+            return None
+        self._resolving.add(fullname)
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._resolving.discard(fullname)
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self._profiler)
+        return spec
+
+
+class StartupProfiler:
+    """
+    Tempi di avvio del processo:
+      - passi espliciti (`step`): import dei router/plugin e inizializzazioni del lifespan
+      - opzionale (STARTUP_PROFILE_IMPORTS=1): tempo proprio/totale di ogni modulo importato
+    `ready` diventa True a fine lifespan (endpoint /ready).
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.steps: List[Dict[str, Any]] = []
+        self.imports: Dict[str, Dict[str, float]] = {}
+        self.ready = False
+        self.ready_ms: Optional[float] = None
+        self._stack: List[float] = []
+        self._finder: Optional[_TimingFinder] = None
+
+    def profile_imports(self):
+        if self._finder is None:
+            self._finder = _TimingFinder(self)
+            sys.meta_path.insert(0, self._finder)
+
+    def stop_import_profiling(self):
+        if self._finder is not None and self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+        self._finder = None
+
+    @contextmanager
+    def step(self, name: str, kind: str = "init"):
+        """Cronometra un passo di avvio; un errore viene registrato e rilanciato."""
+        entry = {"name": name, "kind": kind, "ok": True}
+        t0 = time.perf_counter()
+        try:
+            yield entry
+        except Exception as e:
+            entry.update(ok=False, error=str(e))
+            raise
+        finally:
+            entry["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            self.steps.append(entry)
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_ms = round((time.perf_counter() - self.t0) * 1000, 2)
+        self.stop_import_profiling()
+
+    def snapshot(self) -> Dict[str, Any]:
+        slowest = sorted(self.imports.items(), key=lambda kv: kv[1]["self_ms"], reverse=True)[:STARTUP_PROFILE_TOP]
+        return {
+            "ready": self.ready,
+            "ready_ms": self.ready_ms,
+            "steps": self.steps,
+            "imports": [{"module": name, **t} for name, t in slowest] if self.imports else None,
+        }
+
+
+STARTUP = StartupProfiler()
+if STARTUP_PROFILE_IMPORTS:
+    STARTUP.profile_imports()
@@ -0,0 +1,193 @@
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.metrics import REGISTRY
+
+# Per quanto una sessione conclusa resta disponibile per il replay (Last-Event-ID)
+SSE_SESSION_TTL_SEC = float(os.getenv("SSE_SESSION_TTL_SEC", "300"))
+# Sessioni tenute in memoria (le concluse più vecchie escono per prime)
+SSE_SESSION_MAX = int(os.getenv("SSE_SESSION_MAX", "256"))
+# Eventi conservati per sessione (log limitato; oltre si perdono i più vecchi)
+SSE_SESSION_MAX_EVENTS = int(os.getenv("SSE_SESSION_MAX_EVENTS", "256"))
+# Senza client collegati, le pipeline di una sessione restano attive per questi secondi (riconnessione)
+SSE_SESSION_ORPHAN_GRACE_SEC = float(os.getenv("SSE_SESSION_ORPHAN_GRACE_SEC", "15"))
+
+# Solo le sessioni concluse con questo evento restano riprendibili; quelle finite con
+# "error" o cancellate vengono scartate e la richiesta successiva riparte da capo
+COMPLETE_EVENT = "done"
+# Evento sintetico per un subscriber che riprende da prima degli eventi ancora conservati
+GAP_EVENT = "gap"
+
+SSE_SESSIONS = REGISTRY.counter(
+    "singsync_sse_sessions_total", "Sessioni SSE: avviate, agganciate a un'esecuzione in corso o riprese", ("outcome",)
+)
+SSE_REPLAYED_EVENTS = REGISTRY.counter("singsync_sse_replayed_events_total", "Eventi SSE reinviati da replay", ())
+
+Event = Tuple[int, str, Dict[str, Any]]
+
+
+class StreamSession:
+    """
+    Log degli eventi di un'identificazione (una per chiave token + parametri).
+    Il producer pubblica gli eventi; ogni subscriber li riceve dal proprio
+    Last-Event-ID in poi, anche se si collega a esecuzione già iniziata o conclusa.
+    L'id SSE è "<session>:<seq>": un id di un'altra sessione riparte da capo.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.id = uuid.uuid4().hex[:12]
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.complete = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._seq = 0
+        self._events: "deque[Event]" = deque(maxlen=max(1, SSE_SESSION_MAX_EVENTS))
+        self._changed = asyncio.Event()
+        self._orphan: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.id}:{seq}"
+
+    def resume_after(self, last_event_id: Optional[str]) -> int:
+        """Sequenza da cui riprendere (0 = tutto) per un Last-Event-ID."""
+        if not last_event_id:
+            return 0
+        sid, _, seq = last_event_id.rpartition(":")
+        return int(seq) if sid == self.id and seq.isdigit() else 0
+
+    def publish(self, event: str, data: Dict[str, Any]):
+        self._seq += 1
+        self._events.append((self._seq, event, data))
+        if event == COMPLETE_EVENT:
+            self.complete = True
+        self._notify()
+
+    def finish(self):
+        if self.finished_at is None:
+            self.finished_at = time.time()
+            self._cancel_orphan_timer()
+            self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, after: int = 0, heartbeat: Optional[float] = None) -> AsyncIterator[Optional[Event]]:
+        """
+        Eventi con seq > `after`, poi quelli nuovi finché la sessione non si chiude.
+        Genera None ogni `heartbeat` secondi senza eventi (ping). Se gli eventi
+        successivi ad `after` sono già usciti dal log (SSE_SESSION_MAX_EVENTS),
+        prima genera un evento GAP_EVENT {"missed", "after"} con il seq dell'ultimo
+        evento perso: il client sa che il suo stato è incompleto.
+        """
+        self._attach()
+        try:
+            while True:
+                changed = self._changed
+                oldest = self._events[0][0] if self._events else after + 1
+                if oldest > after + 1:
+                    yield oldest - 1, GAP_EVENT, {"missed": oldest - 1 - after, "after": after}
+                    after = oldest - 1
+                for item in [e for e in self._events if e[0] > after]:
+                    after = item[0]
+                    yield item
+                if self.finished:
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._detach()
+
+    def _attach(self):
+        self.subscribers += 1
+        self._cancel_orphan_timer()
+
+    def _detach(self):
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.finished and self.task is not None:
+            loop = asyncio.get_running_loop()
+            self._orphan = loop.call_later(SSE_SESSION_ORPHAN_GRACE_SEC, self.task.cancel)
+
+    def _cancel_orphan_timer(self):
+        if self._orphan is not None:
+            self._orphan.cancel()
+            self._orphan = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "events": self._seq,
+            "subscribers": self.subscribers,
+            "finished": self.finished,
+            "complete": self.complete,
+        }
+
+
+class SessionStore:
+    """
+    Sessioni per chiave (LRU limitata a SSE_SESSION_MAX, TTL dopo la fine).
+    Una richiesta con la stessa chiave si aggancia all'esecuzione in corso
+    o ne rilegge il log invece di rilanciare le pipeline.
+    """
+
+    def __init__(self, max_sessions: int, ttl_sec: float):
+        self.max_sessions = max_sessions
+        self.ttl_sec = ttl_sec
+        self._sessions: "OrderedDict[str, StreamSession]" = OrderedDict()
+
+    def _evict(self):
+        now = time.time()
+        for key, s in list(self._sessions.items()):
+            if s.finished and (now - s.finished_at > self.ttl_sec or not s.complete):
+                del self._sessions[key]
+        for key, s in list(self._sessions.items()):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if s.finished:
+                del self._sessions[key]
+
+    def get(self, key: str) -> Optional[StreamSession]:
+        """Sessione riutilizzabile (in corso o conclusa con done) per la chiave."""
+        self._evict()
+        session = self._sessions.get(key)
+        if session is not None:
+            self._sessions.move_to_end(key)
+        return session
+
+    def start(self, key: str, producer: Callable[[StreamSession], Awaitable[None]]) -> StreamSession:
+        """Nuova sessione con il producer in un task; la sessione si chiude quando il task finisce."""
+        session = StreamSession(key)
+        self._sessions[key] = session
+        self._evict()
+
+        session.task = asyncio.create_task(producer(session))
+        # anche se il task viene cancellato prima di partire
+        session.task.add_done_callback(lambda _: session.finish())
+        SSE_SESSIONS.inc(outcome="started")
+        return session
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "running": sum(1 for s in self._sessions.values() if not s.finished),
+            "subscribers": sum(s.subscribers for s in self._sessions.values()),
+        }
+
+
+STREAM_SESSIONS = SessionStore(SSE_SESSION_MAX, SSE_SESSION_TTL_SEC)
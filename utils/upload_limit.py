@@ -0,0 +1,68 @@
+import json
+from typing import Iterable
+
+
+class BodyTooLarge(Exception):
+    """Body della richiesta oltre il limite (sollevata dal receive limitato)."""
+
+
+class UploadLimitMiddleware:
+    """
+    Middleware ASGI: limita il body delle richieste di upload PRIMA del parsing
+    multipart (che altrimenti salva tutto il body su disco prima dell'handler).
+      - Content-Length dichiarato oltre `max_bytes` → 413 senza leggere il body
+      - body a chunk (anche senza Content-Length) contato durante la lettura:
+        appena supera `max_bytes` la lettura si interrompe e la risposta diventa 413
+    """
+
+    def __init__(self, app, max_bytes: int, paths: Iterable[str]):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = set(paths)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"File troppo grande (max {self.max_bytes} byte)"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                        (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope.get("headers") or []).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        state = {"received": 0, "exceeded": False, "rejected": False}
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > self.max_bytes:
+                    state["exceeded"] = True
+                    raise BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            # il parser può trasformare l'eccezione in un 400: la risposta diventa comunque 413
+            if state["exceeded"]:
+                if not state["rejected"]:
+                    state["rejected"] = True
+                    await self._reject(send)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except BodyTooLarge:
+            if not state["rejected"]:
+                state["rejected"] = True
+                await self._reject(send)
@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from typing import Any, Dict, Optional
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/tmp")
+# memory | sqlite (default, condiviso tra worker sullo stesso host) | redis
+UPLOAD_STORE_BACKEND = os.getenv("UPLOAD_STORE_BACKEND", "sqlite")
+UPLOAD_STORE_SQLITE = os.getenv("UPLOAD_STORE_SQLITE", os.path.join(UPLOAD_DIR, "singsync_uploads.sqlite"))
+UPLOAD_STORE_REDIS_URL = os.getenv("UPLOAD_STORE_REDIS_URL", "")
+UPLOAD_TTL_SEC = float(os.getenv("UPLOAD_TTL_SEC", "3600"))
+UPLOAD_MAX_TOTAL_BYTES = int(os.getenv("UPLOAD_MAX_TOTAL_BYTES", str(1024 * 1024 * 1024)))
+UPLOAD_CLEANUP_SEC = float(os.getenv("UPLOAD_CLEANUP_SEC", "60"))
+# Il TTL di un upload si rinnova all'accesso al più una volta ogni tanti secondi (SQLite: una scrittura)
+UPLOAD_TOUCH_INTERVAL_SEC = float(os.getenv("UPLOAD_TOUCH_INTERVAL_SEC", "60"))
+# Se = 1, con SQLite non disponibile si ripiega sullo store in memoria (token NON condivisi
+# tra worker); altrimenti l'avvio fallisce
+UPLOAD_STORE_MEMORY_FALLBACK = os.getenv("UPLOAD_STORE_MEMORY_FALLBACK", "0") == "1"
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except Exception:
+        pass
+    try:
+        from utils.result_cache import forget_audio_key
+        forget_audio_key(path)
+    except Exception:
+        pass
+
+
+class UploadStore:
+    """
+    Interfaccia dello store upload: token → path del file su disco.
+    Le implementazioni gestiscono TTL (dall'ultimo accesso) e budget in byte.
+    """
+
+    backend = "base"
+
+    def put(self, token: str, path: str, size: int):
+        raise NotImplementedError
+
+    def get(self, token: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def delete(self, token: str):
+        raise NotImplementedError
+
+    def evict(self) -> int:
+        """Rimuove upload scaduti/oltre budget (e i relativi file). Ritorna quanti."""
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class MemoryUploadStore(UploadStore):
+    """Store in memoria (singolo processo)."""
+
+    backend = "memory"
+
+    def __init__(self, ttl_sec: float, max_total_bytes: int):
+        self.ttl_sec = ttl_sec
+        self.max_total_bytes = max_total_bytes
+        self._items: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, token: str, path: str, size: int):
+        with self._lock:
+            self._items[token] = {"path": path, "size": size, "ts": time.time()}
+
+    def get(self, token: str) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(token)
+            if not item:
+                return None
+            if time.time() - item["ts"] > self.ttl_sec or not os.path.exists(item["path"]):
+                self._items.pop(token, None)
+                return None
+            item["ts"] = time.time()
+            return item["path"]
+
+    def delete(self, token: str):
+        with self._lock:
+            item = self._items.pop(token, None)
+        if item:
+            _remove_file(item["path"])
+
+    def evict(self) -> int:
+        now = time.time()
+        removed = []
+        with self._lock:
+            for token, item in list(self._items.items()):
+                if now - item["ts"] > self.ttl_sec:
+                    removed.append(self._items.pop(token))
+            total = sum(i["size"] for i in self._items.values())
+            for token, item in sorted(self._items.items(), key=lambda kv: kv[1]["ts"]):
+                if total <= self.max_total_bytes:
+                    break
+                total -= item["size"]
+                removed.append(self._items.pop(token))
+        for item in removed:
+            _remove_file(item["path"])
+        return len(removed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "items": len(self._items),
+                "bytes": sum(i["size"] for i in self._items.values()),
+            }
+
+
+class SqliteUploadStore(UploadStore):
+    """
+    Indice SQLite sul filesystem locale: condiviso tra i worker Uvicorn
+    dello stesso host (WAL), sostituto locale di Redis. Metodi bloccanti:
+    dall'event loop vanno chiamati via run_io.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, db_path: str, ttl_sec: float, max_total_bytes: int):
+        self.ttl_sec = ttl_sec
+        self.max_total_bytes = max_total_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS uploads (token TEXT PRIMARY KEY, path TEXT, size INTEGER, ts REAL)"
+        )
+        self._db.commit()
+
+    def put(self, token: str, path: str, size: int):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO uploads (token, path, size, ts) VALUES (?, ?, ?, ?)",
+                (token, path, size, time.time()),
+            )
+            self._db.commit()
+
+    def get(self, token: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT path, ts FROM uploads WHERE token = ?", (token,)).fetchone()
+            if not row:
+                return None
+            if now - row[1] > self.ttl_sec or not os.path.exists(row[0]):
+                self._db.execute("DELETE FROM uploads WHERE token = ?", (token,))
+                self._db.commit()
+                return None
+            # rinnovo del TTL limitato: la maggior parte delle letture non scrive
+            if now - row[1] >= UPLOAD_TOUCH_INTERVAL_SEC:
+                self._db.execute("UPDATE uploads SET ts = ? WHERE token = ?", (now, token))
+                self._db.commit()
+            return row[0]
+
+    def delete(self, token: str):
+        with self._lock:
+            row = self._db.execute("SELECT path FROM uploads WHERE token = ?", (token,)).fetchone()
+            self._db.execute("DELETE FROM uploads WHERE token = ?", (token,))
+            self._db.commit()
+        if row:
+            _remove_file(row[0])
+
+    def evict(self) -> int:
+        now = time.time()
+        with self._lock:
+            removed = self._db.execute(
+                "SELECT token, path FROM uploads WHERE ts < ?", (now - self.ttl_sec,)
+            ).fetchall()
+            total = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM uploads WHERE ts >= ?", (now - self.ttl_sec,)
+            ).fetchone()[0]
+            if total > self.max_total_bytes:
+                for token, path, size in self._db.execute(
+                    "SELECT token, path, size FROM uploads WHERE ts >= ? ORDER BY ts ASC", (now - self.ttl_sec,)
+                ).fetchall():
+                    if total <= self.max_total_bytes:
+                        break
+                    total -= size
+                    removed.append((token, path))
+            self._db.executemany("DELETE FROM uploads WHERE token = ?", [(t,) for t, _ in removed])
+            self._db.commit()
+        for _, path in removed:
+            _remove_file(path)
+        return len(removed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            items, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM uploads").fetchone()
+        return {"backend": self.backend, "items": items, "bytes": total}
+
+
+class RedisUploadStore(UploadStore):
+    """
+    Indice su Redis (TTL nativo con EXPIRE). I file restano sul disco locale:
+    per più host serve UPLOAD_DIR condiviso. Il budget in byte non è applicato.
+    """
+
+    backend = "redis"
+    PREFIX = "singsync:upload:"
+
+    def __init__(self, url: str, ttl_sec: float):
+        import redis  # opzionale
+
+        self.ttl_sec = int(ttl_sec)
+        self._r = redis.Redis.from_url(url)
+        # from_url non si connette: senza ping un REDIS_URL errato emergerebbe solo come 500 sulle richieste
+        self._r.ping()
+
+    def put(self, token: str, path: str, size: int):
+        self._r.set(self.PREFIX + token, json.dumps({"path": path, "size": size}), ex=self.ttl_sec)
+
+    def get(self, token: str) -> Optional[str]:
+        raw = self._r.get(self.PREFIX + token)
+        if not raw:
+            return None
+        path = json.loads(raw)["path"]
+        if not os.path.exists(path):
+            return None
+        self._r.expire(self.PREFIX + token, self.ttl_sec)
+        return path
+
+    def delete(self, token: str):
+        path = self.get(token)
+        self._r.delete(self.PREFIX + token)
+        if path:
+            _remove_file(path)
+
+    def evict(self) -> int:
+        # file orfani: nessuna chiave Redis ancora viva che li referenzi
+        live = set()
+        for key in self._r.scan_iter(self.PREFIX + "*"):
+            raw = self._r.get(key)
+            if raw:
+                live.add(json.loads(raw)["path"])
+        removed = 0
+        now = time.time()
+        for name in os.listdir(UPLOAD_DIR):
+            path = os.path.join(UPLOAD_DIR, name)
+            if name.startswith("up_") and path not in live and now - os.path.getmtime(path) > self.ttl_sec:
+                _remove_file(path)
+                removed += 1
+        return removed
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "items": sum(1 for _ in self._r.scan_iter(self.PREFIX + "*"))}
+
+
+def _make_store() -> UploadStore:
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    if UPLOAD_STORE_BACKEND == "redis" and UPLOAD_STORE_REDIS_URL:
+        try:
+            return RedisUploadStore(UPLOAD_STORE_REDIS_URL, UPLOAD_TTL_SEC)
+        except Exception as e:
+            print(f"⚠️  Redis non disponibile ({e}), uso lo store SQLite locale")
+    if UPLOAD_STORE_BACKEND in ("sqlite", "redis"):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(UPLOAD_STORE_SQLITE)), exist_ok=True)
+            return SqliteUploadStore(UPLOAD_STORE_SQLITE, UPLOAD_TTL_SEC, UPLOAD_MAX_TOTAL_BYTES)
+        except Exception as e:
+            if not UPLOAD_STORE_MEMORY_FALLBACK:
+                raise RuntimeError(
+                    f"Store upload SQLite non disponibile ({UPLOAD_STORE_SQLITE}): {e}. "
+                    "Imposta UPLOAD_STORE_MEMORY_FALLBACK=1 per usare lo store in memoria (un solo worker)."
+                ) from e
+            print(f"❌ SQLite non disponibile ({e}): store in memoria, i token NON sono condivisi tra worker")
+    return MemoryUploadStore(UPLOAD_TTL_SEC, UPLOAD_MAX_TOTAL_BYTES)
+
+
+UPLOAD_STORE = _make_store()
+
+
+async def cleanup_loop(store: UploadStore = UPLOAD_STORE, interval_sec: float = UPLOAD_CLEANUP_SEC):
+    """Task di background (lifespan): eviction periodica di upload e file temporanei."""
+    while True:
+        try:
+            await asyncio.to_thread(store.evict)
+        except Exception as e:
+            print(f"⚠️  Pulizia upload fallita: {e}")
+        await asyncio.sleep(interval_sec)